@@ -0,0 +1,99 @@
+#! /usr/bin/env python3
+"""Compare blocking hub calls inside coroutines against AsyncKojiSession.
+
+A local XML-RPC server answers every call after a fixed delay to simulate a
+slow hub. Each simulated package makes a few sequential queries, as
+Rebuild.rebuild_package does, with max_tasks packages in flight at once.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import socketserver
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+import click
+import koji
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from koji_rebuild.session import AsyncKojiSession  # noqa: E402
+
+
+class ThreadedXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+def slow_hub(latency: float):
+    class Handler(SimpleXMLRPCRequestHandler):
+        rpc_paths = ("/kojihub",)
+
+    server = ThreadedXMLRPCServer(
+        ("127.0.0.1", 0), Handler, logRequests=False, allow_none=True
+    )
+
+    def dispatch(method, params):
+        time.sleep(latency)
+        return [[], []]
+
+    server._dispatch = dispatch
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d/kojihub" % server.server_address[1]
+
+
+async def run_blocking(session, packages: int, calls: int, max_tasks: int):
+    sem = asyncio.Semaphore(max_tasks)
+
+    async def package(pkg):
+        async with sem:
+            for _ in range(calls):
+                session.getLatestRPMS(tag="f40", package=pkg)
+                await asyncio.sleep(0)
+
+    await asyncio.gather(*(package(f"pkg{i}") for i in range(packages)))
+
+
+async def run_async(asession, packages: int, calls: int, max_tasks: int):
+    sem = asyncio.Semaphore(max_tasks)
+
+    async def package(pkg):
+        async with sem:
+            for _ in range(calls):
+                await asession.getLatestRPMS(tag="f40", package=pkg)
+
+    await asyncio.gather(*(package(f"pkg{i}") for i in range(packages)))
+
+
+@click.command()
+@click.option("--packages", default=64, help="Number of simulated packages")
+@click.option("--calls", default=4, help="Hub calls per package")
+@click.option("--latency", default=0.05, help="Simulated hub latency in seconds")
+@click.option("--max-tasks", default=16, help="Packages in flight")
+@click.option("--workers", default=16, help="AsyncKojiSession thread pool size")
+def main(packages, calls, latency, max_tasks, workers):
+    server, url = slow_hub(latency)
+
+    session = koji.ClientSession(url)
+    start = time.perf_counter()
+    asyncio.run(run_blocking(session, packages, calls, max_tasks))
+    blocking = time.perf_counter() - start
+
+    asession = AsyncKojiSession(koji.ClientSession(url), workers)
+    start = time.perf_counter()
+    asyncio.run(run_async(asession, packages, calls, max_tasks))
+    facade = time.perf_counter() - start
+    asession.shutdown()
+
+    server.shutdown()
+
+    total = packages * calls
+    print(f"{total} calls, {latency * 1000:.0f} ms simulated latency")
+    print(f"blocking calls in coroutines : {blocking:7.2f} s")
+    print(f"AsyncKojiSession ({workers:3d} threads): {facade:7.2f} s")
+    print(f"speedup                      : {blocking / facade:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+"""Measure how TaskDispatcher keeps builds flowing at different windows.
+
+Runs the real dispatcher, worker pool and window resizing included,
+against the simulated hubs of bench_rebuild.py, with builds that finish as
+soon as they are polled and a hub without added latency. What is left is
+the cost of dispatching a package: queueing it, submitting its build,
+watching the task and releasing its dependents. Each window runs in a
+fresh process; the report shows wall time and hub requests per package.
+"""
+
+import os
+import sys
+import json
+import multiprocessing
+
+import click
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+# bench_rebuild and simhub live next to this script, koji_rebuild in the repository root
+sys.path[:0] = [BENCHMARKS, os.path.dirname(BENCHMARKS)]
+
+from bench_rebuild import run, wait  # noqa: E402
+
+
+@click.command()
+@click.option("--packages", default=2000, help="Packages in the buildlist")
+@click.option("--windows", default="8,64,256", help="Comma separated builds in flight")
+@click.option("--duration", default=600.0, help="Mean build duration in simulated seconds")
+@click.option("--time-scale", default=0.0, help="Wall seconds per simulated second, 0 finishes builds at once")
+@click.option("--dependency-order", is_flag=True, help="Respect BuildRequires between packages")
+@click.option("--adaptive", is_flag=True, help="Resize the window from host capacity, starting at each window")
+@click.option("--timeout", default=3600.0, help="Seconds a run may take before it is stopped")
+@click.option("--json", "as_json", is_flag=True, help="Print results as JSON lines")
+def main(packages, windows, duration, time_scale, dependency_order, adaptive, timeout, as_json):
+    ctx = multiprocessing.get_context("fork")
+    for window in [int(n) for n in windows.split(",")]:
+        opts = {
+            "max_tasks": window,
+            "hosts": window,
+            "latency": 0.0,
+            "duration": duration,
+            "time_scale": time_scale,
+            "failure_rate": 0.0,
+            "prebuilt": 0.0,
+            "fasttrack": False,
+            "rpm_size": 0,
+            "dependency_order": dependency_order,
+            "priority": "buildlist",
+            "adaptive": adaptive,
+        }
+        results = ctx.Queue()
+        proc = ctx.Process(target=run, args=(packages, opts, results))
+        proc.start()
+        res = wait(proc, results, timeout)
+        if res is None:
+            if proc.exitcode is None:
+                proc.terminate()
+                proc.join()
+                raise click.ClickException(f"Window {window} took over {timeout:.0f} s")
+            raise click.ClickException(f"Window {window} exited with code {proc.exitcode}")
+        proc.join()
+
+        res["window"] = window
+        if as_json:
+            print(json.dumps(res))
+            continue
+        print(
+            f"window {window:>4}: {res['seconds']:7.2f} s"
+            f"  {res['seconds'] / packages * 1e3:7.2f} ms/package"
+            f"  {res['requests'] / packages:5.1f} requests/package"
+            f"  ({res['completed']} completed, {res['failed']} failed)"
+        )
+
+
+if __name__ == "__main__":
+    main()
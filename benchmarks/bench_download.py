@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+"""Measure Downloader throughput against a local stand-in for topurl.
+
+Serves generated files over HTTP from a temporary directory and fetches them
+once the way retrieveRPMs used to (a new session per file, 1 KiB reads, one
+file at a time) and once with Downloader. With --flaky the server cuts every
+other response short, to exercise Range resume and retries.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+
+import click
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from koji_rebuild.download import Downloader  # noqa: E402
+
+
+def make_files(root: str, packages: int, files: int, size: int) -> list:
+    paths = list()
+    for p in range(packages):
+        pkgdir = os.path.join(root, "pkg%d" % p)
+        os.makedirs(pkgdir)
+        for f in range(files):
+            name = "pkg%d-sub%d-1.0-1.noarch.rpm" % (p, f)
+            with open(os.path.join(pkgdir, name), "wb") as fd:
+                fd.write(os.urandom(size))
+            paths.append("pkg%d/%s" % (p, name))
+    return paths
+
+
+async def serve(root: str, flaky: bool):
+    hits = {"count": 0}
+
+    async def handler(request: web.Request):
+        path = os.path.join(root, request.match_info["path"])
+        hits["count"] += 1
+        if flaky and hits["count"] % 2 and "Range" not in request.headers:
+            # Send half of the file and drop the connection
+            with open(path, "rb") as f:
+                data = f.read()
+            response = web.StreamResponse(headers={"Content-Length": str(len(data))})
+            await response.prepare(request)
+            await response.write(data[: len(data) // 2])
+            request.transport.close()  # type: ignore
+            return response
+        return web.FileResponse(path)
+
+    app = web.Application()
+    app.router.add_get("/packages/{path:.+}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore
+    return runner, "http://127.0.0.1:%d/packages" % port
+
+
+async def baseline(topurl: str, paths: list, dest: str):
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=5, sock_connect=5)
+    for path in paths:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get("/".join([topurl, path])) as response:
+                with open(os.path.join(dest, os.path.basename(path)), "wb") as f:
+                    while True:
+                        chunk = await response.content.read(1024)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+
+
+async def run(packages, files, size, workers, chunk_size, flaky):
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "srv")
+        paths = make_files(root, packages, files, size)
+        total = len(paths) * size / 1048576
+        runner, topurl = await serve(root, flaky)
+
+        if not flaky:
+            dest = os.path.join(tmp, "baseline")
+            os.makedirs(dest)
+            start = time.perf_counter()
+            await baseline(topurl, paths, dest)
+            elapsed = time.perf_counter() - start
+            print(f"sequential, 1 KiB reads : {elapsed:6.2f} s  {total / elapsed:8.1f} MiB/s")
+
+        dest = os.path.join(tmp, "pooled")
+        os.makedirs(dest)
+        downloader = Downloader(workers=workers, chunk_size=chunk_size, backoff=0.05)
+        jobs = [
+            ("/".join([topurl, p]), os.path.join(dest, os.path.basename(p)), size)
+            for p in paths
+        ]
+        start = time.perf_counter()
+        ok = all(await asyncio.gather(*(downloader.fetch(*job) for job in jobs)))
+        elapsed = time.perf_counter() - start
+        await downloader.close()
+        ok = ok and all(
+            open(os.path.join(root, p), "rb").read()
+            == open(os.path.join(dest, os.path.basename(p)), "rb").read()
+            for p in paths
+        )
+        print(
+            f"Downloader ({workers} workers)  : {elapsed:6.2f} s  {total / elapsed:8.1f} MiB/s"
+            f"  {'ok' if ok else 'FAILED'}"
+        )
+
+        await runner.cleanup()
+
+
+@click.command()
+@click.option("--packages", default=10, help="Number of packages")
+@click.option("--files", default=8, help="RPMs per package")
+@click.option("--size", default=2097152, help="Bytes per RPM")
+@click.option("--workers", default=8, help="Concurrent transfers")
+@click.option("--chunk-size", default=1048576, help="Bytes per read")
+@click.option("--flaky", is_flag=True, help="Cut every other response short")
+def main(packages, files, size, workers, chunk_size, flaky):
+    logging.getLogger("download").setLevel(logging.ERROR)
+    asyncio.run(run(packages, files, size, workers, chunk_size, flaky))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#! /usr/bin/env python3
+"""Run TaskDispatcher end to end against simulated hubs.
+
+Each buildlist size runs in its own process with a fresh upstream and
+downstream SimulatedHub and, for fasttrack imports, a PackageServer. The
+report shows wall time, packages per hour of wall time and of simulated
+build time, hub calls per package and peak resident memory. Peak memory
+includes the simulated hubs, which run in the same process.
+"""
+
+import os
+import sys
+import time
+import json
+import queue
+import asyncio
+import logging
+import resource
+import tempfile
+import multiprocessing
+
+import click
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+# simhub lives next to this script, koji_rebuild in the repository root
+sys.path[:0] = [BENCHMARKS, os.path.dirname(BENCHMARKS)]
+
+from simhub import Catalog, SimulatedHub, PackageServer, serve_hub  # noqa: E402
+
+
+def settings(tmp: str, up_url: str, down_url: str, topurl: str, opts: dict) -> dict:
+    for name, url in (("upstream", up_url), ("downstream", down_url)):
+        with open(os.path.join(tmp, name + ".conf"), "w") as f:
+            f.write(f"[{name}]\nserver = {url}\nweburl = http://127.0.0.1/koji\n")
+
+    instance = {"tag": "f40", "target": "f40"}
+    return {
+        "instance": {
+            "upstream": dict(instance, kojiconf=os.path.join(tmp, "upstream.conf")),
+            "downstream": dict(instance, kojiconf=os.path.join(tmp, "downstream.conf")),
+        },
+        "package_builds": {
+            "max_tasks": opts["max_tasks"],
+            "adaptive_tasks": opts["adaptive"],
+            "min_tasks": 2,
+            "max_tasks_limit": opts["hosts"] * 2,
+            "adapt_interval": 1,
+            "buildlist": os.path.join(tmp, "build.list"),
+            "ignorelist": os.path.join(tmp, "ignore.list"),
+            "fasttrack": opts["fasttrack"],
+            "dependency_order": opts["dependency_order"],
+            "priority": opts["priority"],
+            "topurl": topurl,
+            "download_dir": os.path.join(tmp, "rpms"),
+            "prefetch_batch": 500,
+            "download_workers": 8,
+            "download_chunk_size": 1048576,
+            "download_retries": 2,
+            "rpm_cache_size": 0,
+            "upload_workers": 4,
+            "upload_blocksize": 1048576,
+            "cache_ttl": 0,
+            "rpc_workers": 16,
+            "reuse_sessions": False,
+            "poll_interval_min": 0.05,
+            "poll_interval_max": 1,
+            "metrics_interval": 3600,
+        },
+        "logging": {
+            "application": os.path.join(tmp, "kojibuild.log"),
+            "completed": os.path.join(tmp, "completed.list"),
+            "failed": os.path.join(tmp, "failed.list"),
+            "journal": os.path.join(tmp, "kojibuild.journal"),
+            "metrics": os.path.join(tmp, "kojibuild.prom"),
+            "metrics_summary": os.path.join(tmp, "kojibuild.metrics.json"),
+            "trace": "",
+        },
+        "notifications": {"alert": "off", "trigger": "fail"},
+    }
+
+
+def run(count: int, opts: dict, results: multiprocessing.Queue):
+    from koji_rebuild.configuration import Configuration
+    from koji_rebuild.session import KojiSession
+    from koji_rebuild.dispatcher import TaskDispatcher
+
+    catalog = Catalog(count, duration=opts["duration"], rpm_size=opts["rpm_size"])
+    hub_opts = dict(
+        latency=opts["latency"],
+        hosts=opts["hosts"],
+        time_scale=opts["time_scale"],
+        failure_rate=opts["failure_rate"],
+    )
+    upstream_hub = SimulatedHub(catalog, **hub_opts)
+    downstream_hub = SimulatedHub(catalog, downstream=True, prebuilt=opts["prebuilt"], **hub_opts)
+    _, up_url = serve_hub(upstream_hub)
+    _, down_url = serve_hub(downstream_hub)
+    packages = PackageServer(opts["rpm_size"])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Configuration()
+        config._settings = settings(tmp, up_url, down_url, packages.url, opts)
+        logging.basicConfig(filename=os.path.join(tmp, "kojibuild.log"), level=logging.WARNING)
+
+        upstream = KojiSession("upstream")
+        downstream = KojiSession("downstream")
+        downstream.setSession(downstream_hub.session_info())
+        downstream.user = downstream.getLoggedInUser()
+
+        start = time.perf_counter()
+        asyncio.run(TaskDispatcher(upstream, downstream, list(catalog.packages), resume=False).start())
+        elapsed = time.perf_counter() - start
+
+        with open(os.path.join(tmp, "completed.list")) as f:
+            completed = len(f.read().split())
+        with open(os.path.join(tmp, "failed.list")) as f:
+            failed = len(f.read().split())
+
+    calls = upstream_hub.calls + downstream_hub.calls
+    results.put(
+        {
+            "packages": count,
+            "completed": completed,
+            "failed": failed,
+            "seconds": elapsed,
+            "per_hour": count / elapsed * 3600,
+            # Builds take no wall time at a time scale of 0
+            "simulated_per_hour": count / elapsed * 3600 / opts["time_scale"] if opts["time_scale"] else None,
+            "requests": upstream_hub.requests + downstream_hub.requests,
+            "calls": dict(calls.most_common()),
+            "rpm_requests": packages.requests,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    )
+
+
+def wait(proc, results: multiprocessing.Queue, timeout: float):
+    """Result of the run in proc, None if it exits without one or takes
+    longer than timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if proc.exitcode is not None:
+                break
+    try:
+        # A result put just before the run exited may still be in flight
+        return results.get(timeout=1)
+    except queue.Empty:
+        return None
+
+
+@click.command()
+@click.option("--packages", default="1000,5000", help="Comma separated buildlist sizes")
+@click.option("--max-tasks", default=64, help="Builds in flight")
+@click.option("--hosts", default=64, help="Simulated build hosts")
+@click.option("--latency", default=0.002, help="Hub latency per request in seconds")
+@click.option("--duration", default=600.0, help="Mean build duration in simulated seconds")
+@click.option("--time-scale", default=0.0001, help="Wall seconds per simulated second")
+@click.option("--failure-rate", default=0.02, help="Share of builds that fail")
+@click.option("--prebuilt", default=0.2, help="Share of packages already built downstream")
+@click.option("--fasttrack", is_flag=True, help="Import noarch packages instead of building")
+@click.option("--rpm-size", default=65536, help="Bytes per RPM served to fasttrack")
+@click.option("--dependency-order", is_flag=True, help="Respect BuildRequires between packages")
+@click.option("--priority", default="buildlist", type=click.Choice(["buildlist", "duration"]))
+@click.option("--adaptive", is_flag=True, help="Resize the window from host capacity")
+@click.option("--timeout", default=3600.0, help="Seconds a run may take before it is stopped")
+@click.option("--json", "as_json", is_flag=True, help="Print results as JSON lines")
+def main(packages, timeout, as_json, **opts):
+    ctx = multiprocessing.get_context("fork")
+    for count in [int(n) for n in packages.split(",")]:
+        results = ctx.Queue()
+        proc = ctx.Process(target=run, args=(count, opts, results))
+        proc.start()
+        res = wait(proc, results, timeout)
+        if res is None:
+            if proc.exitcode is None:
+                proc.terminate()
+                proc.join()
+                raise click.ClickException(f"Run of {count} packages took over {timeout:.0f} s")
+            raise click.ClickException(f"Run of {count} packages exited with code {proc.exitcode}")
+        proc.join()
+
+        if as_json:
+            print(json.dumps(res))
+            continue
+        simulated = res["simulated_per_hour"]
+        print(
+            f"{res['packages']:>6} packages: {res['seconds']:7.1f} s"
+            f"  {res['per_hour']:>10.0f} pkg/h wall"
+            f"  {simulated if simulated is not None else float('nan'):>7.0f} pkg/h simulated"
+            f"  {res['requests'] / res['packages']:5.1f} requests/pkg"
+            f"  {res['peak_rss_mb']:6.0f} MiB peak"
+            f"  ({res['completed']} completed, {res['failed']} failed)"
+        )
+        top = ", ".join(f"{m} {n}" for m, n in list(res["calls"].items())[:8])
+        print(f"        top calls: {top}")
+
+
+if __name__ == "__main__":
+    main()
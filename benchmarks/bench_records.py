@@ -0,0 +1,132 @@
+#! /usr/bin/env python3
+"""Compare nestedseek walks of raw getLatestRPMS responses with LatestRPMs.
+
+A synthetic tag is made of getLatestRPMS responses with the fields the hub
+returns. For every package the lookups of one rebuild are made: build id,
+NVR, noarch check and the RPM file list. nestedseek walks the raw
+response for each of them, the records are parsed once and then read.
+The report shows the time per package of both, parsing included, and the
+memory a snapshot of the tag holds with raw responses and with records.
+"""
+
+import gc
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from koji_rebuild.util import nestedseek  # noqa: E402
+from koji_rebuild.records import LatestRPMs  # noqa: E402
+
+ARCHES = ["x86_64", "aarch64", "ppc64le", "s390x", "i686"]
+
+
+def response(i: int, rpms: int, noarch: bool) -> list:
+    """getLatestRPMS response of package i with rpms binary RPMs per arch"""
+    name = "pkg%06d" % i
+    version, release = "%d.%d" % (i % 7, i % 13), "%d.fc40" % (i % 5 + 1)
+    build = {
+        "build_id": i, "id": i, "name": name, "package_name": name, "package_id": i,
+        "version": version, "release": release, "epoch": None, "state": 1,
+        "nvr": f"{name}-{version}-{release}", "owner_id": 1, "owner_name": "builder",
+        "task_id": i * 10, "volume_id": 0, "volume_name": "DEFAULT",
+        "creation_event_id": i, "creation_ts": 1700000000.0 + i,
+        "tag_id": 1, "tag_name": "f40", "draft": False,
+    }  # fmt: skip
+    files = list()
+    arches = ["noarch"] if noarch else ARCHES
+    for arch in ["src"] + arches:
+        for n in range(1 if arch == "src" else rpms):
+            files.append(
+                {
+                    "id": i * 1000 + len(files), "build_id": i, "buildroot_id": i,
+                    "name": name if n == 0 else f"{name}-sub{n}",
+                    "version": version, "release": release, "epoch": None, "arch": arch,
+                    "size": random.randint(10000, 10000000), "payloadhash": "%032x" % random.getrandbits(128),
+                    "buildtime": 1700000000 + i, "external_repo_id": 0,
+                    "external_repo_name": "INTERNAL", "metadata_only": False, "extra": None,
+                    "tag_id": 1, "tag_name": "f40",
+                }
+            )  # fmt: skip
+    return [files, [build]]
+
+
+def raw_lookups(res: list, topurl: str):
+    build_id = list(nestedseek(res, "build_id"))[0]
+    nvr = list(nestedseek(res, "nvr"))[0]
+    noarch = all(str(a) in ["src", "noarch"] for a in nestedseek(res, "arch"))
+    files = list()
+    fields = [nestedseek(res, k) for k in ("name", "version", "release", "arch", "size", "payloadhash")]
+    for n, v, r, a, sz, h in zip(*fields):
+        files.append(("/".join([topurl, v, r, a, "%s-%s-%s.%s.rpm" % (n, v, r, a)]), sz, h))
+    return build_id, nvr, noarch, files
+
+
+def record_lookups(res: LatestRPMs, topurl: str):
+    files = [
+        ("/".join([topurl, rpm.version, rpm.release, rpm.arch, rpm.filename]), rpm.size, rpm.payloadhash)
+        for rpm in res.rpms
+    ]  # fmt: skip
+    return res.build_id, res.nvr, res.noarch, files
+
+
+def held(make) -> tuple:
+    """Objects returned by make and the bytes they hold"""
+    gc.collect()
+    tracemalloc.start()
+    objs = make()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objs, size
+
+
+@click.command()
+@click.option("--packages", default=5000, help="Packages in the tag")
+@click.option("--rpms", default=4, help="Binary RPMs per arch of an arch specific package")
+@click.option("--noarch", default=0.3, help="Share of noarch packages")
+def main(packages, rpms, noarch):
+    topurl = "https://kojipkgs.example.org/packages"
+
+    def tag(parse=lambda res: res):
+        random.seed(0)
+        return [parse(response(i, rpms, random.random() < noarch)) for i in range(packages)]
+
+    # Responses are dropped as they are parsed, the records hold their own strings
+    raw, raw_bytes = held(tag)
+    _, rec_bytes = held(lambda: tag(LatestRPMs.from_response))
+    total = sum(len(r[0]) for r in raw)
+
+    start = time.perf_counter()
+    for res in raw:
+        raw_lookups(res, topurl)
+    seek = time.perf_counter() - start
+
+    start = time.perf_counter()
+    records = [LatestRPMs.from_response(res) for res in raw]
+    parse = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for res in records:
+        record_lookups(res, topurl)
+    read = time.perf_counter() - start
+
+    for a, b in zip(raw[:50], records[:50]):
+        assert raw_lookups(a, topurl) == record_lookups(b, topurl)
+
+    per = 1e6 / packages
+    print(f"{packages} packages, {total} RPMs")
+    print(f"  nestedseek       {seek * per:8.1f} us/pkg")
+    print(f"  records parse    {parse * per:8.1f} us/pkg")
+    print(f"  records lookups  {read * per:8.1f} us/pkg")
+    print(f"  records total    {(parse + read) * per:8.1f} us/pkg  ({seek / (parse + read):.1f}x)")
+    print(f"  raw responses    {raw_bytes / 2**20:8.1f} MiB  ({raw_bytes / total:.0f} B/RPM)")
+    print(f"  records          {rec_bytes / 2**20:8.1f} MiB  ({rec_bytes / total:.0f} B/RPM)")
+
+
+if __name__ == "__main__":
+    main()
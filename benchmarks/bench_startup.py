@@ -0,0 +1,107 @@
+#! /usr/bin/env python3
+"""Measure how long koji-rebuild takes to start.
+
+Each run imports a module in a fresh interpreter under -X importtime and
+reports the total import time along with the modules that take longest,
+by their cumulative time (the module and everything it imports) and by
+their self time. Wall time of `koji-rebuild --help` is reported too, as
+that is what a user waits for before anything is done.
+
+Times are the median over --runs interpreters, the first one warms the
+bytecode cache and is not counted.
+"""
+
+import os
+import sys
+import time
+import json
+import statistics
+import subprocess
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def env() -> dict:
+    path = os.environ.get("PYTHONPATH")
+    return dict(os.environ, PYTHONPATH=ROOT + (os.pathsep + path if path else ""))
+
+
+def importtime(module: str) -> dict:
+    """Self and cumulative import time in microseconds of every module
+    imported by a fresh interpreter importing module"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def help_time() -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "from koji_rebuild.main import main; main(['--help'])"],
+        env=env(),
+        capture_output=True,
+        check=False,
+    )
+    return time.perf_counter() - start
+
+
+def median(runs: list[dict], name: str, index: int) -> float:
+    return statistics.median(r[name][index] if name in r else 0 for r in runs) / 1000
+
+
+@click.command()
+@click.option("--module", default="koji_rebuild.main", show_default=True, help="Module to import")
+@click.option("--runs", default=5, show_default=True, help="Interpreters to start")
+@click.option("--top", default=15, show_default=True, help="Modules to list")
+@click.option("--json", "as_json", is_flag=True, help="Print results as JSON")
+def main(module, runs, top, as_json):
+    importtime(module)
+    samples = [importtime(module) for _ in range(runs)]
+    helps = [help_time() for _ in range(runs)]
+
+    names = set().union(*samples)
+    cumulative = sorted(names, key=lambda n: median(samples, n, 1), reverse=True)[:top]
+    own = sorted(names, key=lambda n: median(samples, n, 0), reverse=True)[:top]
+    total = median(samples, module, 1)
+    wall = statistics.median(helps) * 1000
+
+    if as_json:
+        print(
+            json.dumps(
+                {
+                    "module": module,
+                    "import_ms": total,
+                    "help_ms": wall,
+                    "modules": len(names),
+                    "cumulative_ms": {n: median(samples, n, 1) for n in cumulative},
+                    "self_ms": {n: median(samples, n, 0) for n in own},
+                }
+            )
+        )
+        return
+
+    print(f"import {module}: {total:7.1f} ms, {len(names)} modules")
+    print(f"koji-rebuild --help: {wall:7.1f} ms wall")
+    print("\nslowest by cumulative time:")
+    for name in cumulative:
+        print(f"  {median(samples, name, 1):7.1f} ms  {name}")
+    print("\nslowest by self time:")
+    for name in own:
+        print(f"  {median(samples, name, 0):7.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
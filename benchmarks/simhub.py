@@ -0,0 +1,427 @@
+"""Simulated Koji hub and package server for offline benchmarks.
+
+SimulatedHub answers the XML-RPC calls koji-rebuild makes for a synthetic
+catalog of packages. Run one instance as the upstream hub and another as
+the downstream hub. Hub latency, build durations, build host capacity and
+failure rates are configurable. Build tasks queue for a free host and run
+in simulated time, scaled down to wall-clock time by time_scale.
+
+PackageServer stands in for topurl. It serves generated RPM payloads of
+the size the catalog reports, with Range support.
+"""
+
+import heapq
+import random
+import threading
+import collections
+import socketserver
+import time
+import http.server
+from xmlrpc.client import Fault
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+import koji
+
+TAG = "f40"
+FAULT = 1000  # koji.GenericError
+
+
+class Catalog:
+    """Synthetic package set shared by the upstream and downstream hubs"""
+
+    def __init__(
+        self,
+        count: int,
+        noarch: float = 0.3,
+        deps: int = 2,
+        duration: float = 600,
+        rpm_size: int = 65536,
+        seed: int = 0,
+    ) -> None:
+        """
+        :param count: int - Number of packages
+        :param noarch: float - Share of packages with only noarch RPMs
+        :param deps: int - BuildRequires per package on earlier packages, at most
+        :param duration: float - Mean upstream build duration in simulated seconds
+        :param rpm_size: int - Size of every RPM in bytes
+        :param seed: int - Random seed, the same seed gives the same catalog
+        """
+        rng = random.Random(seed)
+        self.rpm_size = rpm_size
+        self.packages = ["pkg%06d" % i for i in range(count)]
+        self.info = dict()
+        for i, name in enumerate(self.packages):
+            earlier = self.packages[max(0, i - 200) : i]
+            self.info[name] = {
+                "build_id": i + 1,
+                "version": "1.0",
+                "release": "1.fc40",
+                "nvr": "%s-1.0-1.fc40" % name,
+                "arch": "noarch" if rng.random() < noarch else "x86_64",
+                "requires": rng.sample(earlier, min(len(earlier), rng.randint(0, deps))),
+                "duration": rng.expovariate(1 / duration),
+            }
+        self.by_id = {info["build_id"]: name for name, info in self.info.items()}
+
+    def build(self, name: str, state: int = koji.BUILD_STATES["COMPLETE"]) -> dict:
+        info = self.info[name]
+        return {
+            "id": info["build_id"],
+            "build_id": info["build_id"],
+            "package_name": name,
+            "name": name,
+            "version": info["version"],
+            "release": info["release"],
+            "nvr": info["nvr"],
+            "state": state,
+            "source": "git+https://src.example.org/rpms/%s.git#%040x" % (name, info["build_id"]),
+            "start_ts": 1700000000.0,
+            "completion_ts": 1700000000.0 + info["duration"],
+        }
+
+    def rpms(self, name: str) -> list:
+        info = self.info[name]
+        rpms = list()
+        for n, arch in enumerate(["src", info["arch"]]):
+            rpms.append(
+                {
+                    "id": info["build_id"] * 10 + n,
+                    "build_id": info["build_id"],
+                    "name": name,
+                    "version": info["version"],
+                    "release": info["release"],
+                    "arch": arch,
+                    "nvr": info["nvr"],
+                    "size": self.rpm_size,
+                    "payloadhash": "%032x" % (info["build_id"] * 10 + n),
+                }
+            )
+        return rpms
+
+
+class _Task:
+    __slots__ = ("id", "pkg", "start", "end", "failed")
+
+    def __init__(self, task_id: int, pkg: str, start: float, end: float, failed: bool) -> None:
+        self.id = task_id
+        self.pkg = pkg
+        self.start = start
+        self.end = end
+        self.failed = failed
+
+
+class SimulatedHub:
+    """XML-RPC hub over a Catalog, upstream or downstream role.
+
+    The upstream hub has every catalog package tagged. The downstream hub
+    starts with a prebuilt share of them and gains builds as tasks complete
+    and RPMs are imported.
+    """
+
+    def __init__(
+        self,
+        catalog: Catalog,
+        downstream: bool = False,
+        latency: float = 0.002,
+        call_cost: float = 0.0002,
+        hosts: int = 32,
+        time_scale: float = 0.0001,
+        failure_rate: float = 0.0,
+        prebuilt: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        """
+        :param catalog: Catalog - Packages known to the hub
+        :param downstream: bool - Act as the downstream hub
+        :param latency: float - Seconds added to every request
+        :param call_cost: float - Seconds added per call, multicall entries included
+        :param hosts: int - Build hosts, tasks beyond this wait in the queue
+        :param time_scale: float - Wall seconds per simulated second of build time
+        :param failure_rate: float - Share of build tasks that fail
+        :param prebuilt: float - Share of packages already built downstream
+        :param seed: int - Random seed for failures and prebuilt packages
+        """
+        self.catalog = catalog
+        self.downstream = downstream
+        self.latency = latency
+        self.call_cost = call_cost
+        self.hosts = hosts
+        self.time_scale = time_scale
+        self.failure_rate = failure_rate
+        # hub calls by method, multicall entries included
+        self.calls = collections.Counter()
+        # HTTP requests
+        self.requests = 0
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tasks: dict[int, _Task] = dict()
+        self._next_task = 1
+        self._next_session = 1
+        # wall-clock times at which each build host becomes free
+        self._slots = [0.0] * hosts
+        if downstream:
+            self.built = {p for p in catalog.packages if self._rng.random() < prebuilt}
+            self.listed = set(self.built)
+        else:
+            self.built = set(catalog.packages)
+            self.listed = set(catalog.packages)
+
+    # --- transport ------------------------------------------------------------------
+
+    def dispatch(self, method: str, params: tuple):
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency)
+        return self._call(method, params)
+
+    def _call(self, method: str, params: tuple):
+        args = list(params)
+        kwargs = dict()
+        if args and isinstance(args[-1], dict) and args[-1].get("__starstar"):
+            kwargs = args.pop()
+            kwargs.pop("__starstar")
+
+        with self._lock:
+            self.calls[method] += 1
+
+        if method == "multiCall":
+            results = list()
+            for call in args[0]:
+                try:
+                    results.append([self._call(call["methodName"], call["params"])])
+                except Fault as e:
+                    results.append({"faultCode": e.faultCode, "faultString": e.faultString})
+            return results
+
+        func = getattr(self, "rpc_" + method, None)
+        if func is None:
+            raise Fault(FAULT, "Invalid method: %s" % method)
+        if self.call_cost:
+            time.sleep(self.call_cost)
+        return func(*args, **kwargs)
+
+    # --- sessions -------------------------------------------------------------------
+
+    def session_info(self) -> dict:
+        """sinfo to hand to ClientSession.setSession instead of logging in"""
+        with self._lock:
+            sid = self._next_session
+            self._next_session += 1
+        return {"session-id": sid, "session-key": "sim-%d" % sid, "header-auth": True}
+
+    def rpc_hello(self, *args):
+        return "Hello World"
+
+    def rpc_getSessionInfo(self, *args, **kwargs):
+        return {"user_id": 1, "authtype": 0}
+
+    def rpc_getLoggedInUser(self):
+        return {"id": 1, "name": "kojiadmin"}
+
+    def rpc_subsession(self):
+        return self.session_info()
+
+    def rpc_logout(self, *args, **kwargs):
+        return None
+
+    def rpc_logoutChild(self, session_id):
+        return None
+
+    # --- tags and packages ----------------------------------------------------------
+
+    def _known(self, pkg: str):
+        if pkg not in self.catalog.info:
+            raise Fault(FAULT, "No such entry in table package: %s" % pkg)
+
+    def rpc_tagLastChangeEvent(self, tag, inherit=False):
+        return 1
+
+    def rpc_getInheritanceData(self, tag, event=None):
+        return []
+
+    def rpc_listPackages(self, tagID=None, **kwargs):
+        return [{"package_name": p, "blocked": False} for p in sorted(self.listed)]
+
+    def rpc_checkTagPackage(self, tag, pkg):
+        return pkg in self.listed
+
+    def rpc_packageListAdd(self, taginfo, pkginfo, owner=None, **kwargs):
+        with self._lock:
+            self.listed.add(pkginfo)
+
+    def rpc_getLatestRPMS(self, tag, package=None, **kwargs):
+        self._known(package)
+        if package not in self.built:
+            return [[], []]
+        return [self.catalog.rpms(package), [self.catalog.build(package)]]
+
+    def rpc_getLatestBuilds(self, tag, **kwargs):
+        return [self.catalog.build(p) for p in sorted(self.built)]
+
+    def rpc_listTagged(self, tag, **kwargs):
+        return [self.catalog.build(p) for p in sorted(self.built)]
+
+    def rpc_getBuild(self, buildInfo, strict=False):
+        if isinstance(buildInfo, int):
+            name = self.catalog.by_id.get(buildInfo)
+        else:
+            name = buildInfo.rsplit("-", 2)[0]
+        if name is None or name not in self.built:
+            return None
+        return self.catalog.build(name)
+
+    def rpc_listBuilds(self, packageID=None, state=None, queryOpts=None, **kwargs):
+        if packageID not in self.built:
+            return []
+        build = self.catalog.build(packageID)
+        return [dict(build, build_id=build["build_id"] - n) for n in range(3)]
+
+    def rpc_getRPMDeps(self, rpmID, depType=None, **kwargs):
+        name = self.catalog.by_id.get(rpmID // 10)
+        if name is None:
+            return []
+        if depType == koji.DEP_REQUIRE and rpmID % 10 == 0:
+            deps = self.catalog.info[name]["requires"]
+        elif depType == koji.DEP_PROVIDE and rpmID % 10 != 0:
+            deps = [name]
+        else:
+            deps = []
+        return [{"name": d, "version": "", "flags": 0, "type": depType} for d in deps]
+
+    # --- builds and tasks -----------------------------------------------------------
+
+    def rpc_listHosts(self, arches=None, channelID=None, ready=None, enabled=None, **kwargs):
+        if ready:
+            now = time.monotonic()
+            with self._lock:
+                free = sum(1 for t in self._slots if t <= now)
+            return [{"id": i} for i in range(free)]
+        return [{"id": i} for i in range(self.hosts)]
+
+    def rpc_listTasks(self, opts=None, queryOpts=None):
+        now = time.monotonic()
+        with self._lock:
+            queued = sum(1 for t in self._tasks.values() if t.start > now)
+        if queryOpts and queryOpts.get("countOnly"):
+            return queued
+        return []
+
+    def rpc_build(self, src, target, opts=None, priority=None, channel=None):
+        name = src.rsplit("/", 1)[-1].split(".git#")[0]
+        self._known(name)
+        duration = self.catalog.info[name]["duration"] * self.time_scale
+        now = time.monotonic()
+        with self._lock:
+            start = max(now, heapq.heappop(self._slots))
+            heapq.heappush(self._slots, start + duration)
+            task = _Task(self._next_task, name, start, start + duration,
+                         self._rng.random() < self.failure_rate)  # fmt: skip
+            self._tasks[task.id] = task
+            self._next_task += 1
+        return task.id
+
+    def rpc_getTaskInfo(self, task_id, request=False, strict=False):
+        task = self._tasks.get(task_id)
+        if task is None:
+            if strict:
+                raise Fault(FAULT, "No such task: %s" % task_id)
+            return None
+
+        now = time.monotonic()
+        if now < task.start:
+            state = koji.TASK_STATES["FREE"]
+        elif now < task.end:
+            state = koji.TASK_STATES["OPEN"]
+        elif task.failed:
+            state = koji.TASK_STATES["FAILED"]
+        else:
+            state = koji.TASK_STATES["CLOSED"]
+            with self._lock:
+                self.built.add(task.pkg)
+        return {"id": task.id, "state": state, "method": "build"}
+
+    # --- imports --------------------------------------------------------------------
+
+    def rpc_checkUpload(self, *args, **kwargs):
+        raise Fault(FAULT, "checkUpload is not supported")
+
+    def rpc_uploadFile(self, *args, **kwargs):
+        return True
+
+    def rpc_importRPM(self, path, basename):
+        name = basename.rsplit("-", 2)[0]
+        self._known(name)
+        with self._lock:
+            self.built.add(name)
+        return {"build_id": self.catalog.info[name]["build_id"], "name": name}
+
+    def rpc_tagBuildBypass(self, tag, build, force=False, notify=False):
+        return None
+
+    def rpc_untaggedBuilds(self, *args, **kwargs):
+        return []
+
+
+class _ThreadedXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class _Handler(SimpleXMLRPCRequestHandler):
+    # Accept any path, session info may arrive in the query string
+    rpc_paths = ()
+
+
+def serve_hub(hub: SimulatedHub):
+    """Serve hub on a free local port from a daemon thread
+    :return (server, url)
+    """
+    server = _ThreadedXMLRPCServer(
+        ("127.0.0.1", 0), _Handler, logRequests=False, allow_none=True
+    )
+    server._dispatch = hub.dispatch  # type: ignore
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d/kojihub" % server.server_address[1]
+
+
+class PackageServer(http.server.ThreadingHTTPServer):
+    """topurl stand-in answering every path with size generated bytes"""
+
+    daemon_threads = True
+
+    def __init__(self, size: int) -> None:
+        self.payload = bytes(range(256)) * (size // 256 + 1)
+        self.payload = self.payload[:size]
+        self.requests = 0
+        super().__init__(("127.0.0.1", 0), _PackageHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:%d/packages" % self.server_address[1]
+
+
+class _PackageHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server: PackageServer = self.server  # type: ignore
+        server.requests += 1
+        data = server.payload
+        offset = 0
+        if "Range" in self.headers:
+            offset = int(self.headers["Range"].split("=")[1].split("-")[0])
+            if offset >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - offset))
+        self.end_headers()
+        self.wfile.write(data[offset:])
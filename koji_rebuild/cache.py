@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import koji
+from .session import KojiSession
+
+
+class ResponseCache:
+    """Persistent cache of read-only upstream hub responses backed by SQLite.
+
+    Entries expire after ``ttl`` seconds. Entries scoped to a tag are dropped as
+    soon as the tag's last change event on the hub differs from the one recorded
+    when they were stored.
+    """
+
+    logger = logging.getLogger("cache")
+
+    def __init__(self, path: str, ttl: int = 86400) -> None:
+        """
+        :param path: str - Path to SQLite database file
+        :param ttl: int - Lifetime of an entry in seconds
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._validated = set()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                method TEXT NOT NULL,
+                key TEXT NOT NULL,
+                tag TEXT,
+                value TEXT NOT NULL,
+                stored REAL NOT NULL,
+                PRIMARY KEY (method, key)
+            );
+            CREATE INDEX IF NOT EXISTS responses_tag ON responses (tag);
+            CREATE TABLE IF NOT EXISTS tags (
+                tag TEXT PRIMARY KEY,
+                event INTEGER
+            );
+            """
+        )
+        self.db.commit()
+        # Expired entries are never read again, drop them before they pile up
+        self.purge()
+
+    def validate_tag(self, session: KojiSession, tag: str):
+        """Invalidate entries of tag if it changed on the hub since they were stored.
+        The hub is asked at most once per tag during the lifetime of the cache object.
+        """
+        if tag is None or tag in self._validated:
+            return
+
+        try:
+            event = session.tagLastChangeEvent(tag, inherit=True)
+        except koji.GenericError as e:
+            self.logger.warning(str(e).splitlines()[-1])
+            event = None
+
+        with self._lock:
+            row = self.db.execute(
+                "SELECT event FROM tags WHERE tag = ?", (tag,)
+            ).fetchone()
+            if event is None or row is None or row[0] != event:
+                count = self.db.execute(
+                    "DELETE FROM responses WHERE tag = ?", (tag,)
+                ).rowcount
+                if count:
+                    self.logger.info(f"Tag {tag} changed, dropped {count} cached entries")
+                self.db.execute(
+                    "INSERT OR REPLACE INTO tags (tag, event) VALUES (?, ?)",
+                    (tag, event),
+                )
+                self.db.commit()
+
+        self._validated.add(tag)
+
+    def get(self, method: str, key):
+        """Return cached response or None if absent or expired"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT value, stored FROM responses WHERE method = ? AND key = ?",
+                (method, json.dumps(key)),
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, method: str, key, value, tag: str | None = None):
+        self.put_many(method, [(key, value)], tag)
+
+    def put_many(self, method: str, items: list, tag: str | None = None):
+        """Store (key, value) pairs of a method, scoped to tag if given"""
+        now = time.time()
+        rows = [
+            (method, json.dumps(key), tag, json.dumps(value, default=str), now)
+            for key, value in items
+        ]
+        with self._lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO responses (method, key, tag, value, stored) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.db.commit()
+
+    def purge(self):
+        """Remove expired entries"""
+        with self._lock:
+            self.db.execute(
+                "DELETE FROM responses WHERE stored < ?", (time.time() - self.ttl,)
+            )
+            self.db.commit()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
@@ -0,0 +1,204 @@
+import re
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+import xmlrpc.client
+import koji
+from .util import Singleton
+from .metrics import Metrics
+
+
+# Upload directories made by package.unique_path differ between runs
+UPLOAD_PATH = re.compile(r"(app-import)/[0-9.]+\.[A-Za-z]{8}")
+
+
+class Cassette(Singleton):
+    """Recording of the hub traffic of a run, for replaying it offline.
+
+    In record mode every hub call made through a KojiSession is passed on and
+    its response, or the fault it raised, is appended to a gzip compressed
+    JSON lines file along with its start offset and duration. Arguments are
+    stored as a digest only, so uploaded chunks do not bloat the file, and
+    with the upload directory masked, as it is random on every run. The
+    calls of a multicall are recorded one by one, each like a call of its own.
+
+    In replay mode no call reaches the network. The responses recorded for a
+    call with the same instance, method and arguments are returned in the
+    order they were recorded; once they run out the last one is repeated, so
+    a task polled more often than during the recording stays in its final
+    state. Multicalls are answered call by call, a poller batching other
+    tasks than during the recording still gets its answers. Each response is
+    delayed by its recorded duration divided by speed, a speed of 0 answers
+    at once.
+
+    A run records or replays as a whole, so every session, pool clones
+    included, checks the same Cassette() on each call. Until open() is
+    called they talk to the hub as usual.
+    """
+
+    logger = logging.getLogger("cassette")
+
+    VERSION = 2
+
+    def _setup(self):
+        self.mode = None
+        self._fd = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode is not None
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def open(self, path: str, mode: str, speed: float = 1.0):
+        """
+        :param path: str - Cassette file
+        :param mode: str - "record" or "replay"
+        :param speed: float - Replay speed relative to the recorded hub latency
+        """
+        if mode not in ["record", "replay"]:
+            raise ValueError(f"Invalid cassette mode {mode}")
+
+        self._origin = time.monotonic()
+        self.speed = speed
+        if mode == "record":
+            self._fd = gzip.open(path, "wt")
+            self._write({"version": self.VERSION, "recorded": time.time()})
+            self.logger.info(f"Recording hub traffic to {path}")
+        else:
+            self._load(path)
+            self.logger.info(f"Replaying hub traffic from {path} at speed {speed}")
+        self.mode = mode
+
+    def _load(self, path: str):
+        # key -> responses in recorded order, next position to hand out
+        self._tape: dict[str, list] = dict()
+        self._pos: dict[str, int] = dict()
+        with gzip.open(path, "rt") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != self.VERSION:
+                raise ValueError(f"Unsupported cassette version {header.get('version')}")
+            for line in f:
+                entry = json.loads(line)
+                self._tape.setdefault(entry["k"], []).append(entry)
+        self.logger.info(f"Loaded {sum(len(v) for v in self._tape.values())} hub responses")
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._fd.close()
+                self._fd = None
+        self.mode = None
+
+    def _write(self, entry: dict):
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        with self._lock:
+            if self._fd is not None:
+                self._fd.write(line + "\n")
+
+    @staticmethod
+    def _encode(obj):
+        if isinstance(obj, bytes):
+            return hashlib.sha1(obj).hexdigest()
+        return repr(obj)
+
+    @classmethod
+    def key(cls, instance: str, method: str, params) -> str:
+        """
+        :param params: list - Call arguments as encoded by koji.encode_args
+        """
+        blob = json.dumps([instance, method, params], sort_keys=True, default=cls._encode)
+        blob = UPLOAD_PATH.sub(r"\1", blob)
+        return hashlib.sha1(blob.encode()).hexdigest()
+
+    @staticmethod
+    def _calls(method: str, args, kwargs) -> list:
+        """(method, params) of the calls carried by a hub request"""
+        if method == "multiCall":
+            return [(c["methodName"], c["params"]) for c in args[0]]
+        return [(method, list(koji.encode_args(*args, **(kwargs or {}))))]
+
+    def record(self, instance: str, method: str, args, kwargs, call):
+        """Run call, a hub request of method with args and kwargs, and record its outcome.
+        The calls of a multicall are recorded one by one."""
+        calls = self._calls(method, args, kwargs)
+        start = time.monotonic()
+        try:
+            result = call()
+        except koji.GenericError as e:
+            outcome = {"f": [e.faultCode, str(e)]}
+            raise
+        except xmlrpc.client.Fault as e:
+            outcome = {"f": [e.faultCode, e.faultString]}
+            raise
+        except Exception:
+            outcome = None
+            raise
+        else:
+            outcome = {"r": result}
+            return result
+        finally:
+            if outcome is not None:
+                t = round(start - self._origin, 6)
+                d = round(time.monotonic() - start, 6)
+                if method == "multiCall" and "r" in outcome:
+                    outcomes = [self._multicall_outcome(r) for r in outcome["r"]]
+                else:
+                    outcomes = [outcome] * len(calls)
+                for (name, params), out in zip(calls, outcomes):
+                    self._write(dict(i=instance, m=name, k=self.key(instance, name, params), t=t, d=d, **out))
+
+    @staticmethod
+    def _multicall_outcome(result) -> dict:
+        # Recorded like a call of its own, so either way of making it replays it
+        if isinstance(result, dict):
+            return {"f": [result["faultCode"], result["faultString"]]}
+        return {"r": result[0]}
+
+    def _next(self, instance: str, method: str, params) -> dict | None:
+        key = self.key(instance, method, params)
+        with self._lock:
+            responses = self._tape.get(key)
+            if not responses:
+                entry = None
+            else:
+                pos = self._pos.get(key, 0)
+                entry = responses[min(pos, len(responses) - 1)]
+                self._pos[key] = pos + 1
+
+        if entry is None:
+            Metrics().inc("cassette_misses", instance=instance, method=method)
+            self.logger.warning(f"No recorded response for {method} on {instance}")
+        return entry
+
+    @staticmethod
+    def _multicall_result(entry: dict | None):
+        if entry is None:
+            return {"faultCode": koji.GenericError.faultCode, "faultString": "No recorded response"}
+        if "f" in entry:
+            return {"faultCode": entry["f"][0], "faultString": entry["f"][1]}
+        return [entry["r"]]
+
+    def replay(self, instance: str, method: str, args, kwargs):
+        """Recorded outcome of a hub request of method with args and kwargs.
+        A multicall is answered call by call, so it need not be batched as recorded."""
+        entries = [self._next(instance, name, params) for name, params in self._calls(method, args, kwargs)]
+
+        if self.speed:
+            time.sleep(max((e["d"] for e in entries if e), default=0) / self.speed)
+
+        if method == "multiCall":
+            return [self._multicall_result(e) for e in entries]
+
+        entry = entries[0]
+        if entry is None:
+            raise koji.GenericError(f"No recorded response for {method}")
+        if "f" in entry:
+            raise koji.convertFault(xmlrpc.client.Fault(*entry["f"]))
+        return entry["r"]
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import koji
+from .session import KojiSession, AsyncKojiSession
+
+
+class ConcurrencyController:
+    """AIMD controller for the number of packages in flight.
+
+    The downstream hub is sampled periodically. While builders sit idle and no
+    tasks wait for a host, the window grows additively. When tasks pile up in
+    the hub queue beyond what the builders can take, the window is cut
+    multiplicatively.
+    """
+
+    logger = logging.getLogger("concurrency")
+
+    def __init__(
+        self,
+        session: AsyncKojiSession,
+        initial: int,
+        minimum: int = 1,
+        maximum: int = 64,
+        increase: int = 2,
+        decrease: float = 0.5,
+        interval: float = 60,
+    ) -> None:
+        """
+        :param session: AsyncKojiSession - Downstream session
+        :param initial: int - Starting window size
+        :param minimum: int - Lower bound of the window
+        :param maximum: int - Upper bound of the window
+        :param increase: int - Packages added per interval while builders are idle
+        :param decrease: float - Factor applied to the window when the queue grows
+        :param interval: float - Seconds between samples
+        """
+        self.session = session
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.interval = interval
+        self._window = float(min(max(initial, minimum), maximum))
+        self._backlog = 0
+        # Bumped on every resize, waiters compare it to the one they last saw
+        self.generation = 0
+        self._changed = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+
+    @property
+    def window(self) -> int:
+        return int(self._window)
+
+    @staticmethod
+    def _sample(session: KojiSession):
+        total = session.get_total_hosts()
+        ready = session.get_ready_hosts()
+        queued = session.get_queued_tasks()
+        return total, ready, queued
+
+    def update(self, total: int, ready: int, queued: int):
+        """Apply one AIMD step from a sample of downstream host and queue state"""
+        previous = self.window
+
+        if queued > max(total, 1) and queued > self._backlog:
+            self._window = max(self._window * self.decrease, self.minimum)
+        elif ready > 0 and queued < ready:
+            self._window = min(self._window + self.increase, self.maximum)
+
+        self._backlog = queued
+
+        if self.window != previous:
+            self.logger.info(
+                f"Concurrency window {previous} -> {self.window} "
+                f"(hosts ready {ready}/{total}, queued tasks {queued})"
+            )
+            self.generation += 1
+            self._changed.set()
+
+    async def _run(self):
+        while True:
+            try:
+                self.update(*await self.session.run(self._sample, self.session.session))
+            except (koji.GenericError, OSError) as e:
+                self.logger.warning(f"Sampling downstream capacity failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+
+    async def wait_changed(self, seen: int) -> int:
+        """Wait until the window is resized past generation seen. A resize
+        made before the call is not missed, it returns at once.
+        :return int - Current generation
+        """
+        while self.generation == seen:
+            self._changed.clear()
+            await self._changed.wait()
+        return self.generation
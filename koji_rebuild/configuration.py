@@ -1,15 +1,11 @@
 import yaml
+from .util import Singleton
 
 
-class Configuration:
-    _instance = None
-
-    def __new__(cls, file_path=None, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(Configuration, cls).__new__(cls, *args, **kwargs)
-            if file_path:
-                cls._instance._load_settings(file_path)
-        return cls._instance
+class Configuration(Singleton):
+    def _setup(self, file_path=None):
+        if file_path:
+            self._load_settings(file_path)
 
     def _load_settings(self, file_path):
         with open(file_path, "r") as f:
@@ -1,37 +1,108 @@
+import time
 import asyncio
 import logging
 from .session import KojiSession
-from .notification import Notification
+from .notification import Notification, NotificationQueue
 from .rebuild import Rebuild, BuildState
-from .util import error, resolvepath, whoami
+from .scheduler import DependencyGraph, BuildScheduler
+from .concurrency import ConcurrencyController
+from .journal import RunJournal
+from .logwriter import LogWriter
+from .util import resolvepath, whoami
 from .configuration import Configuration
+from .metrics import Metrics
+from .trace import Tracer
+from .plan import BuildPlan
 
 
 class TaskDispatcher:
-    task_queue = list()
     logger = logging.getLogger(whoami())
 
     def __init__(
-        self, upstream: KojiSession, downstream: KojiSession, packages: list
+        self,
+        upstream: KojiSession,
+        downstream: KojiSession,
+        packages: list,
+        resume: bool = True,
+        plan: BuildPlan | None = None,
     ) -> None:
         self.downstream = downstream
         self.packages = packages
+        self.plan = plan
         self.settings = Configuration().settings
 
         self.max_tasks = self.settings["package_builds"]["max_tasks"]
+        self.dependency_order = self.settings["package_builds"]["dependency_order"]
+        self.priority = self.settings["package_builds"]["priority"]
 
-        alert = self.settings["notifications"]["alert"]
-        if alert == "prompt":
-            self.notifications = Notification()
+        notif = self.settings["notifications"]
+        alert = notif.get("alert", "off")
+        if alert in ["prompt", "deferred"]:
+            self.notifications = NotificationQueue(
+                Notification(),
+                deferred=(alert == "deferred"),
+                interval=notif["digest_interval"],
+            )
         else:
             self.notifications = None
 
         logs = self.settings["logging"]
 
-        self.compfd = open(resolvepath(logs["completed"]), mode="w+")
-        self.failfd = open(resolvepath(logs["failed"]), mode="w+")
+        self.journal = RunJournal(
+            resolvepath(logs["journal"]),
+            header={
+                "upstream": upstream.instance["tag"],
+                "downstream": downstream.instance["tag"],
+            },
+        )
+        self.resumed = self.journal.load() if resume else dict()
+        self.journal.open(resume=any(self.resumed))
+
+        # Keep results of the previous run when resuming it. Written by the
+        # log writer thread, like the application log.
+        mode = "a" if any(self.resumed) else "w"
+        self.compfd = LogWriter().open(resolvepath(logs["completed"]), mode=mode)
+        self.failfd = LogWriter().open(resolvepath(logs["failed"]), mode=mode)
 
-        self.rebuild = Rebuild(upstream, downstream)
+        self.running = {
+            pkg: task_id
+            for pkg, (state, task_id) in self.resumed.items()
+            if state == RunJournal.SUBMITTED and task_id > 0
+        }
+
+        self.rebuild = Rebuild(upstream, downstream, self.journal)
+        if plan is not None:
+            self.rebuild.use_plan(plan)
+
+        pkgbuilds = self.settings["package_builds"]
+        if pkgbuilds["adaptive_tasks"]:
+            self.controller = ConcurrencyController(
+                self.rebuild.adownstream,
+                initial=self.max_tasks,
+                minimum=pkgbuilds["min_tasks"],
+                maximum=pkgbuilds["max_tasks_limit"],
+                interval=pkgbuilds["adapt_interval"],
+            )
+        else:
+            self.controller = None
+
+        # (priority key, package) of packages ready to build
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.workers: set[asyncio.Task] = set()
+        self.remaining = 0
+        self.finished = asyncio.Event()
+
+        self.metrics = Metrics()
+        self.metrics_file = resolvepath(logs["metrics"])
+        self.metrics_summary = resolvepath(logs["metrics_summary"])
+        self.metrics_interval = self.settings["package_builds"]["metrics_interval"]
+        # package -> time it was queued
+        self.queued_at: dict[str, float] = dict()
+
+        self.tracer = Tracer()
+        if logs["trace"]:
+            self.tracer.open(resolvepath(logs["trace"]))
+        self.in_flight = 0
 
     def _get_taskurl(self, task_id: int):
         if task_id <= 0:
@@ -44,45 +115,203 @@ class TaskDispatcher:
         )
         return url
 
-    def _add_tasks(self):
-        while len(self.task_queue) <= self.max_tasks and self.packages:
-            build_task = asyncio.create_task(
-                self.rebuild.rebuild_package(self.packages.pop(0))
+    def _resize(self):
+        """Start workers up to the window; surplus workers stop on their own"""
+        if self.controller is not None:
+            self.max_tasks = self.controller.window
+
+        while len(self.workers) < self.max_tasks:
+            self.workers.add(asyncio.create_task(self._worker()))
+        self.metrics.set("window", self.max_tasks)
+
+    def _enqueue(self, packages: list):
+        now = time.monotonic()
+        for pkg in packages:
+            self.queued_at[pkg] = now
+            self.queue.put_nowait((self.scheduler.key(pkg), pkg))
+        self.metrics.set("queue_depth", self.queue.qsize())
+
+    async def _worker(self):
+        while len(self.workers) <= self.max_tasks:
+            item = await self.queue.get()
+            if len(self.workers) > self.max_tasks:
+                self.queue.put_nowait(item)
+                break
+
+            pkg = item[1]
+            queued = self.queued_at.pop(pkg)
+            now = time.monotonic()
+            self.metrics.observe("phase", now - queued, phase="queue_wait")
+            self.tracer.complete("queued", pkg, queued, now)
+            self.metrics.set("queue_depth", self.queue.qsize())
+            self.in_flight += 1
+            self.metrics.set("in_flight", self.in_flight)
+
+            start = time.monotonic()
+            if pkg in self.running:
+                res = await self.rebuild.rewatch(pkg, self.running.pop(pkg))
+            else:
+                res = await self.rebuild.rebuild_package(pkg)
+            self.metrics.observe("phase", time.monotonic() - start, phase="package")
+            self.in_flight -= 1
+            self.metrics.set("in_flight", self.in_flight)
+            self.metrics.inc("packages", result=res[2].name.lower())
+            self._finish(*res)
+
+        self.workers.discard(asyncio.current_task())  # type: ignore
+
+    def _finish(self, pkg: str, task_id: int, result: BuildState):
+        self._enqueue(self.scheduler.done(pkg, success=(result == BuildState.COMPLETE)))
+
+        event = self._event(pkg, task_id, result)
+        if result == BuildState.FAILED:
+            self.failfd.write(pkg + "\n")
+            self.journal.record(pkg, RunJournal.FAILED, task_id)
+            self.logger.critical("Package %s build failed!" % pkg, extra=event)
+        elif result == BuildState.CANCELLED:
+            self.journal.record(pkg, RunJournal.CANCELLED, task_id)
+            self.logger.info("Package %s build cancelled" % pkg, extra=event)
+        elif result == BuildState.COMPLETE:
+            self.compfd.write(pkg + "\n")
+            self.journal.record(pkg, RunJournal.COMPLETE, task_id)
+            self.logger.info("Package %s build complete" % pkg, extra=event)
+
+        # Queue email notification, sent in the background
+        if self.notifications is not None:
+            self.notifications.put(pkg, result, self._get_taskurl(task_id))
+
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.finished.set()
+
+    @staticmethod
+    def _event(pkg: str, task_id: int, result: BuildState) -> dict:
+        """Fields of a result record in the JSON lines event stream"""
+        return {"pkg": pkg, "task_id": task_id, "state": result.name.lower()}
+
+    def _skip_finished(self):
+        finished = {
+            pkg
+            for pkg, (state, _) in self.resumed.items()
+            if state == RunJournal.COMPLETE
+        }
+        if any(finished):
+            self.logger.info(
+                f"Resuming previous run, skipping {len(finished)} completed packages"
             )
-            self.task_queue.append(build_task)
+            self.packages = [pkg for pkg in self.packages if pkg not in finished]
 
-    async def start(self):
-        while self.packages or self.task_queue:
-            self._add_tasks()
+    async def _dependency_graph(self) -> DependencyGraph:
+        if not self.dependency_order:
+            return DependencyGraph(self.packages)
+
+        graph = await self.rebuild.aupstream.run(
+            DependencyGraph.from_snapshot,
+            self.rebuild.snapshot,
+            self.rebuild.tag_up,
+            self.packages,
+        )
+        layers = graph.layers()
+        self.logger.info(
+            f"Building {len(graph.packages)} packages in {len(layers)} dependency layers"
+        )
+        return graph
+
+    async def _priorities(self) -> dict:
+        if self.priority != "duration":
+            return dict()
+
+        durations = await self.rebuild.aupstream.run(
+            self.rebuild.snapshot.build_durations, self.packages
+        )
+        if not durations:
+            return dict()
+
+        # Packages without build history rank as an average build
+        average = sum(durations.values()) / len(durations)
+        self.logger.info(
+            f"Build history found for {len(durations)} of {len(self.packages)} packages, "
+            f"average build takes {average:.0f}s"
+        )
+        return {pkg: durations.get(pkg, average) for pkg in self.packages}
 
-            if len(self.task_queue) == 0:
-                error("Task queue is empty!")
+    def _write_metrics(self):
+        try:
+            self.metrics.write_prometheus(self.metrics_file)
+        except OSError as e:
+            self.logger.warning(f"Could not write metrics to {self.metrics_file}: {e}")
 
-            done, _ = await asyncio.wait(
-                self.task_queue, return_when=asyncio.FIRST_COMPLETED
+    async def _export_metrics(self):
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            self._write_metrics()
+
+    async def start(self):
+        self._skip_finished()
+        if self.notifications is not None:
+            self.notifications.start()
+
+        if self.plan is None:
+            await self.rebuild.aupstream.run(self.rebuild.prefetch, self.packages)
+            await self.rebuild.adownstream.run(self.rebuild.load_index)
+            self.scheduler = BuildScheduler(
+                await self._dependency_graph(), await self._priorities()
+            )
+        else:
+            # Everything was resolved when the plan was made
+            self.scheduler = BuildScheduler(
+                self.plan.graph(self.packages), self.plan.priorities()
             )
+        self.remaining = len(self.scheduler.order)
+        if self.remaining == 0:
+            self.finished.set()
+        self._enqueue(self.scheduler.ready())
 
-            for task in done:
-                pkg, task_id, result = task.result()
+        resized = None
+        if self.controller is not None:
+            self.controller.start()
+            generation = self.controller.generation
+            resized = asyncio.create_task(self.controller.wait_changed(generation))
 
-                if result == BuildState.FAILED:
-                    self.failfd.write(pkg + "\n")
-                    self.logger.critical("Package %s build failed!" % pkg)
-                elif result == BuildState.CANCELLED:
-                    self.logger.info("Package %s build cancelled" % pkg)
-                elif result == BuildState.COMPLETE:
-                    self.compfd.write(pkg + "\n")
-                    self.logger.info("Package %s build complete" % pkg)
+        self._resize()
+        exporter = asyncio.create_task(self._export_metrics())
+        finished = asyncio.create_task(self.finished.wait())
 
-                # Attempt email notification
-                if isinstance(self.notifications, Notification):
-                    taskurl = self._get_taskurl(task_id)
-                    async with asyncio.TaskGroup() as tg:
-                        tg.create_task(
-                            self.notifications.build_notify(pkg, result, taskurl)
-                        )
+        while not finished.done():
+            waiters = self.workers | {finished} | ({resized} if resized is not None else set())
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
 
-                self.task_queue.remove(task)
+            if resized in done:
+                # Window was resized, match the worker pool to it
+                done.discard(resized)
+                generation = resized.result()
+                resized = asyncio.create_task(self.controller.wait_changed(generation))  # type: ignore
+                self._resize()
+
+            for task in done - {finished}:
+                # Surface errors raised in a worker
+                task.result()
+
+        for worker in self.workers:
+            worker.cancel()
+        exporter.cancel()
+
+        if self.controller is not None:
+            resized.cancel()  # type: ignore
+            self.controller.stop()
+
+        if self.notifications is not None:
+            await self.notifications.stop()
 
         self.compfd.close()
         self.failfd.close()
+        # Every package got its result, nothing is left to resume
+        self.journal.finish()
+        await self.rebuild.close()
+        self.tracer.close()
+
+        self._write_metrics()
+        try:
+            self.metrics.write_summary(self.metrics_summary)
+        except OSError as e:
+            self.logger.warning(f"Could not write metrics summary: {e}")
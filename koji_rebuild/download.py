@@ -0,0 +1,120 @@
+import os
+import random
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+from .metrics import Metrics
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+class Downloader:
+    """Shared download engine for RPMs fetched from topurl.
+
+    One connection-pooled HTTP session serves the whole run and a semaphore
+    bounds concurrent transfers across all packages. Interrupted transfers
+    resume from the partial file with an HTTP Range request and failed ones
+    are retried with exponential backoff.
+    """
+
+    logger = logging.getLogger("download")
+
+    def __init__(
+        self,
+        workers: int = 8,
+        chunk_size: int = 1048576,
+        retries: int = 5,
+        backoff: float = 1.0,
+    ) -> None:
+        """
+        :param workers: int - Maximum concurrent transfers
+        :param chunk_size: int - Bytes read from the network per write
+        :param retries: int - Attempts per file before giving up
+        :param backoff: float - Delay in seconds before the first retry, doubled per retry
+        """
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.backoff = backoff
+        # aiohttp is only imported once something is downloaded
+        self._session: "aiohttp.ClientSession | None" = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def _client(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            timeout = aiohttp.ClientTimeout(total=None, sock_read=30, sock_connect=10)
+            connector = aiohttp.TCPConnector(limit=self.workers, limit_per_host=self.workers)
+            self._session = aiohttp.ClientSession(timeout=timeout, connector=connector)
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._session
+
+    async def _transfer(self, url: str, filepath: str) -> bool:
+        """Single attempt, resuming from a partial file if there is one.
+        :return bool - True on success, False if the server refused the file
+        """
+        import aiohttp
+
+        partial = filepath + ".part"
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        headers = {"Range": "bytes=%d-" % offset} if offset else {}
+
+        async with self._client().get(url, headers=headers) as response:
+            if response.status == 416:
+                # Partial file is already complete or corrupt, start over
+                os.remove(partial)
+                raise aiohttp.ClientPayloadError("Range not satisfiable")
+            if response.status not in (200, 206):
+                self.logger.error(f"Server response code :{response.status}. URL - {url}")
+                if response.status >= 500:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, (), status=response.status
+                    )
+                return False
+
+            mode = "ab" if response.status == 206 else "wb"
+            received = 0
+            try:
+                with open(partial, mode) as f:
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        f.write(chunk)
+                        received += len(chunk)
+            finally:
+                # Bytes of an interrupted attempt were transferred all the same
+                Metrics().inc("download_bytes", received)
+
+        os.replace(partial, filepath)
+        return True
+
+    async def fetch(self, url: str, filepath: str, size: int | None = None) -> bool:
+        """Download url to filepath
+        :param size: int - Expected file size; a complete file already present is kept
+        :return bool - True on success
+        """
+        if size is not None and os.path.exists(filepath):
+            if os.path.getsize(filepath) == size:
+                return True
+
+        import aiohttp
+
+        self._client()
+        async with self._semaphore:  # type: ignore
+            for attempt in range(self.retries):
+                try:
+                    return await self._transfer(url, filepath)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt + 1 == self.retries:
+                        self.logger.error(f"Giving up on {url} after {self.retries} attempts: {e}")
+                        return False
+                    delay = self.backoff * 2**attempt * (1 + random.random())
+                    self.logger.warning(f"Retrying {url} in {delay:.1f}s: {e}")
+                    await asyncio.sleep(delay)
+        return False
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
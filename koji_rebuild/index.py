@@ -0,0 +1,78 @@
+import logging
+import threading
+import koji
+from .session import KojiSession
+
+
+class BuildIndex:
+    """In-memory index of builds tagged into a downstream tag.
+
+    Loaded once with a single listTagged call, including inherited tags, and
+    kept current as builds complete during the run. Clash checks against it
+    cost nothing on the network.
+
+    A build with the same NVR may exist on the hub without being tagged under
+    the tag, koji then refuses to build it again. NVRs the run is going to
+    check are confirmed with one getBuild multicall, see confirm(). Only
+    NVRs that are known() can be answered from the index.
+    """
+
+    logger = logging.getLogger("buildindex")
+
+    def __init__(self) -> None:
+        self.loaded = False
+        # nvr -> build state
+        self.by_nvr: dict[str, int] = dict()
+        # nvrs confirmed not to exist on the hub
+        self.absent: set[str] = set()
+        self._lock = threading.Lock()
+
+    def load(self, session: KojiSession, tag: str):
+        builds = session.listTagged(tag, inherit=True)
+        with self._lock:
+            for build in builds:
+                self._add(build["nvr"], build["state"])
+            self.loaded = True
+        self.logger.info(f"Indexed {len(self.by_nvr)} builds tagged under {tag}")
+
+    def confirm(self, session: KojiSession, nvrs, batch: int = 500):
+        """Look up the nvrs missing from the index with batched getBuild calls.
+        Builds found on the hub are indexed even if not tagged under the tag."""
+        missing = [nvr for nvr in set(nvrs) if nvr not in self.by_nvr]
+        calls = dict()
+        with session.multicall(strict=False, batch=batch) as m:
+            for nvr in missing:
+                calls[nvr] = m.getBuild(nvr)
+
+        found = 0
+        with self._lock:
+            for nvr, call in calls.items():
+                try:
+                    build = call.result
+                except koji.GenericError as e:
+                    # Left unknown, checked on its own when it comes up
+                    self.logger.warning(str(e).splitlines()[-1])
+                    continue
+                if build:
+                    self._add(nvr, build["state"])
+                    found += 1
+                else:
+                    self.absent.add(nvr)
+        self.logger.info(f"Confirmed {len(calls)} untagged NVRs, {found} of them exist on the hub")
+
+    def _add(self, nvr: str, state: int):
+        self.absent.discard(nvr)
+        self.by_nvr[nvr] = state
+
+    def add(self, nvr: str, state: int):
+        """Record a build finished during the run"""
+        with self._lock:
+            self._add(nvr, state)
+
+    def known(self, nvr: str) -> bool:
+        """True if the index can tell whether nvr exists on the hub"""
+        return nvr in self.by_nvr or nvr in self.absent
+
+    def state(self, nvr: str) -> int | None:
+        """Build state of nvr, None if no such build is indexed"""
+        return self.by_nvr.get(nvr)
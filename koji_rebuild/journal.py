@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import logging
+
+
+class RunJournal:
+    """Append-only journal of package state transitions.
+
+    Every record is flushed and fsync'd before the call returns, so that after
+    an abort the journal tells which packages are finished and which builds
+    are still running on the downstream hub. A run that ends normally closes
+    the journal with a finished record, the next run then starts over.
+    """
+
+    logger = logging.getLogger("journal")
+
+    SUBMITTED = "submitted"
+    COMPLETE = "complete"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, path: str, header: dict) -> None:
+        """
+        :param path: str - Path to journal file
+        :param header: dict - Run parameters; a journal written with different
+                              parameters is not resumed
+        """
+        self.path = path
+        self.header = header
+        self.fd = None
+
+    def load(self) -> dict:
+        """Replay the journal
+        :return dict - package name to its last (state, task_id)
+        """
+        state = dict()
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return state
+
+        for n, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last write of an aborted run
+                self.logger.warning(f"Ignoring corrupt journal line {n + 1} in {self.path}")
+                continue
+
+            if "finished" in record:
+                self.logger.info(f"Journal {self.path} belongs to a finished run, not resuming")
+                return dict()
+
+            if "run" in record:
+                if record["run"] != self.header:
+                    self.logger.info(
+                        f"Journal {self.path} belongs to a different run, not resuming"
+                    )
+                    return dict()
+                continue
+
+            state[record["pkg"]] = (record["state"], record.get("task_id", -1))
+
+        return state
+
+    def open(self, resume: bool = True):
+        """Open the journal for appending; start a new one unless resuming"""
+        if resume and os.path.exists(self.path):
+            self.fd = open(self.path, mode="a")
+        else:
+            self.fd = open(self.path, mode="w")
+            self._write({"run": self.header})
+
+    def _write(self, record: dict):
+        self.fd.write(json.dumps(record) + "\n")  # type: ignore
+        self.fd.flush()  # type: ignore
+        os.fsync(self.fd.fileno())  # type: ignore
+
+    def record(self, pkg: str, state: str, task_id: int = -1):
+        if self.fd is None:
+            return
+        self._write({"ts": time.time(), "pkg": pkg, "state": state, "task_id": task_id})
+
+    def finish(self):
+        """Mark the run as finished and close the journal"""
+        if self.fd is not None:
+            self._write({"finished": time.time()})
+        self.close()
+
+    def close(self):
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
@@ -0,0 +1,198 @@
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from .util import Singleton
+
+
+# Attributes every LogRecord has, anything else was passed through extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with the fields passed through extra="""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        event.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        if record.exc_info:
+            event["exc"] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+
+class _BatchFileHandler(logging.FileHandler):
+    """FileHandler leaving the flush to the writer, once per batch"""
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class ResultFile:
+    """File written by the log writer thread, for the completed and failed lists"""
+
+    __slots__ = ("writer", "fd")
+
+    def __init__(self, writer, fd) -> None:
+        self.writer = writer
+        self.fd = fd
+
+    def write(self, text: str):
+        self.writer.put(("write", self.fd, text))
+
+    def close(self):
+        """Close the file once everything queued for it is written"""
+        self.writer.put(("close", self.fd))
+        self.writer.flush()
+
+
+class LogWriter(Singleton):
+    """Single thread writing the application log and the result lists.
+
+    Loggers only put their records on a queue, through a QueueHandler on the
+    root logger, so a log file on a slow or stalled disk never holds up the
+    event loop or the RPC threads. The writer thread takes whatever piled up
+    in the queue, writes it and flushes every file touched once per batch.
+
+    With an events file set, every record is also written there as a JSON
+    line, along with any fields passed through extra=, for tools to follow
+    a run without parsing the log.
+
+    Writes only keep their order when they go through one thread, so
+    LogWriter() is the same writer wherever it is called. Until start() is
+    called logging is left as configured elsewhere, result files are still
+    written by the thread.
+    """
+
+    # Items taken off the queue before flushing
+    BATCH = 512
+
+    def _setup(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._handlers = list()
+        self._root_handler = None
+        self._lock = threading.Lock()
+
+    def start(self, application: str, events: str = "", fmt: str | None = None, level=logging.INFO):
+        """Send every log record through the writer thread
+        :param application: str - Application log file
+        :param events: str - JSON lines event file, none if empty
+        :param fmt: str - Format of the application log
+        """
+        handler = _BatchFileHandler(application, delay=True)
+        handler.setFormatter(logging.Formatter(fmt))
+        handlers = [handler]
+        if events:
+            handler = _BatchFileHandler(events, delay=True)
+            handler.setFormatter(JSONFormatter())
+            handlers.append(handler)
+        self.put(("handlers", handlers))
+
+        root = logging.getLogger()
+        if self._root_handler is None:
+            self._root_handler = logging.handlers.QueueHandler(self._queue)  # type: ignore
+            root.addHandler(self._root_handler)
+        root.setLevel(level)
+
+    def put(self, item):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="logwriter", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        self._queue.put(item)
+
+    def open(self, path: str, mode: str = "w") -> ResultFile:
+        return ResultFile(self, open(path, mode=mode))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until everything queued so far is written
+        :return bool - False if the writer did not catch up within timeout
+        """
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Write what is queued and stop the writer thread"""
+        if self._root_handler is not None:
+            logging.getLogger().removeHandler(self._root_handler)
+            self._root_handler = None
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            dirty = set()
+            for item in batch:
+                if item is None:
+                    stopping = True
+                elif isinstance(item, logging.LogRecord):
+                    for handler in self._handlers:
+                        handler.handle(item)
+                elif isinstance(item, threading.Event):
+                    self._flush(dirty)
+                    item.set()
+                else:
+                    self._apply(item, dirty)
+            self._flush(dirty)
+
+        for handler in self._handlers:
+            handler.close()
+        self._handlers = list()
+
+    def _apply(self, item: tuple, dirty: set):
+        op, *args = item
+        if op == "handlers":
+            for handler in self._handlers:
+                handler.close()
+            self._handlers = args[0]
+            return
+
+        fd = args[0]
+        try:
+            if op == "write":
+                fd.write(args[1])
+                dirty.add(fd)
+            elif op == "close":
+                dirty.discard(fd)
+                fd.close()
+        except (OSError, ValueError) as e:
+            sys.stderr.write(f"Could not write to {fd.name}: {e}\n")
+
+    def _flush(self, dirty: set):
+        for handler in self._handlers:
+            handler.flush()
+        for fd in dirty:
+            try:
+                fd.flush()
+            except OSError as e:
+                sys.stderr.write(f"Could not write to {fd.name}: {e}\n")
+        dirty.clear()
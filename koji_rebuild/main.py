@@ -2,12 +2,6 @@ import logging
 import asyncio
 import click
 
-from .session import KojiSession
-from .util import GenericException
-from .setup import Setup
-from .notification import Notification
-from .dispatcher import TaskDispatcher
-from .configuration import Configuration
 import sys
 
 
@@ -15,24 +9,128 @@ import sys
 @click.argument(
     "configfile", type=click.Path(exists=True, dir_okay=False, resolve_path=True)
 )
-def main(configfile):
+@click.option(
+    "--fresh",
+    is_flag=True,
+    help="Ignore the journal of an aborted run and start over instead of resuming it",
+)
+@click.option(
+    "--outdated",
+    is_flag=True,
+    help="Rebuild only packages whose latest NVR differs between the upstream "
+    "and downstream tags, instead of the buildlist",
+)
+@click.option(
+    "--plan",
+    "dry_run",
+    is_flag=True,
+    help="Resolve what the run would do, save the plan with a cost estimate "
+    "and exit without building",
+)
+@click.option(
+    "--execute-plan",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Run a plan saved by --plan without querying the hubs again",
+)
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False),
+    help="Record every hub request and response of the run to a cassette file",
+)
+@click.option(
+    "--replay",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Answer hub requests from a recorded cassette instead of the network",
+)
+@click.option(
+    "--replay-speed",
+    type=float,
+    default=1.0,
+    show_default=True,
+    help="Replay hub latency this many times faster, 0 answers at once",
+)
+def main(configfile, fresh, outdated, dry_run, execute_plan, record, replay, replay_speed):
     """
     CONFIGFILE: YAML formatted configuration file
     """
     logger = logging.getLogger("koji-rebuild")
+    if record and replay:
+        raise click.UsageError("--record and --replay are mutually exclusive")
+    if execute_plan and (dry_run or outdated):
+        raise click.UsageError("--execute-plan takes the package list from the plan")
+
+    # Imported here so --help and usage errors do not wait on koji and friends
+    from .session import KojiSession
+    from .util import GenericException, resolvepath
+    from .setup import Setup
+    from .notification import Notification
+    from .dispatcher import TaskDispatcher
+    from .tagdiff import TagDiff
+    from .rebuild import Rebuild
+    from .plan import BuildPlan
+    from .configuration import Configuration
+    from .cassette import Cassette
+    from .logwriter import LogWriter
+
     setup = Setup(configfile)
+    cassette = Cassette()
+    if record:
+        cassette.open(record, "record")
+    elif replay:
+        cassette.open(replay, "replay", speed=replay_speed)
+
     upstream = KojiSession("upstream")
     downstream = KojiSession("downstream")
 
-    packagelist = setup.packagelist()
+    if execute_plan:
+        buildplan = BuildPlan.load(
+            execute_plan,
+            header={
+                "upstream": upstream.instance["tag"],
+                "downstream": downstream.instance["tag"],
+            },
+        )
+        packagelist = buildplan.names()
+    elif outdated:
+        buildplan = None
+        diff = TagDiff(upstream, downstream)
+        diff.load()
+        packagelist = diff.outdated(ignore=setup.ignorelist())
+        plan = diff.summary()
+        logger.info(plan)
+        print(plan)
+        if not any(packagelist):
+            print("Downstream tag is up to date")
+            cassette.close()
+            sys.exit(0)
+    else:
+        buildplan = None
+        packagelist = setup.packagelist()
 
     if not any(packagelist):
         print("Package list is empty!")
         sys.exit(1)
 
+    if dry_run:
+        rebuild = Rebuild(upstream, downstream)
+        buildplan = BuildPlan.resolve(rebuild, packagelist)
+        asyncio.run(rebuild.close())
+        path = resolvepath(Configuration().settings["logging"]["plan"])
+        buildplan.save(path)
+        summary = buildplan.summary()
+        logger.info(summary)
+        print(summary)
+        print(f"Plan written to {path}")
+        cassette.close()
+        sys.exit(0)
+
     msg = str()
     try:
-        asyncio.run(TaskDispatcher(upstream, downstream, packagelist).start())
+        asyncio.run(
+            TaskDispatcher(
+                upstream, downstream, packagelist, resume=not fresh, plan=buildplan
+            ).start()
+        )
     except KeyboardInterrupt:
         msg = "Received SIGINT"
         logger.exception(msg)
@@ -41,20 +139,26 @@ def main(configfile):
     else:
         msg = "Check attached logs"
     finally:
-        alert = Configuration().settings["notifications"]["alert"]
-        if alert.lower() in ["deferred", "prompt"]:
+        alert = Configuration().settings["notifications"].get("alert", "off")
+        if str(alert).lower() in ["deferred", "prompt"]:
             notification = Notification()
+            # Attach the log files with everything logged so far
+            LogWriter().flush()
             logs = Configuration().settings["logging"]
             app = logs["application"]
             completed = logs["completed"]
             failed = logs["failed"]
-            asyncio.run(
-                notification.send_email(
+
+            async def notify_finished():
+                await notification.send_email(
                     "Koji Build System: Finished",
                     msg,
                     attachment=[app, completed, failed],
                 )
-            )
+                await notification.close()
+
+            asyncio.run(notify_finished())
+        cassette.close()
         print(msg)
 
 
@@ -0,0 +1,183 @@
+import os
+import json
+import math
+import time
+import bisect
+import logging
+import threading
+from .util import Singleton
+
+
+# Latency bucket upper bounds in seconds, from fast hub calls to long builds
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+    120, 300, 600, 1800, 3600, 7200, 14400, math.inf,
+)  # fmt: skip
+
+PREFIX = "kojirebuild"
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding quantile q"""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name: str, labels: dict) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.monotonic() - self.start, **self.labels)
+        if exc_type is not None:
+            self.metrics.inc(self.name + "_errors", **self.labels)
+        return False
+
+
+class Metrics(Singleton):
+    """Process wide counters, gauges and latency histograms.
+
+    Sessions, helpers and the dispatcher all record into the registry of the
+    process, without passing it around. Recording is thread safe, hub calls
+    are timed on the AsyncKojiSession worker threads.
+    """
+
+    logger = logging.getLogger("metrics")
+
+    def _setup(self):
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        # (name, sorted label items) -> value
+        self.counters: dict[tuple, float] = dict()
+        self.gauges: dict[tuple, float] = dict()
+        self.histograms: dict[tuple, _Histogram] = dict()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = _Histogram()
+            hist.observe(seconds)
+
+    def timer(self, name: str, **labels) -> _Timer:
+        """Context manager observing the time spent in its block under name.
+        An exception leaving the block also counts towards name_errors."""
+        return _Timer(self, name, labels)
+
+    @staticmethod
+    def _labels(items: tuple, extra: tuple = ()) -> str:
+        items = items + extra
+        if not items:
+            return ""
+        return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace('"', '\\"')) for k, v in items)
+
+    def prometheus(self) -> str:
+        """Registry in the Prometheus text exposition format"""
+        lines = list()
+        with self._lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({k[0] for k in series}):
+                    metric = f"{PREFIX}_{name}" + ("_total" if kind == "counter" else "")
+                    lines.append(f"# TYPE {metric} {kind}")
+                    for (n, items), value in sorted(series.items()):
+                        if n == name:
+                            lines.append(f"{metric}{self._labels(items)} {value}")
+
+            for name in sorted({k[0] for k in self.histograms}):
+                metric = f"{PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for (n, items), hist in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, hist.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else repr(float(bound))
+                        labels = self._labels(items, (("le", le),))
+                        lines.append(f"{metric}_bucket{labels} {cumulative}")
+                    lines.append(f"{metric}_sum{self._labels(items)} {hist.sum}")
+                    lines.append(f"{metric}_count{self._labels(items)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Registry as plain data, histograms reduced to count, mean and quantiles"""
+
+        def name(key: tuple) -> str:
+            return key[0] + self._labels(key[1])
+
+        with self._lock:
+            return {
+                "started": self.started,
+                "elapsed": time.time() - self.started,
+                "counters": {name(k): v for k, v in sorted(self.counters.items())},
+                "gauges": {name(k): v for k, v in sorted(self.gauges.items())},
+                "histograms": {
+                    name(k): {
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "mean": round(h.sum / h.count, 6) if h.count else 0,
+                        "p50": round(h.quantile(0.5), 6),
+                        "p90": round(h.quantile(0.9), 6),
+                        "p99": round(h.quantile(0.99), 6),
+                        "max": round(h.max, 6),
+                    }
+                    for k, h in sorted(self.histograms.items())
+                },
+            }
+
+    def write_prometheus(self, path: str):
+        """Atomically replace path, for the node_exporter textfile collector"""
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    def write_summary(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        self.logger.info(f"Metrics summary written to {path}")
@@ -1,15 +1,17 @@
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
-import aiosmtplib
 import os
-import keyring
+import time
+import asyncio
+import logging
 from .rebuild import BuildState
 from .configuration import Configuration
 from .util import error
 
 
 class Notification:
+    logger = logging.getLogger("notification")
 
     def __init__(self) -> None:
         try:
@@ -34,6 +36,9 @@ class Notification:
         tls = True if auth == "tls" else False
         start_tls = True if (auth == "start_tls" or auth == "starttls") else False
 
+        import aiosmtplib
+        import keyring
+
         self.client = aiosmtplib.SMTP(
             hostname=server,
             port=port,
@@ -49,6 +54,8 @@ class Notification:
         except AssertionError:
             return
 
+        import aiosmtplib
+
         message = MIMEMultipart()
         message["From"] = str(self.senderid)
         message["To"] = ", ".join(self.recipients)
@@ -65,9 +72,59 @@ class Notification:
                 )
                 message.attach(part)
 
-        await self.client.connect()
+        try:
+            await self._send(message)
+        except aiosmtplib.SMTPServerDisconnected:
+            # Server dropped the idle connection, reconnect once
+            await self._send(message)
+
+    async def _send(self, message):
+        if not self.client.is_connected:
+            await self.client.connect()
         await self.client.send_message(message)
-        await self.client.quit()
+
+    async def connect(self):
+        """Open the SMTP connection ahead of the first message, a failure is
+        only logged as sending retries it"""
+        if not any(self.notif) or self.client.is_connected:
+            return
+
+        import aiosmtplib
+
+        try:
+            await self.client.connect()
+        except (aiosmtplib.SMTPException, OSError) as e:
+            self.logger.warning(f"Could not connect to SMTP server {self.client.hostname}: {e}")
+        else:
+            self.logger.info(f"Connected to SMTP server {self.client.hostname}")
+
+    async def close(self):
+        """Quit the SMTP connection kept open between messages"""
+        if not any(self.notif):
+            return
+
+        import aiosmtplib
+
+        if self.client.is_connected:
+            try:
+                await self.client.quit()
+            except aiosmtplib.SMTPException:
+                self.client.close()
+
+    def wants(self, pkg_status) -> bool:
+        """True if the configured trigger covers pkg_status"""
+        trigger = self.notif["trigger"]
+        if trigger == "fail":
+            return pkg_status == BuildState.FAILED
+        elif trigger in ["success", "build"]:
+            return pkg_status == BuildState.COMPLETE
+        elif trigger == "all":
+            return pkg_status in [BuildState.COMPLETE, BuildState.FAILED]
+        return False
+
+    @staticmethod
+    def _status(pkg_status) -> str:
+        return "FAILED" if pkg_status == BuildState.FAILED else "COMPLETED"
 
     async def build_notify(self, pkg, pkg_status, task_url=None):
         try:
@@ -79,7 +136,7 @@ class Notification:
             template = f"<html><b><p>{msg}</p></b></html>"
             return template
 
-        status = "FAILED" if pkg_status == BuildState.FAILED else "COMPLETED"
+        status = self._status(pkg_status)
 
         subj = "Koji Build System Status: %s" % (status)
 
@@ -90,14 +147,121 @@ class Notification:
 
         msg = html_message(msg)
 
-        if self.notif["trigger"] == "fail":
-            flag = 1 if pkg_status == BuildState.FAILED else 0
-        elif self.notif["trigger"] == "build":
-            flag = 1 if pkg_status == BuildState.COMPLETE else 0
-        elif self.notif["trigger"] == "all":
-            flag = 1 if pkg_status == (BuildState.COMPLETE or BuildState.FAILED) else 0
-        else:
-            flag = 0
-
-        if flag:
+        if self.wants(pkg_status):
             await self.send_email(subj, msg)
+
+    async def digest_notify(self, events: list):
+        """Send one message for several builds
+        :param events: list - (pkg, pkg_status, task_url) tuples
+        """
+        try:
+            assert any(self.notif)
+        except AssertionError:
+            return None
+
+        events = [e for e in events if self.wants(e[1])]
+        if not any(events):
+            return None
+        if len(events) == 1:
+            return await self.build_notify(*events[0])
+
+        failed = sum(1 for e in events if e[1] == BuildState.FAILED)
+        subj = "Koji Build System Status: %d builds, %d FAILED" % (len(events), failed)
+
+        rows = list()
+        for pkg, pkg_status, task_url in events:
+            link = f"<a href={task_url}>{task_url}</a>" if task_url is not None else ""
+            rows.append(
+                f"<tr><td>{pkg}</td><td><b>{self._status(pkg_status)}</b></td><td>{link}</td></tr>"
+            )
+        msg = "<html><table>%s</table></html>" % "".join(rows)
+
+        await self.send_email(subj, msg)
+
+
+class NotificationQueue:
+    """Sends build notifications from a background task.
+
+    Dispatch only queues events. A consumer task sends them over the SMTP
+    connection kept open by Notification, so mail latency never holds up a
+    build. With alert "prompt" the events are sent as they come, with a burst
+    that piled up during a send folded into one digest. With "deferred" they
+    are collected and sent as a digest every digest_interval seconds.
+    """
+
+    logger = logging.getLogger("notification")
+
+    def __init__(self, notification: Notification, deferred: bool, interval: float = 3600) -> None:
+        """
+        :param notification: Notification - Configured mail sender
+        :param deferred: bool - Send periodic digests instead of prompt mails
+        :param interval: float - Seconds between digests
+        """
+        self.notification = notification
+        self.deferred = deferred
+        self.interval = interval
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._consumer: asyncio.Task | None = None
+        self._connecting: asyncio.Task | None = None
+
+    def start(self):
+        """Connect to the SMTP server in the background"""
+        self._connecting = asyncio.create_task(self.notification.connect())
+
+    def put(self, pkg, pkg_status, task_url=None):
+        """Queue a build event, never blocks"""
+        self.queue.put_nowait((pkg, pkg_status, task_url))
+        if self._consumer is None:
+            self._consumer = asyncio.create_task(self._run())
+
+    async def _deliver(self, events: list):
+        import aiosmtplib
+
+        if self._connecting is not None:
+            await self._connecting
+            self._connecting = None
+        try:
+            await self.notification.digest_notify(events)
+        except (aiosmtplib.SMTPException, OSError) as e:
+            self.logger.error(f"Could not send notification for {len(events)} builds: {e}")
+
+    async def _run(self):
+        events = list()
+        stopping = False
+        deadline = time.monotonic() + self.interval
+
+        while not stopping:
+            timeout = max(0, deadline - time.monotonic()) if self.deferred else None
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                # Take everything queued since, None marks the end of the run
+                while True:
+                    if item is None:
+                        stopping = True
+                    else:
+                        events.append(item)
+                    if self.queue.empty():
+                        break
+                    item = self.queue.get_nowait()
+
+            if self.deferred and not stopping and time.monotonic() < deadline:
+                continue
+
+            deadline = time.monotonic() + self.interval
+            if any(events):
+                await self._deliver(events)
+                events = list()
+
+    async def stop(self):
+        """Send whatever is still queued and close the SMTP connection"""
+        if self._consumer is not None:
+            self.queue.put_nowait(None)
+            await self._consumer
+            self._consumer = None
+        if self._connecting is not None:
+            await self._connecting
+            self._connecting = None
+        await self.notification.close()
@@ -1,73 +1,131 @@
 from .configuration import Configuration
 from .session import KojiSession
-from .util import nestedseek
+from .prefetch import UpstreamSnapshot
+from .download import Downloader
+from .rpmcache import RPMStore
+from .records import Build, LatestRPMs, TagInheritance
+from .metrics import Metrics
 import koji
+import asyncio
 import logging
 import time
 import os
 import string
 import random
 import shutil
-import aiohttp
+
+
+def unique_path(prefix):
+    """Create a unique path fragment by appending a path component to prefix."""
+    return "%s/%r.%s" % (
+        prefix,
+        time.time(),
+        "".join([random.choice(string.ascii_letters) for _ in range(8)]),
+    )
 
 
 class PackageHelper:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        snapshot: UpstreamSnapshot | None = None,
+        downloader: Downloader | None = None,
+        store: RPMStore | None = None,
+    ) -> None:
         self.logger = logging.getLogger("PackageHelper")
+        self.snapshot = snapshot
+        self.downloader = downloader if downloader is not None else Downloader()
+        self.store = store
+
+    def _from_snapshot(self, session: KojiSession):
+        # Pool sessions of the snapshot's instance are answered from it too
+        return (
+            self.snapshot is not None
+            and self.snapshot.session.instance_name == session.instance_name
+        )
+
+    def latest_rpms(self, session: KojiSession, tag: str, pkg: str) -> LatestRPMs:
+        """getLatestRPMS answered from the prefetched snapshot when possible"""
+        if self._from_snapshot(session):
+            res = self.snapshot.latest_rpms(tag, pkg)  # type: ignore
+            if res is not None:
+                return res
+        return LatestRPMs.from_response(session.getLatestRPMS(tag=tag, package=pkg))
+
+    def get_build(self, session: KojiSession, build_id: int) -> Build | None:
+        """getBuild answered from the prefetched snapshot when possible"""
+        if self._from_snapshot(session):
+            res = self.snapshot.build(build_id)  # type: ignore
+            if res is not None:
+                return res
+        info = session.getBuild(buildInfo=build_id)
+        return Build.from_dict(info) if info is not None else None
 
     def getSCM_URL(self, session: KojiSession, tag: str, pkg: str):
         build_id = None
         try:
-            pkginfo = session.getLatestRPMS(tag=tag, package=pkg)
+            pkginfo = self.latest_rpms(session, tag, pkg)
         except koji.GenericError as e:
             self.logger.error(str(e).splitlines()[-1])
         except IndexError:
             self.logger.critical("No package %s associated with tag %s" % (pkg, tag))
         else:
-            build_id = list(nestedseek(pkginfo, key="build_id"))[0]
+            build_id = pkginfo.build_id
+            if build_id is None:
+                self.logger.critical("No package %s associated with tag %s" % (pkg, tag))
 
         if build_id is not None:
-            info = session.getBuild(buildInfo=build_id)
-            return info["source"]
+            info = self.get_build(session, build_id)
+            return info.source if info is not None else None
         else:
             return None
 
+    def build_duration(self, session: KojiSession, tag: str, pkg: str):
+        """Duration in seconds of the latest build of pkg under tag, if known"""
+        try:
+            build_id = self.latest_rpms(session, tag, pkg).build_id
+        except koji.GenericError:
+            return None
+
+        if build_id is None:
+            return None
+
+        info = self.get_build(session, build_id)
+        return info.duration if info is not None else None
+
     def is_noarch(self, session: KojiSession, tag: str, pkg: str):
-        noarch = ["src", "noarch"]
-        builds = list()
+        builds = LatestRPMs()
 
         try:
-            builds = session.getLatestRPMS(tag=tag, package=pkg)
+            builds = self.latest_rpms(session, tag, pkg)
         except koji.GenericError as e:
             self.logger.warning(str(e).splitlines()[-1])
 
-        if any(builds):
-            arches = nestedseek(builds, key="arch")
-            for arch in arches:
-                if str(arch) not in noarch:
-                    return False
-
-            return True
+        if builds:
+            return builds.noarch
         else:
             self.logger.critical("No builds for package %s" % pkg)
             return False
 
     def get_package_list(self, session: KojiSession, tag: str) -> None | list[str]:
-        res = session.listPackages(tagID=tag)
+        if self._from_snapshot(session):
+            res = self.snapshot.list_packages(tag)  # type: ignore
+        else:
+            res = session.listPackages(tagID=tag)
         if res is not None:
-            packages = list(nestedseek(res, "package_name"))
+            packages = [entry["package_name"] for entry in res]
             return packages
         else:
             self.logger.info(f"No package tagged under tag : {tag}")
             return None
 
-    async def retrieveRPMs(self, session: KojiSession, tag: str, pkg: str):
+    def rpm_files(self, session: KojiSession, tag: str, pkg: str):
         """
-        Retrieves RPM packages from server
+        Lists RPM files of the latest build of a package
         :param: session - KojiSession object
         :param: tag - tag reference for package
         :param: pkg - package to be downloaded
-        :return - path to package download directory
+        :return - (path to package download directory, list of
+                  (url, filepath, size, payloadhash) tuples), None on error
         """
         settings = Configuration().settings
         dir = settings["package_builds"]["download_dir"]
@@ -81,134 +139,88 @@ class PackageHelper:
                 self.logger.error(f"Permission error creating directory {pkgpath}")
                 raise
 
-        def nvra_generator(tag, pkg):
-            try:
-                info = session.getLatestRPMS(tag=tag, package=pkg)
-            except koji.GenericError as e:
-                self.logger.critical(str(e).splitlines()[-1])
-                return None
+        try:
+            info = self.latest_rpms(session, tag, pkg)
+        except koji.GenericError as e:
+            self.logger.critical(str(e).splitlines()[-1])
+            return None
 
-            if any(info):
-                name = nestedseek(info, "name")
-                version = nestedseek(info, "version")
-                release = nestedseek(info, "release")
-                arch = nestedseek(info, "arch")
+        if not info:
+            return None
 
-                for n, v, r, a in zip(name, version, release, arch):
-                    yield (n, v, r, a)
-            else:
-                return None
+        files = list()
+        for rpm in info.rpms:
+            url = "/".join([topurl, pkg, rpm.version, rpm.release, rpm.arch, rpm.filename])
+            filepath = "/".join([pkgpath, rpm.filename])
+            files.append((url, filepath, rpm.size, rpm.payloadhash))
 
-        async def urlretrieve_async(url, filepath):
-            timeout = aiohttp.ClientTimeout(total=None, sock_read=5, sock_connect=5)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(url) as response:
-                    try:
-                        assert response.status == 200
-                    except AssertionError:
-                        self.logger.error(
-                            f"Server response code :{str(response.status)} for package {pkg}. URL - {url}"
-                        )
-                        return 1
-
-                    with open(filepath, "wb") as f:
-                        while True:
-                            chunk = await response.content.read(1024)
-                            if not chunk:
-                                break
-                            f.write(chunk)
-            return 0
-
-        nvra = nvra_generator(tag, pkg)
-
-        if nvra is not None:
-            for i in nvra:
-                (n, v, r, a) = i
-                pkgname = "%s-%s-%s.%s.rpm" % (n, v, r, a)
-                url = "/".join([topurl, pkg, v, r, a, pkgname])
-                filepath = "/".join([pkgpath, pkgname])
-                ret = await urlretrieve_async(url, filepath)
-                if ret:
-                    return None
-
-            return pkgpath
-        else:
-            return None
+        return pkgpath, files
 
-    def import_package(self, session: KojiSession, pkgdir, tag, prune_dir: bool = True):
-        """Download and import package to koji instance
-        :param pkgdir: str - Path to directory where packages are downloaded
-        :param tag: str - Tag name under which package will be tagged
-        :param prune_dir: bool - If pkgdir should be deleted to save disk space
+    async def fetch_rpm(self, url: str, filepath: str, size: int, payloadhash: str):
+        """Place a single RPM at filepath from the RPM store or the network
+        :return bool - True on success
         """
+        metrics = Metrics()
+        # Store lookups and additions link or copy files, off the event loop
+        if self.store is not None and await asyncio.to_thread(self.store.get, payloadhash, filepath):
+            self.logger.info(f"Using cached {os.path.basename(filepath)}")
+            metrics.inc("rpm_store_hits")
+            return True
 
-        def unique_path(prefix):
-            """Create a unique path fragment by appending a path component to prefix."""
-            return "%s/%r.%s" % (
-                prefix,
-                time.time(),
-                "".join([random.choice(string.ascii_letters) for _ in range(8)]),
-            )
+        with metrics.timer("phase", phase="download"):
+            if not await self.downloader.fetch(url, filepath, size):
+                return False
 
-        def prune():
-            try:
-                shutil.rmtree(pkgdir)
-                self.logger.info(f"Removing directory {pkgdir}")
-            except PermissionError:
-                self.logger.warning(f"Permission error removing directory {pkgdir}")
-
-        if not os.path.exists(pkgdir):
-            self.logger.critical(f"Directory {pkgdir} does not exist")
-            return 1
-
-        if session.getSessionInfo() is None:
-            if not session.auth_login():
-                self.logger.critical("You must be logged in to import packages")
-                return 1
-
-        for rpm in list(os.listdir(pkgdir)):
-            localfile = "/".join([pkgdir, rpm])
-            serverdir = unique_path("app-import")
-            # uploadWrapper - undocumented API
-            session.uploadWrapper(localfile=localfile, path=serverdir)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.put, payloadhash, filepath, size)
+        return True
+
+    def prune(self, pkgdir):
+        try:
+            shutil.rmtree(pkgdir)
+            self.logger.info(f"Removing directory {pkgdir}")
+        except PermissionError:
+            self.logger.warning(f"Permission error removing directory {pkgdir}")
+
+    def tag_imported(self, session: KojiSession, tag, build_ids) -> bool:
+        """Tag the builds created by an import under tag, in a single multicall
+        :param build_ids: Iterable - Build ids returned by importRPM
+        :return bool - True if every build was tagged
+        """
+        calls = dict()
+        with session.multicall(strict=False) as m:
+            for build_id in set(build_ids):
+                calls[build_id] = m.tagBuildBypass(tag, build=build_id)
+
+        success = True
+        for build_id, call in calls.items():
             try:
-                session.importRPM(path=serverdir, basename=rpm)
-                self.logger.info(f"Imported {rpm}")
+                call.result
+                self.logger.info(f"Tagging build {build_id} under {tag}")
             except koji.GenericError as e:
                 self.logger.error(
-                    f"Error importing package {os.path.basename(pkgdir)}: {str(e).splitlines()[-1]}"
+                    f"Error tagging build {build_id} under {tag}: {str(e).splitlines()[-1]}"
                 )
-                prune()
-                return 1
-
-        untagged = session.untaggedBuilds()
-
-        # Tag imported packages
-        for rpm in untagged:
-            session.tagBuildBypass(tag, build=rpm)
-            self.logger.info(f"Tagging build {rpm} under {tag}")
-
-        self.logger.info(f"Successfully imported package : {os.path.basename(pkgdir)}")
-
-        # Prune downloads after uploading to save disk space
-        if prune_dir:
-            prune()
-
-        return 0
+                success = False
+        return success
 
     def is_available(self, session: KojiSession, tag: str, pkg: str):
-        builds = session.getLatestRPMS(tag, pkg)
-        if any(builds):
+        builds = self.latest_rpms(session, tag, pkg)
+        if builds:
             return tag
         else:
-            inherit = session.getInheritanceData(tag=tag)
-            parent = list(nestedseek(inherit, "name"))[0]
-            if not any(parent):
+            inherit = None
+            if self._from_snapshot(session):
+                inherit = self.snapshot.inheritance_data(tag)  # type: ignore
+            if inherit is None:
+                inherit = TagInheritance.parse(session.getInheritanceData(tag=tag))
+            parent = TagInheritance.parent(inherit)
+            if not parent:
                 return None
             else:
-                builds = session.getLatestRPMS(parent, pkg)
+                builds = self.latest_rpms(session, parent, pkg)
 
-            if not any(builds):
+            if not builds:
                 return None
             else:
                 self.logger.info(
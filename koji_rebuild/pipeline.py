@@ -0,0 +1,130 @@
+import os
+import asyncio
+import logging
+import koji
+from .session import AsyncKojiSession
+from .package import PackageHelper, unique_path
+from .metrics import Metrics
+from .trace import Tracer
+
+
+class ImportPipeline:
+    """Streams the RPMs of a package from topurl into the downstream hub.
+
+    Every RPM is uploaded as soon as it is downloaded, on a session of the
+    downstream pool, while the other RPMs are still in transfer. importRPM
+    runs only once every RPM of the package is uploaded, one RPM at a time
+    so the build entry is created once. A package with an RPM that failed to
+    download or upload is not imported at all, the hub is never left with a
+    partial build.
+    """
+
+    logger = logging.getLogger("importpipeline")
+
+    def __init__(
+        self,
+        pkgutil: PackageHelper,
+        downstream: AsyncKojiSession,
+        workers: int = 4,
+        blocksize: int = 1048576,
+    ) -> None:
+        """
+        :param pkgutil: PackageHelper - Helper used to locate and download RPMs
+        :param downstream: AsyncKojiSession - Logged in downstream session
+        :param workers: int - Concurrent uploads across all packages
+        :param blocksize: int - uploadWrapper chunk size in bytes
+        """
+        self.pkgutil = pkgutil
+        self.downstream = downstream
+        self.workers = workers
+        self.blocksize = blocksize
+        self._uploads = asyncio.Semaphore(workers)
+
+    async def _upload(self, pkg: str, filepath: str) -> str:
+        async with self._uploads:
+            serverdir = unique_path("app-import")
+            # uploadWrapper - undocumented API
+            with (
+                Metrics().timer("phase", phase="upload"),
+                Tracer().span("upload", pkg, rpm=os.path.basename(filepath)),
+            ):
+                await self.downstream.uploadWrapper(
+                    localfile=filepath,
+                    path=serverdir,
+                    blocksize=self.blocksize,
+                )
+            return serverdir
+
+    async def _stage(self, pkg: str, file: tuple) -> tuple | None:
+        """Download and upload one RPM
+        :return tuple - (server directory, RPM file name), None if the download failed
+        """
+        url, filepath, size, payloadhash = file
+        with Tracer().span("download", pkg, rpm=os.path.basename(filepath), size=size):
+            if not await self.pkgutil.fetch_rpm(url, filepath, size, payloadhash):
+                return None
+        serverdir = await self._upload(pkg, filepath)
+        return serverdir, os.path.basename(filepath)
+
+    async def _import(self, pkg: str, uploads: list, build_ids: set) -> bool:
+        for serverdir, rpm in uploads:
+            try:
+                with (
+                    Metrics().timer("phase", phase="import"),
+                    Tracer().span("import", pkg, rpm=rpm),
+                ):
+                    rpminfo = await self.downstream.importRPM(path=serverdir, basename=rpm)
+                build_ids.add(rpminfo["build_id"])
+                self.logger.info(f"Imported {rpm}")
+            except koji.GenericError as e:
+                self.logger.error(
+                    f"Error importing package {pkg}: {str(e).splitlines()[-1]}"
+                )
+                return False
+        return True
+
+    async def run(self, upstream: AsyncKojiSession, tag: str, pkg: str, dest_tag: str) -> int:
+        """Download, upload and import all RPMs of pkg, then tag the build
+        :param upstream: AsyncKojiSession - Upstream sessions the RPMs are listed from
+        :param tag: str - Upstream tag of the package
+        :param pkg: str - Package name
+        :param dest_tag: str - Downstream tag for the imported build
+        :return int - 0 on success, 1 on failure
+        """
+        res = await upstream.run(self.pkgutil.rpm_files, upstream.session, tag, pkg)
+        if res is None:
+            return 1
+        pkgdir, files = res
+
+        if not self.downstream.session.logged_in:
+            if not await self.downstream.run(self.downstream.session.auth_login):
+                self.logger.critical("You must be logged in to import packages")
+                return 1
+
+        staged = await asyncio.gather(
+            *(self._stage(pkg, f) for f in files), return_exceptions=True
+        )
+
+        downloaded = True
+        for result in staged:
+            if isinstance(result, BaseException):
+                self.logger.error(f"Error uploading package {pkg}: {result}")
+            elif result is None:
+                downloaded = False
+
+        ret = 1
+        build_ids = set()
+        if all(isinstance(r, tuple) for r in staged) and await self._import(pkg, staged, build_ids):
+            with Tracer().span("tag", pkg, tag=dest_tag, build_ids=sorted(build_ids)):
+                tagged = await self.downstream.run(
+                    self.pkgutil.tag_imported, self.downstream.session, dest_tag, build_ids
+                )
+            if tagged:
+                self.logger.info(f"Successfully imported package : {pkg}")
+                ret = 0
+
+        # Partial downloads are kept for a retry to resume
+        if downloaded:
+            self.pkgutil.prune(pkgdir)
+
+        return ret
@@ -0,0 +1,282 @@
+import json
+import time
+import heapq
+import logging
+import koji
+from .scheduler import DependencyGraph, BuildScheduler
+from .configuration import Configuration
+from .util import error
+
+
+class BuildPlan:
+    """Everything a run would decide, resolved ahead of it with bulk queries.
+
+    For each package the plan holds the upstream tag it is found in, parent
+    tag fallback included, its NVR, and the action the run takes: skip it as
+    already built downstream, import its noarch RPMs, build it from its SCM
+    URL, or fail it as unavailable. Dependencies between packages and the
+    expected build durations are kept along, so the run can be scheduled and
+    its length estimated without asking either hub again.
+
+    Queries are the ones a run starts with: the upstream snapshot, the
+    downstream build index, the downstream package list, the build history of
+    the packages to build and the downstream host count.
+    """
+
+    logger = logging.getLogger("plan")
+
+    BUILD = "build"
+    IMPORT = "import"
+    SKIP = "skip"
+    UNAVAILABLE = "unavailable"
+
+    def __init__(self, header: dict, packages: list[dict], hosts: int | None, window: int) -> None:
+        """
+        :param header: dict - Tags the plan was made for; executing it under
+                              other tags is refused
+        :param packages: list - Package entries in buildlist order
+        :param hosts: int - Downstream build hosts when the plan was made
+        :param window: int - Builds the run keeps in flight at most
+        """
+        self.header = header
+        # package name -> entry
+        self.packages: dict[str, dict] = {entry["name"]: entry for entry in packages}
+        self.hosts = hosts
+        self.window = window
+
+    @classmethod
+    def resolve(cls, rebuild, packages: list):
+        """Decide the action of every package the way Rebuild would
+        :param rebuild: Rebuild - Provides the sessions, snapshot and build index
+        :param packages: list - Package names from the buildlist
+        """
+        pkgbuilds = Configuration().settings["package_builds"]
+        upstream, downstream = rebuild.upstream, rebuild.downstream
+        pkgutil = rebuild.pkgutil
+        packages = list(dict.fromkeys(packages))
+
+        rebuild.prefetch(packages)
+        rebuild.load_index()
+        listed = {
+            entry["package_name"]
+            for entry in downstream.listPackages(tagID=rebuild.tag_down, inherited=True) or []
+        }
+        store = pkgutil.store
+
+        entries = list()
+        for pkg in packages:
+            entry = {"name": pkg, "action": cls.UNAVAILABLE, "tag": None, "nvr": None}
+            entries.append(entry)
+            try:
+                tag = pkgutil.is_available(upstream, rebuild.tag_up, pkg)
+            except (koji.GenericError, IndexError):
+                tag = None
+            if tag is None:
+                continue
+
+            rpms = pkgutil.latest_rpms(upstream, tag, pkg)
+            entry["tag"] = tag
+            entry["nvr"] = rpms.nvr
+            entry["listed"] = pkg in listed
+            if pkgbuilds["fasttrack"] and pkgutil.is_noarch(upstream, tag, pkg):
+                entry["action"] = cls.IMPORT
+                entry["rpms"] = rpms.to_response()
+                # RPMs still in the store are not downloaded again
+                entry["bytes"] = sum(
+                    rpm.size for rpm in rpms.rpms
+                    if store is None or rpm.payloadhash not in store
+                )  # fmt: skip
+            else:
+                entry["action"] = cls.BUILD
+                entry["scmurl"] = pkgutil.getSCM_URL(upstream, tag, pkg)
+
+        nvrs = [e["nvr"] for e in entries if e["nvr"] is not None]
+        built = cls._built(rebuild, nvrs)
+        for entry in entries:
+            if entry["nvr"] in built:
+                entry["action"] = cls.SKIP
+                entry.pop("rpms", None)
+                entry.pop("bytes", None)
+                entry.pop("scmurl", None)
+
+        builds = [e["name"] for e in entries if e["action"] == cls.BUILD]
+        durations = rebuild.snapshot.build_durations(builds) if any(builds) else dict()
+        for entry in entries:
+            if entry["action"] == cls.BUILD:
+                entry["duration"] = durations.get(entry["name"])
+
+        if pkgbuilds["dependency_order"]:
+            graph = DependencyGraph.from_snapshot(rebuild.snapshot, rebuild.tag_up, packages)
+            for entry in entries:
+                entry["requires"] = sorted(graph.requires[entry["name"]])
+
+        try:
+            hosts = downstream.get_total_hosts()
+        except koji.GenericError as e:
+            cls.logger.warning(f"Could not count downstream hosts: {str(e).splitlines()[-1]}")
+            hosts = None
+
+        window = pkgbuilds["max_tasks_limit"] if pkgbuilds["adaptive_tasks"] else pkgbuilds["max_tasks"]
+        header = {"upstream": rebuild.tag_up, "downstream": rebuild.tag_down}
+        return cls(header, entries, hosts, window)
+
+    @staticmethod
+    def _built(rebuild, nvrs: list) -> set:
+        """NVRs already built downstream, from the build index or one multicall"""
+        complete = koji.BUILD_STATES["COMPLETE"]
+        index = rebuild.index
+        known = [nvr for nvr in nvrs if index.loaded and index.known(nvr)]
+        built = {nvr for nvr in known if index.state(nvr) == complete}
+
+        calls = dict()
+        with rebuild.downstream.multicall(strict=False, batch=rebuild.snapshot.batch) as m:
+            for nvr in set(nvrs).difference(known):
+                calls[nvr] = m.getBuild(nvr)
+
+        for nvr, call in calls.items():
+            try:
+                if call.result is not None and call.result["state"] == complete:
+                    built.add(nvr)
+            except koji.GenericError as e:
+                rebuild.logger.warning(str(e).splitlines()[-1])
+        return built
+
+    def names(self) -> list[str]:
+        return list(self.packages)
+
+    def count(self, action: str) -> int:
+        return sum(1 for entry in self.packages.values() if entry["action"] == action)
+
+    def durations(self) -> dict:
+        """Expected duration of every build, packages without build history
+        ranked as an average build"""
+        known = [
+            e["duration"] for e in self.packages.values()
+            if e["action"] == self.BUILD and e.get("duration") is not None
+        ]  # fmt: skip
+        if not known:
+            return dict()
+        average = sum(known) / len(known)
+        return {
+            pkg: entry["duration"] if entry.get("duration") is not None else average
+            for pkg, entry in self.packages.items()
+            if entry["action"] == self.BUILD
+        }
+
+    def priorities(self) -> dict:
+        """Scheduler priorities under the configured priority order"""
+        if Configuration().settings["package_builds"]["priority"] != "duration":
+            return dict()
+        return self.durations()
+
+    def graph(self, packages: list | None = None) -> DependencyGraph:
+        """Dependency graph of the planned packages, limited to packages if given"""
+        graph = DependencyGraph(packages if packages is not None else self.names())
+        members = set(graph.packages)
+        for pkg in graph.packages:
+            graph.requires[pkg] = set(self.packages[pkg].get("requires", [])) & members
+        return graph
+
+    def estimate(self) -> float | None:
+        """Seconds until the last planned build finishes.
+
+        Builds are played out in the order the scheduler releases them, on as
+        many slots as the window allows and the downstream has hosts. Imports
+        and skips take no builder time.
+        :return float - None if no build history or host count is known
+        """
+        durations = self.durations()
+        if self.count(self.BUILD) and not durations:
+            return None
+        if not self.hosts:
+            return None
+
+        slots = max(1, min(self.window, self.hosts))
+        scheduler = BuildScheduler(self.graph(), self.priorities())
+        ready = [(scheduler.key(pkg), pkg) for pkg in scheduler.ready()]
+        heapq.heapify(ready)
+        # (finish time, package) of builds in flight
+        running: list[tuple[float, str]] = list()
+        clock = 0.0
+
+        while ready or running:
+            while ready and len(running) < slots:
+                _, pkg = heapq.heappop(ready)
+                heapq.heappush(running, (clock + durations.get(pkg, 0), pkg))
+            clock, pkg = heapq.heappop(running)
+            for child in scheduler.done(pkg):
+                heapq.heappush(ready, (scheduler.key(child), child))
+        return clock
+
+    def totals(self) -> dict:
+        return {
+            "packages": len(self.packages),
+            "builds": self.count(self.BUILD),
+            "imports": self.count(self.IMPORT),
+            "skips": self.count(self.SKIP),
+            "unavailable": self.count(self.UNAVAILABLE),
+            "download_bytes": sum(e.get("bytes", 0) for e in self.packages.values()),
+            "build_seconds": sum(self.durations().values()),
+            "hosts": self.hosts,
+            "window": self.window,
+            "eta": self.estimate(),
+        }
+
+    def summary(self, limit: int = 20) -> str:
+        """Human readable plan"""
+        totals = self.totals()
+        eta = totals["eta"]
+        lines = [
+            f"Plan for {self.header['upstream']} -> {self.header['downstream']}:",
+            f"  {totals['packages']:>7} packages",
+            f"  {totals['skips']:>7} already built downstream",
+            f"  {totals['imports']:>7} to import, {totals['download_bytes'] / 2**20:.1f} MiB to download",
+            f"  {totals['builds']:>7} to build, {totals['build_seconds'] / 3600:.1f} builder hours",
+            f"  {totals['unavailable']:>7} unavailable upstream",
+        ]
+        unavailable = [pkg for pkg, e in self.packages.items() if e["action"] == self.UNAVAILABLE]
+        for pkg in unavailable[:limit]:
+            lines.append(f"    {pkg}")
+        if len(unavailable) > limit:
+            lines.append(f"    ... {len(unavailable) - limit} more")
+
+        if eta is None:
+            lines.append("  ETA unknown, no build history or downstream hosts")
+        else:
+            lines.append(
+                f"  ETA {eta / 3600:.1f} hours on {min(self.window, self.hosts)} "  # type: ignore
+                f"of {self.hosts} downstream hosts"
+            )
+        return "\n".join(lines)
+
+    def save(self, path: str):
+        data = {
+            "plan": self.header,
+            "created": time.time(),
+            "hosts": self.hosts,
+            "window": self.window,
+            "totals": self.totals(),
+            "packages": list(self.packages.values()),
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1, default=str)
+        self.logger.info(f"Plan for {len(self.packages)} packages written to {path}")
+
+    @classmethod
+    def load(cls, path: str, header: dict):
+        """
+        :param path: str - Plan file written by save()
+        :param header: dict - Tags of the current configuration
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            error(f"Could not read plan {path}: {e}")
+
+        if data["plan"] != header:  # type: ignore
+            error(f"Plan {path} was made for {data['plan']}, not {header}")  # type: ignore
+
+        plan = cls(data["plan"], data["packages"], data["hosts"], data["window"])  # type: ignore
+        cls.logger.info(f"Loaded plan for {len(plan.packages)} packages from {path}")
+        return plan
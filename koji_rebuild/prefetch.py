@@ -0,0 +1,232 @@
+import logging
+import koji
+from .session import KojiSession
+from .cache import ResponseCache
+from .records import Build, LatestRPMs, TagInheritance
+
+
+class UpstreamSnapshot:
+    """Snapshot of upstream RPM and build info for a whole buildlist.
+
+    Responses are gathered in chunked multicall batches so that the per-package
+    queries of PackageHelper and Rebuild are answered locally instead of costing
+    one round trip each. If a ResponseCache is given, responses still valid
+    from a previous run are reused and only the rest is fetched from the hub.
+    """
+
+    logger = logging.getLogger("prefetch")
+
+    def __init__(
+        self,
+        session: KojiSession,
+        batch: int = 500,
+        cache: ResponseCache | None = None,
+    ) -> None:
+        self.session = session
+        self.batch = batch
+        self.cache = cache
+        # (tag, pkg) -> LatestRPMs or the error raised for it
+        self.rpms = dict()
+        # build_id -> Build
+        self.builds = dict()
+        # tag -> list of TagInheritance
+        self.inheritance = dict()
+
+    def _cached(self, method: str, key):
+        if self.cache is None:
+            return None
+        return self.cache.get(method, key)
+
+    def _fetch_latest(self, tag: str, packages: list):
+        if self.cache is not None:
+            self.cache.validate_tag(self.session, tag)
+
+        calls = dict()
+        with self.session.multicall(strict=False, batch=self.batch) as m:
+            for pkg in packages:
+                res = self._cached("getLatestRPMS", [tag, pkg])
+                if res is not None:
+                    self.rpms[(tag, pkg)] = LatestRPMs.from_response(res)
+                else:
+                    calls[pkg] = m.getLatestRPMS(tag=tag, package=pkg)
+
+        fetched = list()
+        for pkg, call in calls.items():
+            try:
+                self.rpms[(tag, pkg)] = LatestRPMs.from_response(call.result)
+                fetched.append(([tag, pkg], call.result))
+            except koji.GenericError as e:
+                self.rpms[(tag, pkg)] = e
+
+        if self.cache is not None and any(fetched):
+            self.cache.put_many("getLatestRPMS", fetched, tag=tag)
+
+    def _inheritance(self, tag: str):
+        inherit = self._cached("getInheritanceData", tag)
+        if inherit is None:
+            inherit = self.session.getInheritanceData(tag=tag)
+            if self.cache is not None:
+                self.cache.put("getInheritanceData", tag, inherit, tag=tag)
+        self.inheritance[tag] = TagInheritance.parse(inherit)
+        return self.inheritance[tag]
+
+    def prefetch(self, tag: str, packages: list):
+        """Fetch latest RPMs, parent tag fallbacks and build info for packages
+        :param tag: str - Upstream tag
+        :param packages: list - Package names from the buildlist
+        """
+        self.logger.info(f"Prefetching upstream info for {len(packages)} packages")
+
+        self._fetch_latest(tag, packages)
+
+        missing = [
+            pkg
+            for pkg in packages
+            if not isinstance(self.rpms[(tag, pkg)], Exception)
+            and not self.rpms[(tag, pkg)]
+        ]
+
+        if any(missing):
+            parent = TagInheritance.parent(self._inheritance(tag))
+            if parent:
+                self._fetch_latest(parent, missing)
+
+        build_ids = set()
+        for res in self.rpms.values():
+            if not isinstance(res, Exception) and res.build_id is not None:
+                build_ids.add(res.build_id)
+
+        calls = dict()
+        with self.session.multicall(strict=False, batch=self.batch) as m:
+            for build_id in build_ids:
+                res = self._cached("getBuild", build_id)
+                if res is not None:
+                    self.builds[build_id] = Build.from_dict(res)
+                else:
+                    calls[build_id] = m.getBuild(buildInfo=build_id)
+
+        fetched = list()
+        for build_id, call in calls.items():
+            try:
+                if call.result is not None:
+                    self.builds[build_id] = Build.from_dict(call.result)
+                fetched.append((build_id, call.result))
+            except koji.GenericError as e:
+                self.logger.warning(str(e).splitlines()[-1])
+
+        if self.cache is not None and any(fetched):
+            self.cache.put_many("getBuild", fetched)
+
+        self.logger.info(
+            f"Prefetched {len(self.rpms)} package entries and {len(self.builds)} builds"
+        )
+
+    def latest_rpms(self, tag: str, pkg: str) -> LatestRPMs | None:
+        """Return snapshot getLatestRPMS response, None if not prefetched.
+        Raises the hub error recorded for the package, if any."""
+        res = self.rpms.get((tag, pkg))
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    def nvrs(self) -> list[str]:
+        """Upstream NVRs of every package found"""
+        return [
+            res.nvr for res in self.rpms.values()
+            if not isinstance(res, Exception) and res and res.nvr
+        ]  # fmt: skip
+
+    def resolved_rpms(self, tag: str, pkg: str) -> tuple:
+        """RPMs of the latest build of pkg under tag, or under the parent tag it
+        falls back to. Empty if the package was not found."""
+        tags = [tag]
+        parent = TagInheritance.parent(self.inheritance.get(tag))
+        if parent:
+            tags.append(parent)
+
+        for t in tags:
+            res = self.rpms.get((t, pkg))
+            if res is not None and not isinstance(res, Exception) and res:
+                return res.rpms
+        return ()
+
+    def rpm_deps(self, rpm_ids: list, dep_type: int) -> dict:
+        """Fetch dependency names of type dep_type for RPMs in batched multicalls
+        :return dict - rpm id to list of dependency names
+        """
+        deps = dict()
+        calls = dict()
+        with self.session.multicall(strict=False, batch=self.batch) as m:
+            for rpm_id in rpm_ids:
+                res = self._cached("getRPMDeps", [rpm_id, dep_type])
+                if res is not None:
+                    deps[rpm_id] = res
+                else:
+                    calls[rpm_id] = m.getRPMDeps(rpm_id, depType=dep_type)
+
+        fetched = list()
+        for rpm_id, call in calls.items():
+            try:
+                deps[rpm_id] = [dep["name"] for dep in call.result]
+                fetched.append(([rpm_id, dep_type], deps[rpm_id]))
+            except koji.GenericError as e:
+                self.logger.warning(str(e).splitlines()[-1])
+                deps[rpm_id] = []
+
+        if self.cache is not None and any(fetched):
+            self.cache.put_many("getRPMDeps", fetched)
+
+        return deps
+
+    def build_durations(self, packages: list, samples: int = 5) -> dict:
+        """Mean duration of the last completed upstream builds of each package
+        :param samples: int - Number of recent builds averaged per package
+        :return dict - package name to seconds, packages without history left out
+        """
+        history = dict()
+        calls = dict()
+        with self.session.multicall(strict=False, batch=self.batch) as m:
+            for pkg in packages:
+                res = self._cached("listBuilds", [pkg, samples])
+                if res is not None:
+                    history[pkg] = res
+                else:
+                    calls[pkg] = m.listBuilds(
+                        packageID=pkg,
+                        state=koji.BUILD_STATES["COMPLETE"],
+                        queryOpts={"order": "-build_id", "limit": samples},
+                    )
+
+        fetched = list()
+        for pkg, call in calls.items():
+            try:
+                history[pkg] = [
+                    b["completion_ts"] - b["start_ts"]
+                    for b in call.result
+                    if b.get("start_ts") is not None and b.get("completion_ts") is not None
+                ]
+                fetched.append(([pkg, samples], history[pkg]))
+            except koji.GenericError as e:
+                self.logger.warning(str(e).splitlines()[-1])
+
+        if self.cache is not None and any(fetched):
+            self.cache.put_many("listBuilds", fetched)
+
+        return {pkg: sum(d) / len(d) for pkg, d in history.items() if d}
+
+    def build(self, build_id: int) -> Build | None:
+        return self.builds.get(build_id)
+
+    def inheritance_data(self, tag: str) -> list | None:
+        return self.inheritance.get(tag)
+
+    def list_packages(self, tag: str):
+        """listPackages for tag, served from the cache while the tag is unchanged"""
+        if self.cache is not None:
+            self.cache.validate_tag(self.session, tag)
+        res = self._cached("listPackages", tag)
+        if res is None:
+            res = self.session.listPackages(tagID=tag)
+            if self.cache is not None and res is not None:
+                self.cache.put("listPackages", tag, res, tag=tag)
+        return res
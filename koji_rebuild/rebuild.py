@@ -1,12 +1,23 @@
-from .session import KojiSession
-from .tasks import TaskState, TaskWatcher
+from .session import KojiSession, AsyncKojiSession
+from .tasks import TaskState, TaskWatcher, TaskPoller
 from .package import PackageHelper
+from .prefetch import UpstreamSnapshot
+from .cache import ResponseCache
+from .journal import RunJournal
+from .index import BuildIndex
+from .download import Downloader
+from .rpmcache import RPMStore
+from .pipeline import ImportPipeline
 from .configuration import Configuration
+from .metrics import Metrics
+from .trace import Tracer
+from .cassette import Cassette
+from .plan import BuildPlan
+from .records import Build, LatestRPMs
 import logging
-from .util import nestedseek, error
+from .util import error
 from enum import IntEnum
 import koji
-import asyncio
 
 
 class BuildState(IntEnum):
@@ -20,113 +31,287 @@ class BuildState(IntEnum):
 class Rebuild:
     logger = logging.getLogger("rebuild")
 
-    def __init__(self, upstream: KojiSession, downstream: KojiSession) -> None:
+    def __init__(
+        self,
+        upstream: KojiSession,
+        downstream: KojiSession,
+        journal: RunJournal | None = None,
+    ) -> None:
         try:
             self.settings = Configuration().settings
         except AttributeError:
             error("Configuration not initialized!")
         self.upstream = upstream
         self.downstream = downstream
+        self.journal = journal
+        workers = self.settings["package_builds"]["rpc_workers"]
+        self.aupstream = AsyncKojiSession(upstream, workers)
+        self.adownstream = AsyncKojiSession(downstream, workers)
+        self.poller = TaskPoller(
+            self.adownstream,
+            min_interval=self.settings["package_builds"]["poll_interval_min"],
+            max_interval=self.settings["package_builds"]["poll_interval_max"],
+        )
         self.tag_up = upstream.instance["tag"]
         self.tag_down = downstream.instance["tag"]
         self.fasttrack = self.settings["package_builds"]["fasttrack"]
-        self.pkgutil = PackageHelper()
+        pkgbuilds = self.settings["package_builds"]
+        cache = None
+        # A cassette has to see every upstream call to replay the run on its own
+        if pkgbuilds["cache_ttl"] and not Cassette().enabled:
+            cache = ResponseCache(
+                "/".join([pkgbuilds["download_dir"], ".kojicache.sqlite"]),
+                ttl=pkgbuilds["cache_ttl"],
+            )
+        self.snapshot = UpstreamSnapshot(
+            upstream, batch=pkgbuilds["prefetch_batch"], cache=cache
+        )
+        downloader = Downloader(
+            workers=pkgbuilds["download_workers"],
+            chunk_size=pkgbuilds["download_chunk_size"],
+            retries=pkgbuilds["download_retries"],
+        )
+        store = None
+        if pkgbuilds["rpm_cache_size"]:
+            store = RPMStore(
+                "/".join([pkgbuilds["download_dir"], ".store"]),
+                budget=pkgbuilds["rpm_cache_size"],
+            )
+        self.pkgutil = PackageHelper(self.snapshot, downloader, store)
+        self.pipeline = ImportPipeline(
+            self.pkgutil,
+            self.adownstream,
+            workers=pkgbuilds["upload_workers"],
+            blocksize=pkgbuilds["upload_blocksize"],
+        )
+        self.index = BuildIndex()
+        self.plan: BuildPlan | None = None
 
         try:
-            if self.downstream.getSessionInfo() is None:
+            if not self.downstream.logged_in:
                 self.downstream.auth_login()
         except koji.GenericError:
             raise
 
-    def nvr_clash(self, pkg):
-        builds = self.upstream.getLatestRPMS(self.tag_up, pkg)
-        if any(builds):
-            nvr = list(nestedseek(builds, "nvr"))[0]
-        else:
-            nvr = None
+    def prefetch(self, packages: list):
+        """Gather upstream metadata for all packages in batched multicalls"""
+        try:
+            self.snapshot.prefetch(self.tag_up, packages)
+        except koji.GenericError as e:
+            self.logger.warning(
+                f"Upstream prefetch failed, falling back to per-package queries: {str(e).splitlines()[-1]}"
+            )
+
+    def use_plan(self, plan: BuildPlan):
+        """Take the decisions of a saved plan instead of querying the hubs"""
+        self.plan = plan
+        for pkg, entry in plan.packages.items():
+            if entry["action"] == BuildPlan.IMPORT:
+                self.snapshot.rpms[(entry["tag"], pkg)] = LatestRPMs.from_response(entry["rpms"])
+
+    async def close(self):
+        await self.pkgutil.downloader.close()
+        self.aupstream.shutdown()
+        self.adownstream.shutdown()
+        if self.snapshot.cache is not None:
+            self.snapshot.cache.close()
+        # Saved again for the call number the hub has seen last
+        self.downstream.save_session()
+
+    def load_index(self):
+        """Index builds already tagged downstream for network free clash checks"""
+        try:
+            self.index.load(self.downstream, self.tag_down)
+        except koji.GenericError as e:
+            self.logger.warning(
+                f"Could not index downstream builds, checking each package instead: {str(e).splitlines()[-1]}"
+            )
+            return
+
+        try:
+            self.index.confirm(self.downstream, self.snapshot.nvrs(), self.snapshot.batch)
+        except koji.GenericError as e:
+            self.logger.warning(
+                f"Could not confirm untagged builds, checking them one by one: {str(e).splitlines()[-1]}"
+            )
+
+    async def upstream_nvr(self, pkg, tag):
+        builds = await self.aupstream.run(
+            self.pkgutil.latest_rpms, self.upstream, tag, pkg
+        )
+        return builds.nvr if builds else None
+
+    async def _index_build(self, pkg, tag, result):
+        if result == BuildState.COMPLETE:
+            nvr = await self.upstream_nvr(pkg, tag)
+            if nvr is not None:
+                self.index.add(nvr, BuildState.COMPLETE)
+
+    async def nvr_clash(self, pkg, tag):
+        with Tracer().span("clash check", pkg, tag=tag) as span:
+            clash = await self._nvr_clash(pkg, tag, span.args)
+            span.args["clash"] = clash
+        return clash
+
+    async def _nvr_clash(self, pkg, tag, attrs: dict):
+        nvr = await self.upstream_nvr(pkg, tag)
+        attrs["nvr"] = nvr
+        if nvr is not None and self.index.loaded and self.index.known(nvr):
+            return self.index.state(nvr) == BuildState.COMPLETE
         if nvr is not None:
-            builds = self.downstream.getBuild(nvr)
-            if builds is not None and not any(builds):
+            info = await self.adownstream.getBuild(nvr)
+            if not info:
                 return False
-            else:
-                status = list(nestedseek(builds, "state"))
-                if any(status) and status[0] == BuildState.COMPLETE:
-                    return True
-                else:
-                    return False
+            return Build.from_dict(info).state == BuildState.COMPLETE
         else:
             return False
 
-    async def fetch_pkg(self, pkg):
-        pkgpath = await self.pkgutil.retrieveRPMs(self.upstream, self.tag_up, pkg)
-
-        if pkgpath:
-            task_import = asyncio.create_task(
-                asyncio.to_thread(
-                    self.pkgutil.import_package, self.downstream, pkgpath, self.tag_down
-                )
-            )
-            ret = await task_import
-            result = BuildState.FAILED if ret else BuildState.COMPLETE
-        else:
-            result = BuildState.FAILED
+    async def fetch_pkg(self, pkg, tag):
+        ret = await self.pipeline.run(self.aupstream, tag, pkg, self.tag_down)
+        result = BuildState.FAILED if ret else BuildState.COMPLETE
 
         if result == BuildState.FAILED:
             self.logger.info(f"Failed to import package {pkg}")
         return result
 
-    async def build_with_scm(self, pkg):
+    async def build_with_scm(self, pkg, tag, scmurl=None, expected=None, lookup=True):
+        """
+        :param lookup: bool - Query upstream for the SCM URL and expected
+                              duration if not given, off when running a plan
+        """
+        tracer = Tracer()
         result = BuildState.OPEN
         task_id = -1
-        scmurl = self.pkgutil.getSCM_URL(self.upstream, self.tag_up, pkg)
+        if scmurl is None and not lookup:
+            self.logger.error(f"No SCM URL planned for package {pkg}")
+            return (pkg, task_id, BuildState.FAILED)
+        if scmurl is None:
+            with tracer.span("scm lookup", pkg, tag=tag) as span:
+                scmurl = await self.aupstream.run(
+                    self.pkgutil.getSCM_URL, self.upstream, tag, pkg
+                )
+                span.args["scmurl"] = scmurl
 
         if scmurl is not None:
-            task_id = self.downstream.build(
-                src=scmurl, target=self.downstream.instance["target"]
-            )
-            task_watcher = TaskWatcher(self.downstream, task_id)
-            res = await task_watcher.watch_task()
+            target = self.downstream.instance["target"]
+            with tracer.span("submit", pkg, target=target) as span:
+                task_id = await self.adownstream.build(src=scmurl, target=target)
+                span.args["task_id"] = task_id
+            if self.journal is not None:
+                self.journal.record(pkg, RunJournal.SUBMITTED, task_id)
+            if expected is None and lookup:
+                expected = await self.aupstream.run(
+                    self.pkgutil.build_duration, self.upstream, tag, pkg
+                )
+            task_watcher = TaskWatcher(self.poller, task_id, expected)
+            with Metrics().timer("phase", phase="build"):
+                with tracer.span("watch", pkg, task_id=task_id, expected=expected) as span:
+                    result = self._build_state(await task_watcher.watch_task())
+                    span.args["result"] = result.name
 
-            if res == TaskState.CLOSED:
-                result = BuildState.COMPLETE
-            elif res == TaskState.CANCELLED:
-                result = BuildState.CANCELLED
-            elif res == TaskState.FAILED:
-                result = BuildState.FAILED
+        return (pkg, task_id, result)
+
+    def _build_state(self, res: int) -> BuildState:
+        if res == TaskState.CLOSED:
+            return BuildState.COMPLETE
+        elif res == TaskState.CANCELLED:
+            return BuildState.CANCELLED
+        elif res == TaskState.FAILED:
+            return BuildState.FAILED
+        return BuildState.OPEN
 
+    async def rewatch(self, pkg, task_id) -> tuple[str, int, int]:
+        """Wait on a build submitted by a previous run instead of resubmitting it"""
+        self.logger.info(f"Resuming watch on package {pkg} build task {task_id}")
+        task_watcher = TaskWatcher(self.poller, task_id)
+        with Tracer().span("watch", pkg, task_id=task_id, resumed=True) as span:
+            result = self._build_state(await task_watcher.watch_task())
+            span.args["result"] = result.name
         return (pkg, task_id, result)
 
+    async def add_to_tag(self, pkg):
+        """Add pkg to the package list of the downstream tag"""
+        owner = self.downstream.user or await self.adownstream.getLoggedInUser()
+        await self.adownstream.packageListAdd(
+            taginfo=self.tag_down,
+            pkginfo=pkg,
+            owner=owner["name"],
+        )
+
+    async def planned_package(self, pkg, entry: dict) -> tuple[str, int, int]:
+        """Carry out the planned action for pkg"""
+        task_id = -1
+        action = entry["action"]
+        tag = entry["tag"]
+
+        if action == BuildPlan.UNAVAILABLE:
+            self.logger.critical(f"Package: {pkg} is unavailable under tag {self.tag_up}")
+            return (pkg, task_id, BuildState.FAILED)
+
+        if action == BuildPlan.SKIP:
+            self.logger.info(f"Package {pkg} is already built")
+            return (pkg, task_id, BuildState.COMPLETE)
+
+        if not entry.get("listed", True):
+            with Tracer().span("package list", pkg, tag=self.tag_down):
+                await self.add_to_tag(pkg)
+
+        if action == BuildPlan.IMPORT:
+            self.logger.info(f"Attempting to import package {pkg}")
+            try:
+                result = await self.fetch_pkg(pkg, tag)
+            except TimeoutError:
+                self.logger.exception(f"Timed out while fetching package {pkg}")
+                return (pkg, task_id, BuildState.FAILED)
+            if result == BuildState.COMPLETE:
+                self.index.add(entry["nvr"], BuildState.COMPLETE)
+            return (pkg, task_id, result)
+
+        self.logger.info(f"Building package {pkg}")
+        response = await self.build_with_scm(
+            pkg, tag, scmurl=entry["scmurl"], expected=entry.get("duration"), lookup=False
+        )
+        if response[2] == BuildState.COMPLETE:
+            self.index.add(entry["nvr"], BuildState.COMPLETE)
+        return response
+
     async def rebuild_package(self, pkg) -> tuple[str, int, int]:
+        if self.plan is not None and pkg in self.plan.packages:
+            return await self.planned_package(pkg, self.plan.packages[pkg])
+
+        tracer = Tracer()
         task_id = -1
         result: BuildState = BuildState.OPEN
 
-        tag = self.pkgutil.is_available(self.upstream, self.tag_up, pkg)
+        with tracer.span("availability", pkg, tag=self.tag_up) as span:
+            tag = await self.aupstream.run(
+                self.pkgutil.is_available, self.upstream, self.tag_up, pkg
+            )
+            span.args["found_in"] = tag
 
         if tag is None:
             self.logger.critical(
                 f"Package: {pkg} is unavailable under tag {self.tag_up}"
             )
             return (pkg, task_id, BuildState.FAILED)
-        else:
-            self.tag_up = tag
 
         # If package doesn't exist under tag, add it to tag
-        if not self.downstream.checkTagPackage(self.tag_down, pkg):
-            self.downstream.packageListAdd(
-                taginfo=self.tag_down,
-                pkginfo=pkg,
-                owner=self.downstream.getLoggedInUser()["name"],
-            )
+        with tracer.span("package list", pkg, tag=self.tag_down):
+            if not await self.adownstream.checkTagPackage(self.tag_down, pkg):
+                await self.add_to_tag(pkg)
 
-        if self.nvr_clash(pkg):
+        if await self.nvr_clash(pkg, tag):
             self.logger.info(f"Package {pkg} is already built")
             return (pkg, task_id, BuildState.COMPLETE)
 
         if self.fasttrack:
-            if self.pkgutil.is_noarch(self.upstream, self.tag_up, pkg):
+            if await self.aupstream.run(
+                self.pkgutil.is_noarch, self.upstream, tag, pkg
+            ):
                 self.logger.info(f"Attempting to import package {pkg}")
                 try:
-                    result = await self.fetch_pkg(pkg)
+                    result = await self.fetch_pkg(pkg, tag)
+                    await self._index_build(pkg, tag, result)
                     return (pkg, task_id, result)
                 except TimeoutError:
                     self.logger.exception(f"Timed out while fetching package {pkg}")
@@ -134,5 +319,6 @@ class Rebuild:
 
         self.logger.info(f"Building package {pkg}")
 
-        response = await self.build_with_scm(pkg)
+        response = await self.build_with_scm(pkg, tag)
+        await self._index_build(pkg, tag, response[2])
         return response
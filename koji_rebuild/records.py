@@ -0,0 +1,169 @@
+import sys
+import dataclasses
+from dataclasses import dataclass
+
+
+# Hub responses are parsed once into these records. Only the fields the
+# rebuild reads are kept, in slots instead of a dict per entry, and the
+# strings repeated across a whole tag are interned, so a snapshot of a tag
+# with 100k+ RPMs stays small.
+
+
+@dataclass(slots=True)
+class RPM:
+    id: int
+    build_id: int
+    name: str
+    version: str
+    release: str
+    arch: str
+    size: int
+    payloadhash: str
+
+    @classmethod
+    def from_dict(cls, rpm: dict):
+        return cls(
+            rpm["id"],
+            rpm["build_id"],
+            rpm["name"],
+            sys.intern(rpm["version"]),
+            sys.intern(rpm["release"]),
+            sys.intern(rpm["arch"]),
+            rpm.get("size", 0),
+            rpm.get("payloadhash", ""),
+        )
+
+    @property
+    def nvr(self) -> str:
+        return f"{self.name}-{self.version}-{self.release}"
+
+    @property
+    def filename(self) -> str:
+        return f"{self.name}-{self.version}-{self.release}.{self.arch}.rpm"
+
+
+@dataclass(slots=True)
+class Build:
+    id: int
+    nvr: str | None
+    package_name: str | None
+    state: int | None
+    source: str | None = None
+    start_ts: float | None = None
+    completion_ts: float | None = None
+
+    @classmethod
+    def from_dict(cls, build: dict):
+        """
+        :param build: dict - getBuild response or a build of a getLatestRPMS response
+        """
+        return cls(
+            build.get("id", build.get("build_id")),  # type: ignore
+            build.get("nvr"),
+            build.get("package_name"),
+            build.get("state"),
+            build.get("source"),
+            build.get("start_ts"),
+            build.get("completion_ts"),
+        )
+
+    @property
+    def duration(self) -> float | None:
+        if not self.start_ts or not self.completion_ts:
+            return None
+        return self.completion_ts - self.start_ts
+
+
+@dataclass(slots=True)
+class Task:
+    id: int
+    state: int
+    method: str | None = None
+
+    @classmethod
+    def from_dict(cls, task: dict):
+        return cls(task["id"], task["state"], task.get("method"))
+
+
+@dataclass(slots=True)
+class TagInheritance:
+    """One parent link of a tag, in the order the hub ranks them"""
+
+    parent_id: int | None
+    name: str
+    priority: int = 0
+
+    @classmethod
+    def parse(cls, links: list | None) -> list:
+        """getInheritanceData response as records"""
+        return [
+            cls(link.get("parent_id"), link["name"], link.get("priority", 0))
+            for link in links or []
+        ]  # fmt: skip
+
+    @staticmethod
+    def parent(links: list | None) -> str | None:
+        """Name of the first parent tag, None if the tag has no parent"""
+        return links[0].name if links else None
+
+
+class LatestRPMs:
+    """getLatestRPMS response of one package: the RPMs of its latest build
+    and the build itself. Build id, NVR and the noarch check are read off
+    the parsed records instead of walking the raw response for each."""
+
+    __slots__ = ("rpms", "builds", "arches")
+
+    NOARCH = frozenset(["src", "noarch"])
+
+    def __init__(self, rpms: tuple[RPM, ...] = (), builds: tuple[Build, ...] = ()) -> None:
+        self.rpms = rpms
+        self.builds = builds
+        self.arches = frozenset(rpm.arch for rpm in rpms)
+
+    @classmethod
+    def from_response(cls, res: list | None):
+        """
+        :param res: list - [rpms, builds] as returned by getLatestRPMS
+        """
+        if not res:
+            return cls()
+        rpms, builds = res
+        return cls(
+            tuple(RPM.from_dict(rpm) for rpm in rpms),
+            tuple(Build.from_dict(build) for build in builds),
+        )
+
+    def to_response(self) -> list:
+        """Back to the getLatestRPMS layout, with the fields kept"""
+        return [
+            [dataclasses.asdict(rpm) for rpm in self.rpms],
+            [dict(dataclasses.asdict(build), build_id=build.id) for build in self.builds],
+        ]
+
+    def __bool__(self) -> bool:
+        return bool(self.rpms or self.builds)
+
+    @property
+    def build_id(self) -> int | None:
+        if self.rpms:
+            return self.rpms[0].build_id
+        if self.builds:
+            return self.builds[0].id
+        return None
+
+    @property
+    def nvr(self) -> str | None:
+        if self.builds and self.builds[0].nvr:
+            return self.builds[0].nvr
+        srpm = self.srpm
+        return srpm.nvr if srpm is not None else None
+
+    @property
+    def srpm(self) -> RPM | None:
+        return next((rpm for rpm in self.rpms if rpm.arch == "src"), None)
+
+    @property
+    def noarch(self) -> bool:
+        """True if no RPM is built for a specific arch"""
+        return self.arches <= self.NOARCH
@@ -0,0 +1,120 @@
+import os
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+
+class RPMStore:
+    """Content-addressed store of downloaded RPMs with a byte budget.
+
+    Files are keyed by the payload hash (sigmd5) koji reports for each RPM
+    and evicted least recently used first once the store outgrows its budget.
+    Package directories get hard links into the store, so pruning them after
+    an import leaves the cached copy in place.
+    """
+
+    logger = logging.getLogger("rpmstore")
+
+    def __init__(self, path: str, budget: int) -> None:
+        """
+        :param path: str - Store directory
+        :param budget: int - Maximum total size of stored files in bytes
+        """
+        self.path = path
+        self.budget = budget
+        self.size = 0
+        # payload hash -> file size, least recently used first
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = list()
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".rpm"):
+                    st = os.stat(os.path.join(root, name))
+                    found.append((st.st_mtime, name[: -len(".rpm")], st.st_size))
+
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.size += size
+
+        self.logger.info(f"RPM store {self.path}: {len(self.entries)} files, {self.size} bytes")
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".rpm")
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self.entries
+
+    def get(self, key: str, dest: str) -> bool:
+        """Place the stored file for key at dest
+        :return bool - False on a cache miss
+        """
+        if not key:
+            return False
+
+        with self._lock:
+            if key not in self.entries:
+                return False
+            self.entries.move_to_end(key)
+
+        src = self._file(key)
+        try:
+            os.utime(src)
+            _link(src, dest)
+        except FileNotFoundError:
+            with self._lock:
+                self.size -= self.entries.pop(key, 0)
+            return False
+        return True
+
+    def put(self, key: str, src: str, size: int | None = None):
+        """Add a downloaded file to the store and evict to stay within budget
+        :param size: int - Size koji reports for the RPM, a file of any other size is not stored
+        """
+        if not key or self.budget <= 0:
+            return
+
+        actual = os.path.getsize(src)
+        if size is not None and actual != size:
+            self.logger.warning(f"Not storing {src}: {actual} bytes, expected {size}")
+            return
+        size = actual
+        if size > self.budget:
+            return
+
+        dest = self._file(key)
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            _link(src, dest)
+            self.entries[key] = size
+            self.size += size
+
+            while self.size > self.budget:
+                old, old_size = self.entries.popitem(last=False)
+                try:
+                    os.remove(self._file(old))
+                except FileNotFoundError:
+                    pass
+                self.size -= old_size
+                self.logger.info(f"Evicted {old} from RPM store")
+
+
+def _link(src: str, dest: str):
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        # Different filesystem, or links not supported
+        shutil.copy2(src, dest)
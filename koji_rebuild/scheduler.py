@@ -0,0 +1,263 @@
+import heapq
+import logging
+import koji
+from .prefetch import UpstreamSnapshot
+
+
+class DependencyGraph:
+    """Build dependencies between packages of a buildlist.
+
+    Only dependencies on other packages of the buildlist are tracked; anything
+    else is expected to be available in the downstream buildroot already.
+    """
+
+    logger = logging.getLogger("scheduler")
+
+    def __init__(self, packages: list) -> None:
+        self.packages = list(dict.fromkeys(packages))
+        # package -> set of in-list packages it needs built first
+        self.requires: dict[str, set] = {pkg: set() for pkg in self.packages}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: UpstreamSnapshot, tag: str, packages: list):
+        """Resolve BuildRequires of the source RPMs against what the binary RPMs
+        of the listed packages provide.
+        :param snapshot: UpstreamSnapshot - Prefetched upstream metadata
+        :param tag: str - Upstream tag
+        :param packages: list - Package names from the buildlist
+        """
+        graph = cls(packages)
+
+        srpms = dict()
+        binaries = dict()
+        for pkg in graph.packages:
+            seen = set()
+            for rpm in snapshot.resolved_rpms(tag, pkg):
+                if rpm.arch == "src":
+                    srpms[rpm.id] = pkg
+                elif rpm.name not in seen:
+                    # Provides are the same across arches, one rpm per name is enough
+                    seen.add(rpm.name)
+                    binaries[rpm.id] = (pkg, rpm.name)
+
+        provider = dict()
+        for rpm_id, provides in snapshot.rpm_deps(
+            list(binaries), koji.DEP_PROVIDE
+        ).items():
+            pkg, name = binaries[rpm_id]
+            provider.setdefault(name, pkg)
+            for cap in provides:
+                provider.setdefault(cap, pkg)
+
+        for rpm_id, requires in snapshot.rpm_deps(
+            list(srpms), koji.DEP_REQUIRE
+        ).items():
+            pkg = srpms[rpm_id]
+            for cap in requires:
+                dep = provider.get(cap)
+                if dep is not None and dep != pkg:
+                    graph.requires[pkg].add(dep)
+
+        edges = sum(len(deps) for deps in graph.requires.values())
+        graph.logger.info(
+            f"Dependency graph: {len(graph.packages)} packages, {edges} in-list dependencies"
+        )
+        graph.break_cycles()
+        return graph
+
+    def break_cycles(self) -> list:
+        """Remove dependencies until the graph is acyclic.
+
+        Only dependencies within a strongly connected component, packages that
+        all need each other, are ever dropped; a dependency on a package
+        outside the cycle is kept. Whenever no package is free of pending
+        dependencies, every stuck component that waits on no other one has the
+        package with the fewest pending dependencies (earliest in buildlist
+        order on a tie) built before them. The result depends on the buildlist
+        only.
+        :return list - (package, dropped dependencies) tuples
+        """
+        order = {pkg: i for i, pkg in enumerate(self.packages)}
+        comp = self._components()
+        pending = {pkg: set(deps) for pkg, deps in self.requires.items()}
+        dependents: dict[str, set] = {pkg: set() for pkg in self.packages}
+        # Per component: packages not built yet, their pending dependencies
+        # on other components and a heap to pick the next one to break from
+        left: dict[int, int] = dict()
+        outside: dict[int, int] = dict()
+        heaps: dict[int, list] = dict()
+        for pkg, deps in pending.items():
+            c = comp[pkg]
+            left[c] = left.get(c, 0) + 1
+            outside[c] = outside.get(c, 0) + sum(1 for dep in deps if comp[dep] != c)
+            heaps.setdefault(c, list()).append((len(deps), order[pkg], pkg))
+            for dep in deps:
+                dependents[dep].add(pkg)
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        # Components left waiting on nothing but themselves
+        closed = {c for c in left if not outside[c]}
+
+        ready = [pkg for pkg in self.packages if not pending[pkg]]
+        remaining = set(self.packages)
+        broken = list()
+
+        while remaining:
+            while ready:
+                pkg = ready.pop()
+                remaining.discard(pkg)
+                left[comp[pkg]] -= 1
+                if not left[comp[pkg]]:
+                    closed.discard(comp[pkg])
+                for child in dependents[pkg]:
+                    deps = pending[child]
+                    if pkg not in deps:
+                        continue
+                    deps.discard(pkg)
+                    c = comp[child]
+                    if c != comp[pkg]:
+                        outside[c] -= 1
+                        if not outside[c]:
+                            closed.add(c)
+                    heapq.heappush(heaps[c], (len(deps), order[child], child))
+                    if not deps:
+                        ready.append(child)
+
+            victims = list()
+            for c in closed:
+                heap = heaps[c]
+                # Entries are pushed again as dependencies finish, skip outdated ones
+                while heap[0][2] not in remaining or heap[0][0] != len(pending[heap[0][2]]):
+                    heapq.heappop(heap)
+                victims.append(heap[0][2])
+
+            for victim in sorted(victims, key=order.__getitem__):
+                dropped = sorted(pending[victim], key=order.__getitem__)
+                self.requires[victim] -= set(dropped)
+                pending[victim].clear()
+                broken.append((victim, dropped))
+                ready.append(victim)
+                self.logger.warning(
+                    f"Dependency cycle: building {victim} before {', '.join(dropped)}"
+                )
+
+        return broken
+
+    def _components(self) -> dict[str, int]:
+        """Strongly connected component of every package, as a number"""
+        index: dict[str, int] = dict()
+        low: dict[str, int] = dict()
+        comp: dict[str, int] = dict()
+        stack: list[str] = list()
+
+        for root in self.packages:
+            if root in index:
+                continue
+            # Iterative Tarjan, a long dependency chain would exceed the recursion limit
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            work = [(root, iter(self.requires[root]))]
+            while work:
+                pkg, deps = work[-1]
+                dep = next(deps, None)
+                if dep is not None:
+                    if dep not in index:
+                        index[dep] = low[dep] = len(index)
+                        stack.append(dep)
+                        work.append((dep, iter(self.requires[dep])))
+                    elif dep not in comp:
+                        # Still on the stack, part of the component being walked
+                        low[pkg] = min(low[pkg], index[dep])
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[pkg])
+                if low[pkg] == index[pkg]:
+                    while True:
+                        member = stack.pop()
+                        comp[member] = index[pkg]
+                        if member == pkg:
+                            break
+        return comp
+
+    def layers(self) -> list[list[str]]:
+        """Group packages into layers that can be built in parallel"""
+        depth = dict()
+
+        def layer(pkg):
+            if pkg not in depth:
+                stack = [pkg]
+                while stack:
+                    top = stack[-1]
+                    todo = [d for d in self.requires[top] if d not in depth]
+                    if todo:
+                        stack.extend(todo)
+                    else:
+                        stack.pop()
+                        depth[top] = 1 + max(
+                            (depth[d] for d in self.requires[top]), default=-1
+                        )
+            return depth[pkg]
+
+        result: list[list[str]] = list()
+        for pkg in self.packages:
+            n = layer(pkg)
+            while len(result) <= n:
+                result.append(list())
+            result[n].append(pkg)
+        return result
+
+
+class BuildScheduler:
+    """Release packages once all their in-list dependencies have finished.
+
+    Released packages are ranked by priority, highest first, and by buildlist
+    order on a tie.
+    """
+
+    logger = logging.getLogger("scheduler")
+
+    def __init__(self, graph: DependencyGraph, priority: dict | None = None) -> None:
+        """
+        :param graph: DependencyGraph - Packages and their dependencies
+        :param priority: dict - Package name to priority, 0 if absent
+        """
+        self.order = {pkg: i for i, pkg in enumerate(graph.packages)}
+        self.priority = priority or dict()
+        self.pending = {pkg: set(deps) for pkg, deps in graph.requires.items()}
+        self.dependents: dict[str, set] = {pkg: set() for pkg in graph.packages}
+        for pkg, deps in self.pending.items():
+            for dep in deps:
+                self.dependents[dep].add(pkg)
+        self.failed = set()
+
+    def key(self, pkg: str) -> tuple:
+        """Sort key of pkg, lower is released first"""
+        return (-self.priority.get(pkg, 0), self.order[pkg])
+
+    def ready(self) -> list[str]:
+        """Packages without dependencies, ready at the start of the run"""
+        return [pkg for pkg, deps in self.pending.items() if not deps]
+
+    def done(self, pkg: str, success: bool = True) -> list[str]:
+        """Mark pkg finished
+        :return list - Dependents that have nothing left to wait for
+        """
+        if not success:
+            self.failed.add(pkg)
+
+        released = list()
+        for child in self.dependents.get(pkg, ()):
+            deps = self.pending[child]
+            if pkg not in deps:
+                continue
+            deps.discard(pkg)
+            if not deps:
+                if not success:
+                    self.logger.warning(
+                        f"Releasing {child} although its dependency {pkg} failed"
+                    )
+                released.append(child)
+        return released
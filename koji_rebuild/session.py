@@ -1,8 +1,19 @@
 import koji
 import os
+import json
+import fcntl
+import hashlib
+import asyncio
+import tempfile
 import logging
+import functools
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from .util import conf_to_dict, error, resolvepath
 from .configuration import Configuration
+from .metrics import Metrics
+from .cassette import Cassette
 
 
 class KojiSession(koji.ClientSession):
@@ -17,6 +28,8 @@ class KojiSession(koji.ClientSession):
         except AttributeError:
             error("Configuration not initialized!")
 
+        self.instance_name = instance
+
         try:
             self.instance = self.settings["instance"][instance]
         except KeyError:
@@ -39,11 +52,50 @@ class KojiSession(koji.ClientSession):
         except KeyError:
             self.auth = None
 
+        # Replayed runs have to make the calls of the recorded one
+        self.reuse = self.settings["package_builds"]["reuse_sessions"] and not Cassette().enabled
+        # Logged in user, known once logged in
+        self.user = None
+        # Set when the login is saved for the next run, which then owns it
+        self.keep = False
+        # Lock on the saved login, held while this process uses it
+        self._saved_lock = None
+
         # Call parent class constructor
         super().__init__(baseurl=self.server)
 
     """-----------------------------------------------------------------------------------------------------------"""
 
+    def _callMethod(self, name, args, kwargs=None, retry=True):
+        # Every hub call, multicalls included, goes through here
+        with Metrics().timer("rpc", instance=self.instance_name, method=name):
+            cassette = Cassette()
+            if self.multicall or not cassette.enabled:
+                return super()._callMethod(name, args, kwargs, retry)
+            if cassette.replaying:
+                return cassette.replay(self.instance_name, name, args, kwargs)
+            return cassette.record(
+                self.instance_name,
+                name,
+                args,
+                kwargs,
+                functools.partial(super()._callMethod, name, args, kwargs, retry),
+            )
+
+    def logout(self, session_id=None):
+        # logout bypasses _callMethod, a replayed session only forgets its login
+        if Cassette().replaying:
+            self.setSession(None)
+            return
+        super().logout(session_id)
+
+    def __del__(self):
+        # A login saved for the next run must stay valid on the hub
+        if self.__dict__ and not self.__dict__.get("keep"):
+            super().__del__()
+
+    """-----------------------------------------------------------------------------------------------------------"""
+
     def _setup_auth(self):
         if self.auth is not None:
             if self.auth == "ssl":
@@ -81,10 +133,103 @@ class KojiSession(koji.ClientSession):
             self.logger.warning(f'Unsupported authentication method "{self.auth}"')
             self.certs_set = False
 
+    def _keyring_user(self) -> str:
+        # ClientSession turns unknown attributes into hub calls, look them up directly
+        identity = self.__dict__.get("_principal") or self.__dict__.get("_client_cert", "")
+        return f"session {self.server} {identity}"
+
+    def _lock_saved(self) -> bool:
+        """Take the lock on the saved login until the process exits. Runs
+        sharing credentials would otherwise mix up the call numbers of one
+        session and have the hub refuse their calls.
+        :return bool - False if another run holds it
+        """
+        if self._saved_lock is not None:
+            return True
+        digest = hashlib.sha1(self._keyring_user().encode()).hexdigest()[:16]
+        path = os.path.join(tempfile.gettempdir(), f"kojibuild-{os.getuid()}-{digest}.lock")
+        fd = open(path, "a")
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fd.close()
+            return False
+        self._saved_lock = fd
+        return True
+
+    def _restore_session(self) -> bool:
+        """Resume the login saved by a previous run if the hub still accepts it"""
+        import keyring
+
+        if not self._lock_saved():
+            self.logger.info(
+                f"Saved session for {self.server} is in use by another run, logging in afresh"
+            )
+            self.reuse = False
+            return False
+
+        try:
+            saved = keyring.get_password("kojibuild", self._keyring_user())
+        except keyring.errors.KeyringError as e:
+            self.logger.warning(f"Keyring unavailable, not reusing sessions: {e}")
+            self.reuse = False
+            return False
+
+        if saved is None:
+            return False
+
+        try:
+            sinfo = json.loads(saved)
+            callnum = sinfo.pop("callnum")
+            authtype = sinfo.pop("authtype")
+            self.setSession(sinfo)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.logger.warning(f"Ignoring malformed saved session for {self.server}: {e!r}")
+            self.setSession(None)
+            return False
+        # The hub refuses call numbers lower than the last one it has seen
+        self.callnum = callnum
+        try:
+            self.user = self.getLoggedInUser()
+        except koji.GenericError as e:
+            self.logger.info(
+                f"Saved session for {self.server} not accepted: {str(e).splitlines()[-1]}"
+            )
+            self.user = None
+
+        if not self.user:
+            self.setSession(None)
+            return False
+
+        self.authtype = authtype
+        self.logger.info(
+            f"Reusing session of {self.user.get('name')}@{self.server} from a previous run"
+        )
+        return True
+
+    def save_session(self):
+        """Save the login to the keyring for the next run to reuse"""
+        if not self.reuse or not self.logged_in:
+            return
+
+        import keyring
+
+        saved = dict(self.sinfo, callnum=self.callnum, authtype=self.authtype)
+        try:
+            keyring.set_password("kojibuild", self._keyring_user(), json.dumps(saved))
+        except keyring.errors.KeyringError as e:
+            self.logger.warning(f"Could not save session to keyring: {e}")
+            return
+        self.keep = True
+
     def auth_login(self) -> bool:
-        """Login to koji instance using SSL or Keberos authentication"""
+        """Login to koji instance using SSL or Keberos authentication.
+        A login saved by a previous run is reused while the hub accepts it."""
         self._setup_auth()
 
+        if self.certs_set and self.reuse and self._restore_session():
+            return True
+
         if self.certs_set:
             if self.auth == "ssl":
                 response = self.ssl_login(
@@ -101,16 +246,30 @@ class KojiSession(koji.ClientSession):
                 return False
 
             if response is True:
+                self.user = self.getLoggedInUser()
                 self.logger.info(
                     "Logged in as %s@%s. Authenticated via %s"
-                    % ((self.getLoggedInUser()).get("name"), self.server, self.auth)
+                    % (self.user.get("name"), self.server, self.auth)
                 )
+                self.save_session()
             return response
         else:
             return False
 
     """-----------------------------------------------------------------------------------------------------------"""
 
+    def clone(self):
+        """Create a new session sharing this session's login through a hub subsession.
+        Each clone has its own call sequence and connection, so clones can be used
+        from separate threads."""
+        sinfo = self.callMethod("subsession")
+        session = KojiSession(self.instance_name)
+        session.setSession(sinfo)
+        session.authtype = self.authtype
+        return session
+
+    """-----------------------------------------------------------------------------------------------------------"""
+
     def get_total_hosts(self, arch: list | None = None):
         """Get total number of hosts available for a specified architecture(s)"""
         return len(self.listHosts(arches=arch, enabled=True, channelID="default"))
@@ -122,3 +281,166 @@ class KojiSession(koji.ClientSession):
         return len(
             self.listHosts(arches=arch, enabled=True, ready=True, channelID="default")
         )
+
+    """-----------------------------------------------------------------------------------------------------------"""
+
+    def get_queued_tasks(self):
+        """Get number of tasks waiting on the hub to be assigned to a host"""
+        return self.listTasks(
+            opts={"state": [koji.TASK_STATES["FREE"]]}, queryOpts={"countOnly": True}
+        )
+
+
+class SessionPool:
+    """Sessions of one koji instance, each checked out by one call at a time.
+
+    A koji session is not safe to share between threads, and the calls of a
+    logged in session have to reach the hub in order. The pool gives every
+    concurrent call a session of its own. While the primary session is logged
+    in, pool sessions are hub subsessions cloned from it, so authentication
+    happens once; otherwise they are independent anonymous sessions. Sessions
+    are made on first demand, up to size.
+    """
+
+    logger = logging.getLogger("sessionpool")
+
+    def __init__(self, primary: koji.ClientSession, size: int = 16) -> None:
+        """
+        :param primary: koji.ClientSession - Session the pool sessions are made from,
+                        usually a KojiSession
+        :param size: int - Maximum number of pool sessions
+        """
+        self.primary = primary
+        self.size = size
+        # ClientSession turns unknown attributes into hub calls, look it up directly
+        self.name = primary.__dict__.get("instance_name") or primary.baseurl
+        # Held while the primary session itself is in use
+        self.lock = threading.Lock()
+        self.idle: list[koji.ClientSession] = list()
+        self.count = 0
+        self._cond = threading.Condition()
+
+    def _new(self) -> koji.ClientSession:
+        primary = self.primary
+        with self.lock:
+            if isinstance(primary, KojiSession):
+                if primary.logged_in:
+                    session = primary.clone()
+                else:
+                    session = KojiSession(primary.instance_name)
+            else:
+                session = type(primary)(primary.baseurl, primary.opts)
+                if primary.logged_in:
+                    session.setSession(primary.callMethod("subsession"))
+                    session.authtype = primary.authtype
+        Metrics().set("sessions", self.count, instance=self.name)
+        return session
+
+    def acquire(self) -> koji.ClientSession:
+        with self._cond:
+            while True:
+                while self.idle:
+                    session = self.idle.pop()
+                    if self.primary.logged_in and not session.logged_in:
+                        # Made before the primary session logged in
+                        self.count -= 1
+                        continue
+                    return session
+                if self.count < self.size:
+                    self.count += 1
+                    break
+                self._cond.wait()
+
+        try:
+            return self._new()
+        except BaseException:
+            with self._cond:
+                self.count -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, session: koji.ClientSession):
+        with self._cond:
+            self.idle.append(session)
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def session(self):
+        """Check out a session for the duration of the block"""
+        session = self.acquire()
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def close(self):
+        """Expire the subsessions cloned from the primary session"""
+        with self._cond:
+            sessions, self.idle = self.idle, list()
+            self.count = 0
+
+        for session in sessions:
+            if session.logged_in and self.primary.logged_in:
+                try:
+                    with self.lock:
+                        self.primary.logoutChild(session.sinfo["session-id"])
+                except (koji.GenericError, OSError) as e:
+                    self.logger.warning(f"Could not expire pool session: {e}")
+            session.setSession(None)
+
+
+class AsyncKojiSession:
+    """Awaitable facade over a KojiSession.
+
+    Hub calls are run on a bounded thread pool so that a slow response does not
+    block the event loop. Each call checks out a session of its own from a
+    SessionPool, so calls run in parallel even on a logged in session. A
+    callable given to run() that takes the wrapped session as an argument gets
+    a pool session in its place; callables using the wrapped session in any
+    other way are serialized.
+    """
+
+    def __init__(self, session: koji.ClientSession, workers: int = 16) -> None:
+        """
+        :param session: koji.ClientSession - Wrapped session, usually a KojiSession
+        :param workers: int - Threads running hub calls, and pool sessions at most
+        """
+        self.session = session
+        self.pool = SessionPool(session, size=workers)
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="kojisession"
+        )
+
+    def _call(self, func, args, kwargs):
+        if any(arg is self.session for arg in args):
+            with self.pool.session() as session:
+                args = tuple(session if arg is self.session else arg for arg in args)
+                return func(*args, **kwargs)
+
+        with self.pool.lock:
+            return func(*args, **kwargs)
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking callable that uses the session on the thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self._call, func, args, kwargs)
+        )
+
+    @staticmethod
+    def _method(session: KojiSession, name: str, args, kwargs):
+        return getattr(session, name)(*args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self.session, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            return await self.run(self._method, self.session, name, args, kwargs)
+
+        return method
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
@@ -1,14 +1,11 @@
 import os
 import sys
 import logging
-import aiosmtplib
 import asyncio
-import keyring
-from getpass import getpass
 
 from .util import resolvepath
 from .configuration import Configuration
-from email_validator import validate_email, EmailNotValidError
+from .logwriter import LogWriter
 
 
 class Setup:
@@ -25,9 +22,14 @@ class Setup:
         self._pkg_build_params()
         self._email_params()
 
-        if self.settings["notifications"]["alert"] != "off":
-            event_loop = asyncio.get_event_loop()
-            event_loop.run_until_complete(self.test_smtp_connection())
+        # With a stored password the SMTP server is reached once the run has
+        # started, see NotificationQueue.start. Only asking for the password
+        # has to happen here.
+        if str(self.settings["notifications"].get("alert", "off")).lower() in ["prompt", "deferred"]:
+            import keyring
+
+            if keyring.get_password("kojibuild", "kojibuild") is None:
+                asyncio.run(self.test_smtp_connection())
 
     def _set_defaults(self, default: dict, user: dict):
         for key in default:
@@ -37,11 +39,30 @@ class Setup:
     def _pkg_build_params(self):
         defaults = {
             "max_tasks": 10,
+            "adaptive_tasks": False,
+            "min_tasks": 2,
+            "max_tasks_limit": 64,
+            "adapt_interval": 60,
             "buildlist": f"{os.getcwd()}/build.list",
             "ignorelist": f"{os.getcwd()}/ignore.list",
             "fasttrack": False,
+            "dependency_order": False,
+            "priority": "buildlist",
             "topurl": "https://kojipkgs.fedoraproject.org/packages",
             "download_dir": f"{os.path.expanduser('~')}/.rpms",
+            "prefetch_batch": 500,
+            "download_workers": 8,
+            "download_chunk_size": 1048576,
+            "download_retries": 5,
+            "rpm_cache_size": 0,
+            "upload_workers": 4,
+            "upload_blocksize": 1048576,
+            "cache_ttl": 86400,
+            "rpc_workers": 16,
+            "reuse_sessions": True,
+            "poll_interval_min": 10,
+            "poll_interval_max": 60,
+            "metrics_interval": 30,
         }
 
         if "package_builds" not in self.settings:
@@ -54,11 +75,21 @@ class Setup:
 
         self._set_defaults(defaults, pkgbuilds)
 
+        if pkgbuilds["priority"] not in ["buildlist", "duration"]:
+            self.logger.info(f"Invalid value for priority :{pkgbuilds['priority']}")
+            sys.exit(1)
+
     def _logging(self):
         defaults = {
             "application": f"{os.getcwd()}/kojibuild.log",
             "completed": f"{os.getcwd()}/completed.list",
             "failed": f"{os.getcwd()}/failed.list",
+            "journal": f"{os.getcwd()}/kojibuild.journal",
+            "metrics": f"{os.getcwd()}/kojibuild.prom",
+            "metrics_summary": f"{os.getcwd()}/kojibuild.metrics.json",
+            "trace": "",
+            "events": "",
+            "plan": f"{os.getcwd()}/kojibuild.plan.json",
         }
 
         if "logging" not in self.settings:
@@ -71,37 +102,35 @@ class Setup:
 
         self._set_defaults(defaults, logfile)
 
-        logging.basicConfig(
-            filename=logfile["application"],
+        LogWriter().start(
+            logfile["application"],
+            events=logfile["events"],
+            fmt="%(asctime)s - %(name)s - %(levelname)s : %(message)s",
             level=logging.INFO,
-            format="%(asctime)s - %(name)s - %(levelname)s : %(message)s",
         )
 
-    def packagelist(self):
-        def ftol(filename, default: str | None = None):
-            try:
-                fp = resolvepath(self.settings["package_builds"][filename])
-            except KeyError:
-                fp = "/".join([os.getcwd(), default]) if default else None
+    def _read_list(self, key: str, default: str) -> list[str]:
+        """Package names listed one per line in the file set for key"""
+        try:
+            fp = resolvepath(self.settings["package_builds"][key])
+        except KeyError:
+            fp = "/".join([os.getcwd(), default])
 
-            fp = os.path.expanduser(fp) if fp else None
+        fp = os.path.expanduser(fp)
 
-            if fp:
-                try:
-                    with open(fp) as f:
-                        return f.readlines()
-                except FileNotFoundError:
-                    self.logger.info(f"File {fp} not found!")
-                    return []
-            else:
-                return []
+        try:
+            with open(fp) as f:
+                return [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            self.logger.info(f"File {fp} not found!")
+            return []
 
-        buildlist = ftol(
-            self.settings["package_builds"]["buildlist"], default="build.list"
-        )
-        ignorelist = ftol(
-            self.settings["package_builds"]["ignorelist"], default="ignore.list"
-        )
+    def ignorelist(self):
+        return self._read_list("ignorelist", default="ignore.list")
+
+    def packagelist(self):
+        buildlist = self._read_list("buildlist", default="build.list")
+        ignorelist = self.ignorelist()
 
         try:
             assert any(buildlist)
@@ -109,12 +138,7 @@ class Setup:
             print("Buildlist is empty!")
             sys.exit(1)
 
-        if any(ignorelist):
-            for pkg in ignorelist:
-                if pkg in buildlist:
-                    buildlist.remove(pkg)
-
-        pkglist = [pkg.strip() for pkg in buildlist]
+        pkglist = [pkg for pkg in buildlist if pkg not in ignorelist]
         return pkglist
 
     def _email_params(self):
@@ -122,6 +146,7 @@ class Setup:
         defaults = {
             "alert": "off",
             "trigger": "fail",
+            "digest_interval": 3600,
             "email": {
                 "server": "smtp.example.com",
                 "port": 587,
@@ -143,7 +168,7 @@ class Setup:
         alert = notif["alert"]
 
         if type(alert) is bool and alert is False:
-            alert = "off"
+            notif["alert"] = "off"
             return
         # TODO: Handle string
 
@@ -153,11 +178,16 @@ class Setup:
             self.logger.info(f"Invalid value for alert :{alert}")
             sys.exit(1)
         else:
+            # Read as lowercase from here on, by the notification queue too
+            notif["alert"] = alert.lower()
+
+            from email_validator import validate_email, EmailNotValidError
+
             email = notif["email"]
             try:
                 validate_email(email["sender_id"])
             except EmailNotValidError:
-                print(f"Email ID: {email["sender_id"]} is invalid")
+                print(f"Email ID: {email['sender_id']} is invalid")
                 sys.exit(1)
 
             if not (isinstance(email["recipients"], list) or any(email["recipients"])):
@@ -179,6 +209,10 @@ class Setup:
                 sys.exit(1)
 
     async def test_smtp_connection(self):
+        import aiosmtplib
+        import keyring
+        from getpass import getpass
+
         password = keyring.get_password("kojibuild", "kojibuild")
         email = self.settings["notifications"]["email"]
         tls = True if email["auth"] == "tls" else False
@@ -188,12 +222,12 @@ class Setup:
         if password is None:
             flag = 0
             for _ in range(3):
-                password = getpass(f"Enter password for {email["userid"]}")
+                password = getpass(f"Enter password for {email['sender_id']}")
 
                 client = aiosmtplib.SMTP(
                     hostname=email["server"],
                     port=email["port"],
-                    username=email["userid"],
+                    username=email["sender_id"],
                     password=password,
                     use_tls=tls,
                     start_tls=start_tls,
@@ -0,0 +1,77 @@
+import logging
+from .session import KojiSession
+
+
+class TagDiff:
+    """Latest builds of the upstream and downstream tags, compared in bulk.
+
+    Each side is fetched with a single getLatestBuilds call, inheritance
+    included, so finding the packages that need a rebuild costs two round
+    trips however large the tags are.
+    """
+
+    logger = logging.getLogger("tagdiff")
+
+    def __init__(self, upstream: KojiSession, downstream: KojiSession) -> None:
+        self.upstream = upstream
+        self.downstream = downstream
+        self.tag_up = upstream.instance["tag"]
+        self.tag_down = downstream.instance["tag"]
+        # package name -> nvr of its latest build
+        self.latest_up: dict[str, str] = dict()
+        self.latest_down: dict[str, str] = dict()
+
+        self.missing: list[str] = list()
+        self.changed: list[str] = list()
+        self.current: list[str] = list()
+        self.ignored: list[str] = list()
+
+    @staticmethod
+    def _latest(session: KojiSession, tag: str) -> dict[str, str]:
+        builds = session.getLatestBuilds(tag)
+        return {build["package_name"]: build["nvr"] for build in builds}
+
+    def load(self):
+        self.latest_up = self._latest(self.upstream, self.tag_up)
+        self.latest_down = self._latest(self.downstream, self.tag_down)
+        self.logger.info(
+            f"Latest builds: {len(self.latest_up)} in {self.tag_up}, "
+            f"{len(self.latest_down)} in {self.tag_down}"
+        )
+
+    def outdated(self, ignore: list | None = None) -> list[str]:
+        """Packages whose latest upstream NVR is not the latest downstream
+        :param ignore: list - Package names to leave out
+        :return list - Package names, sorted
+        """
+        ignore = set(ignore or [])
+        self.missing, self.changed, self.current, self.ignored = [], [], [], []
+
+        for pkg in sorted(self.latest_up):
+            nvr = self.latest_down.get(pkg)
+            if pkg in ignore:
+                self.ignored.append(pkg)
+            elif nvr is None:
+                self.missing.append(pkg)
+            elif nvr != self.latest_up[pkg]:
+                self.changed.append(pkg)
+            else:
+                self.current.append(pkg)
+
+        return sorted(self.missing + self.changed)
+
+    def summary(self, limit: int = 20) -> str:
+        """Human readable plan of the last outdated() call"""
+        lines = [
+            f"Plan for {self.tag_up} -> {self.tag_down}:",
+            f"  {len(self.latest_up):>7} packages upstream",
+            f"  {len(self.current):>7} up to date",
+            f"  {len(self.ignored):>7} ignored",
+            f"  {len(self.missing):>7} missing downstream",
+            f"  {len(self.changed):>7} with a different NVR downstream",
+        ]
+        for pkg in self.changed[:limit]:
+            lines.append(f"    {pkg}: {self.latest_down[pkg]} -> {self.latest_up[pkg]}")
+        if len(self.changed) > limit:
+            lines.append(f"    ... {len(self.changed) - limit} more")
+        return "\n".join(lines)
@@ -1,6 +1,10 @@
 from enum import IntEnum
+import time
 import asyncio
-from .session import KojiSession
+import logging
+import koji
+from .session import KojiSession, AsyncKojiSession
+from .records import Task
 
 
 class TaskState(IntEnum):
@@ -12,28 +16,144 @@ class TaskState(IntEnum):
     FAILED = 5
 
 
-class TaskWatcher:
+class _PolledTask:
+    __slots__ = ("id", "future", "start", "expected", "next_poll")
 
-    def __init__(self, session: KojiSession, task_id: int):
+    def __init__(self, task_id: int, future: asyncio.Future, expected: float | None):
         self.id = task_id
+        self.future = future
+        self.start = time.monotonic()
+        self.expected = expected
+        self.next_poll = self.start
+
+
+class TaskPoller:
+    """Single poller checking all watched tasks with one multicall per tick.
+
+    Poll intervals adapt per task: a task is polled often when it is close to
+    its expected finish time and rarely while it is far from it. Tasks without
+    an expected duration back off as they keep running.
+    """
+
+    logger = logging.getLogger("taskpoller")
+    done_states = [TaskState.CLOSED, TaskState.CANCELLED, TaskState.FAILED]
+
+    def __init__(
+        self,
+        session: AsyncKojiSession,
+        min_interval: float = 10,
+        max_interval: float = 60,
+    ) -> None:
         self.session = session
-        self.info = dict()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tasks: dict[int, _PolledTask] = dict()
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task | None = None
 
-    def update(self):
-        self.info = self.session.getTaskInfo(task_id=self.id, request=True)
+    def watch(self, task_id: int, expected: float | None = None) -> asyncio.Future:
+        """Register a task, returns a future resolved with its final TaskState
+        :param task_id: int - Koji task id
+        :param expected: float - Expected task duration in seconds, if known
+        """
+        if task_id in self.tasks:
+            return self.tasks[task_id].future
 
-    def is_done(self):
-        self.update()
-        if self.info is None:
-            return False
-        state = self.info["state"]
-        return state in [TaskState.CLOSED, TaskState.CANCELLED, TaskState.FAILED]
+        future = asyncio.get_running_loop().create_future()
+        self.tasks[task_id] = _PolledTask(task_id, future, expected)
+        self._wakeup.set()
 
-    async def watch_task(self, poll_interval: int = 60) -> int:
-        while True:
-            if self.is_done():
-                break
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+        return future
+
+    def _interval(self, task: _PolledTask, now: float) -> float:
+        elapsed = now - task.start
+        if task.expected:
+            remaining = task.expected - elapsed
+            # Overdue tasks back off gradually from the minimum interval
+            interval = remaining / 2 if remaining > 0 else -remaining / 4
+        else:
+            interval = elapsed / 10
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def _query(self, session: KojiSession, task_ids: list) -> dict:
+        calls = dict()
+        with session.multicall(strict=False) as m:
+            for task_id in task_ids:
+                calls[task_id] = m.getTaskInfo(task_id)
+
+        infos = dict()
+        for task_id, call in calls.items():
+            try:
+                if call.result is not None:
+                    infos[task_id] = Task.from_dict(call.result)
+            except koji.GenericError as e:
+                self.logger.warning(
+                    f"Polling task {task_id} failed: {str(e).splitlines()[-1]}"
+                )
+        return infos
+
+    async def _poll(self):
+        now = time.monotonic()
+        due = [t.id for t in self.tasks.values() if t.next_poll <= now]
+        if not due:
+            return
+
+        try:
+            infos = await self.session.run(self._query, self.session.session, due)
+        except (koji.GenericError, OSError) as e:
+            self.logger.warning(f"Polling tasks failed: {e}")
+            infos = dict()
+
+        now = time.monotonic()
+        for task_id in due:
+            task = self.tasks[task_id]
+            info = infos.get(task_id)
+            if info is not None and info.state in self.done_states:
+                del self.tasks[task_id]
+                if not task.future.done():
+                    task.future.set_result(info.state)
             else:
-                await asyncio.sleep(poll_interval)
+                task.next_poll = now + self._interval(task, now)
+
+    async def _run(self):
+        try:
+            await self._loop()
+        except Exception as e:
+            # Watchers would otherwise wait forever on a poller that is gone
+            self.logger.exception(f"Task poller stopped: {e!r}")
+            for task in self.tasks.values():
+                if not task.future.done():
+                    task.future.set_exception(e)
+            self.tasks.clear()
+
+    async def _loop(self):
+        while self.tasks:
+            # Forget watchers that gave up waiting
+            for task_id in [t.id for t in self.tasks.values() if t.future.done()]:
+                del self.tasks[task_id]
+
+            self._wakeup.clear()
+            await self._poll()
+
+            if not self.tasks:
+                break
+
+            delay = min(t.next_poll for t in self.tasks.values()) - time.monotonic()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(delay, 0))
+            except TimeoutError:
+                pass
+
+
+class TaskWatcher:
+
+    def __init__(self, poller: TaskPoller, task_id: int, expected: float | None = None):
+        self.id = task_id
+        self.poller = poller
+        self.expected = expected
 
-        return self.info["state"]
+    async def watch_task(self) -> int:
+        return await self.poller.watch(self.id, self.expected)
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import logging
+import threading
+from .util import Singleton
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "pkg", "args", "start")
+
+    def __init__(self, tracer, name: str, pkg: str, args: dict) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.pkg = pkg
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.complete(self.name, self.pkg, self.start, time.monotonic(), **self.args)
+        return False
+
+
+class Tracer(Singleton):
+    """Per-package spans written in the Chrome trace-event format.
+
+    Every package gets its own row in the trace, so the stages of one
+    package, and the gaps between them, read left to right. Events are
+    appended as they complete, one per line. The viewers accept the array
+    without its closing bracket, so the trace of an aborted run still loads
+    in chrome://tracing or ui.perfetto.dev.
+
+    Any module can open a span on Tracer() without a tracer being handed
+    down to it, they all land in the one trace of the run. Until open() is
+    called a span costs a clock read and is dropped.
+    """
+
+    logger = logging.getLogger("trace")
+
+    def _setup(self):
+        self._fd = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._fd is not None
+
+    def open(self, path: str):
+        with self._lock:
+            self._fd = open(path, "w")
+            self._fd.write("[")
+            self._sep = "\n"
+            self._origin = time.monotonic()
+            # package -> row in the trace
+            self._rows: dict[str, int] = dict()
+        self._event({"name": "process_name", "ph": "M", "pid": os.getpid(), "tid": 0,
+                     "args": {"name": "koji-rebuild"}})  # fmt: skip
+        self.logger.info(f"Tracing packages to {path}")
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._fd.write("\n]\n")
+                self._fd.close()
+                self._fd = None
+
+    def _event(self, event: dict):
+        with self._lock:
+            if self._fd is not None:
+                self._fd.write(self._sep + json.dumps(event, default=str))
+                self._sep = ",\n"
+
+    def _row(self, pkg: str) -> int:
+        with self._lock:
+            row = self._rows.get(pkg)
+            if row is not None:
+                return row
+            row = self._rows[pkg] = len(self._rows) + 1
+        self._event({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": row,
+                     "args": {"name": pkg}})  # fmt: skip
+        return row
+
+    def span(self, name: str, pkg: str, **args) -> _Span:
+        """Context manager recording its block as a span on the row of pkg.
+        Attributes known only inside the block can be added to span.args."""
+        return _Span(self, name, pkg, args)
+
+    def complete(self, name: str, pkg: str, start: float, end: float, **args):
+        """Record a span between two time.monotonic() readings"""
+        if not self.enabled:
+            return
+        self._event(
+            {
+                "name": name,
+                "cat": "package",
+                "ph": "X",
+                "pid": os.getpid(),
+                "tid": self._row(pkg),
+                "ts": round((start - self._origin) * 1e6),
+                "dur": round((end - start) * 1e6),
+                "args": args,
+            }
+        )
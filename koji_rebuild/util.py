@@ -2,18 +2,18 @@ import os
 import sys
 import logging
 import configparser
-import inspect
 
 
+# Frame lookups are cheap, unlike inspect.stack() which reads the source of every frame
 def whoami():
-    return inspect.stack()[1][3]
+    return sys._getframe(1).f_code.co_name
 
 
 """---------------------------------------------------------------------------------------------"""
 
 
 def whoiscaller():
-    return inspect.stack()[2][3]
+    return sys._getframe(2).f_code.co_name
 
 
 """---------------------------------------------------------------------------------------------"""
@@ -113,3 +113,24 @@ def resolvepath(path: str) -> str:
 
 
 """---------------------------------------------------------------------------------------------"""
+
+
+class Singleton:
+    """Base of the classes with one instance per process.
+
+    Every call of a subclass returns its one instance. The first call sets it
+    up through _setup(), with the arguments of that call; the arguments of
+    later calls are ignored.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        # Looked up on cls itself, a subclass must not get its base's instance
+        instance = cls.__dict__.get("_instance")
+        if instance is None:
+            instance = super().__new__(cls)
+            cls._instance = instance
+            instance._setup(*args, **kwargs)
+        return instance
+
+    def _setup(self, *args, **kwargs):
+        pass
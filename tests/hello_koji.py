@@ -1,13 +1,14 @@
 #! /usr/bin/env python3
 
 from koji_rebuild.setup import Setup
+from koji_rebuild.session import KojiSession
 
 
 def main(configfile):
-    config = Setup(configfile)
-    upstream = config.get_koji_session("upstream")
-
-    print(upstream.hello())
+    Setup(configfile)
+    for instance in ["upstream", "downstream"]:
+        session = KojiSession(instance)
+        print(f"{instance}: {session.hello()}")
 
 
 if __name__ == "__main__":
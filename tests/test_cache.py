@@ -0,0 +1,136 @@
+import koji
+import pytest
+
+from koji_rebuild import cache as cache_module
+from koji_rebuild.cache import ResponseCache
+
+
+class Hub:
+    """Answers tagLastChangeEvent like a KojiSession"""
+
+    def __init__(self, event) -> None:
+        self.event = event
+        self.calls = 0
+
+    def tagLastChangeEvent(self, tag, inherit=False):
+        self.calls += 1
+        if isinstance(self.event, Exception):
+            raise self.event
+        return self.event
+
+
+class Clock:
+    def __init__(self, now: float = 1000000.0) -> None:
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock.time)
+    return clock
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache" / "kojicache.sqlite")
+
+
+def test_stored_response_is_returned(path, clock):
+    cache = ResponseCache(path, ttl=60)
+    cache.put("getLatestRPMS", ["f40", "foo"], [[{"id": 1}], []], tag="f40")
+
+    assert cache.get("getLatestRPMS", ["f40", "foo"]) == [[{"id": 1}], []]
+    assert cache.get("getLatestRPMS", ["f40", "bar"]) is None
+    cache.close()
+
+
+def test_entry_expires_after_ttl(path, clock):
+    cache = ResponseCache(path, ttl=60)
+    cache.put("getBuild", "foo-1-1", {"id": 1})
+
+    clock.now += 60
+    assert cache.get("getBuild", "foo-1-1") == {"id": 1}
+    clock.now += 1
+    assert cache.get("getBuild", "foo-1-1") is None
+    cache.close()
+
+
+def test_expired_entries_are_purged_on_open(path, clock):
+    cache = ResponseCache(path, ttl=60)
+    cache.put("getBuild", "old-1-1", {"id": 1})
+    clock.now += 50
+    cache.put("getBuild", "new-1-1", {"id": 2})
+    cache.close()
+
+    clock.now += 20
+    cache = ResponseCache(path, ttl=60)
+    keys = [row[0] for row in cache.db.execute("SELECT key FROM responses")]
+    assert keys == ['"new-1-1"']
+    cache.close()
+
+
+def test_entries_survive_reopening(path, clock):
+    cache = ResponseCache(path, ttl=60)
+    cache.put_many("getBuild", [("foo-1-1", {"id": 1}), ("bar-1-1", {"id": 2})])
+    cache.close()
+
+    cache = ResponseCache(path, ttl=60)
+    assert cache.get("getBuild", "bar-1-1") == {"id": 2}
+    cache.close()
+
+
+def test_unchanged_tag_keeps_its_entries(path, clock):
+    cache = ResponseCache(path, ttl=60)
+    cache.validate_tag(Hub(7), "f40")
+    cache.put("getLatestRPMS", ["f40", "foo"], [[], []], tag="f40")
+    cache.close()
+
+    cache = ResponseCache(path, ttl=60)
+    cache.validate_tag(Hub(7), "f40")
+    assert cache.get("getLatestRPMS", ["f40", "foo"]) == [[], []]
+    cache.close()
+
+
+def test_changed_tag_drops_only_its_entries(path, clock):
+    cache = ResponseCache(path, ttl=60)
+    cache.validate_tag(Hub(7), "f40")
+    cache.validate_tag(Hub(3), "f39")
+    cache.put("getLatestRPMS", ["f40", "foo"], [[], []], tag="f40")
+    cache.put("getLatestRPMS", ["f39", "foo"], [[], []], tag="f39")
+    cache.put("getBuild", "foo-1-1", {"id": 1})
+    cache.close()
+
+    cache = ResponseCache(path, ttl=60)
+    cache.validate_tag(Hub(8), "f40")
+    cache.validate_tag(Hub(3), "f39")
+    assert cache.get("getLatestRPMS", ["f40", "foo"]) is None
+    assert cache.get("getLatestRPMS", ["f39", "foo"]) == [[], []]
+    assert cache.get("getBuild", "foo-1-1") == {"id": 1}
+    cache.close()
+
+
+def test_tag_that_cannot_be_checked_is_dropped(path, clock):
+    cache = ResponseCache(path, ttl=60)
+    cache.validate_tag(Hub(7), "f40")
+    cache.put("getLatestRPMS", ["f40", "foo"], [[], []], tag="f40")
+    cache.close()
+
+    cache = ResponseCache(path, ttl=60)
+    cache.validate_tag(Hub(koji.GenericError("hub down")), "f40")
+    assert cache.get("getLatestRPMS", ["f40", "foo"]) is None
+    cache.close()
+
+
+def test_tag_is_checked_once_per_cache(path, clock):
+    cache = ResponseCache(path, ttl=60)
+    hub = Hub(7)
+    cache.validate_tag(hub, "f40")
+    cache.validate_tag(hub, "f40")
+    cache.validate_tag(hub, None)
+
+    assert hub.calls == 1
+    cache.close()
@@ -0,0 +1,198 @@
+import os
+import gzip
+import json
+
+import koji
+import pytest
+
+from koji_rebuild import cassette as cassette_module
+from koji_rebuild.cassette import Cassette
+from koji_rebuild.configuration import Configuration
+from koji_rebuild.metrics import Metrics
+from koji_rebuild.session import KojiSession
+
+KOJICONF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "koji.conf")
+
+
+class Hub:
+    """Answers hub requests in place of ClientSession._callMethod, as a bound method
+    it is not handed the session"""
+
+    def __init__(self) -> None:
+        self.polls: dict = dict()
+        self.requests = 0
+
+    def answer(self, name, args):
+        if name == "hello":
+            return "Hello"
+        if name == "getTaskInfo":
+            task_id = args[0]
+            self.polls[task_id] = self.polls.get(task_id, 0) + 1
+            # Open on the first two polls, closed from then on
+            state = koji.TASK_STATES["OPEN" if self.polls[task_id] <= 2 else "CLOSED"]
+            return {"id": task_id, "state": state}
+        raise koji.GenericError(f"No such build: {args[0]}")
+
+    def call(self, name, args, kwargs=None, retry=True):
+        self.requests += 1
+        if name != "multiCall":
+            return self.answer(name, args)
+        results = list()
+        for c in args[0]:
+            try:
+                results.append([self.answer(c["methodName"], c["params"])])
+            except koji.GenericError as e:
+                results.append({"faultCode": e.faultCode, "faultString": str(e)})
+        return results
+
+
+def offline(session, name, args, kwargs=None, retry=True):
+    raise AssertionError(f"{name} reached the network")
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    settings = {
+        "instance": {"upstream": {"kojiconf": KOJICONF}},
+        "package_builds": {"reuse_sessions": False},
+    }
+    monkeypatch.setattr(Configuration(), "_settings", settings, raising=False)
+
+
+@pytest.fixture
+def cassette():
+    cassette = Cassette()
+    yield cassette
+    cassette.close()
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "run.cassette.gz")
+
+
+def session_calls(session: KojiSession) -> list:
+    """Hub traffic of a short run, with each outcome or fault"""
+    results = list()
+
+    def outcome(func, *args):
+        try:
+            results.append(func(*args))
+        except koji.GenericError as e:
+            results.append(("fault", type(e).__name__, str(e)))
+
+    outcome(session.hello)
+    for _ in range(3):
+        outcome(session.getTaskInfo, 1)
+    outcome(session.getBuild, "foo-1-1")
+    with session.multicall(strict=False) as m:
+        calls = [m.getTaskInfo(2), m.getBuild("bar-1-1"), m.getTaskInfo(1)]
+    for call in calls:
+        outcome(lambda: call.result)
+    return results
+
+
+def test_replay_returns_the_recorded_responses(settings, cassette, path, monkeypatch):
+    hub = Hub()
+    monkeypatch.setattr(koji.ClientSession, "_callMethod", hub.call)
+    cassette.open(path, "record")
+    recorded = session_calls(KojiSession("upstream"))
+    cassette.close()
+
+    monkeypatch.setattr(koji.ClientSession, "_callMethod", offline)
+    cassette.open(path, "replay", speed=0)
+    replayed = session_calls(KojiSession("upstream"))
+
+    assert replayed == recorded
+    assert recorded[1:4] == [
+        {"id": 1, "state": koji.TASK_STATES["OPEN"]},
+        {"id": 1, "state": koji.TASK_STATES["OPEN"]},
+        {"id": 1, "state": koji.TASK_STATES["CLOSED"]},
+    ]
+    assert recorded[4] == ("fault", "GenericError", "No such build: foo-1-1")
+    assert hub.requests == 6
+
+
+def test_replay_repeats_the_last_response(settings, cassette, path, monkeypatch):
+    monkeypatch.setattr(koji.ClientSession, "_callMethod", Hub().call)
+    cassette.open(path, "record")
+    session = KojiSession("upstream")
+    for _ in range(3):
+        session.getTaskInfo(1)
+    cassette.close()
+
+    monkeypatch.setattr(koji.ClientSession, "_callMethod", offline)
+    cassette.open(path, "replay", speed=0)
+    session = KojiSession("upstream")
+    states = [session.getTaskInfo(1)["state"] for _ in range(5)]
+
+    assert states[-3:] == [koji.TASK_STATES["CLOSED"]] * 3
+
+
+def test_multicall_is_answered_call_by_call(settings, cassette, path, monkeypatch):
+    monkeypatch.setattr(koji.ClientSession, "_callMethod", Hub().call)
+    cassette.open(path, "record")
+    session = KojiSession("upstream")
+    with session.multicall(strict=False) as m:
+        m.getTaskInfo(1)
+        m.getTaskInfo(2)
+    cassette.close()
+
+    monkeypatch.setattr(koji.ClientSession, "_callMethod", offline)
+    cassette.open(path, "replay", speed=0)
+    session = KojiSession("upstream")
+    # Batched otherwise than when recorded
+    task = session.getTaskInfo(2)
+    with session.multicall(strict=False) as m:
+        call = m.getTaskInfo(1)
+
+    assert task == {"id": 2, "state": koji.TASK_STATES["OPEN"]}
+    assert call.result == {"id": 1, "state": koji.TASK_STATES["OPEN"]}
+
+
+def test_unrecorded_call_fails(settings, cassette, path, monkeypatch):
+    monkeypatch.setattr(koji.ClientSession, "_callMethod", Hub().call)
+    cassette.open(path, "record")
+    KojiSession("upstream").hello()
+    cassette.close()
+
+    monkeypatch.setattr(koji.ClientSession, "_callMethod", offline)
+    cassette.open(path, "replay", speed=0)
+    misses = Metrics()._key("cassette_misses", {"instance": "upstream", "method": "getTaskInfo"})
+    before = Metrics().counters.get(misses, 0)
+
+    with pytest.raises(koji.GenericError, match="No recorded response"):
+        KojiSession("upstream").getTaskInfo(1)
+    assert Metrics().counters[misses] == before + 1
+
+
+def test_upload_paths_are_masked():
+    a = Cassette.key("downstream", "importRPM", ["app-import/1718000000.123.AbCdEfGh", "foo.rpm"])
+    b = Cassette.key("downstream", "importRPM", ["app-import/1718000042.5.ZyXwVuTs", "foo.rpm"])
+    c = Cassette.key("downstream", "importRPM", ["app-import/1718000042.5.ZyXwVuTs", "bar.rpm"])
+
+    assert a == b != c
+
+
+def write_cassette(path: str, calls: list):
+    """Cassette with the given (method, params, duration) calls, each answered with its method name"""
+    with gzip.open(path, "wt") as f:
+        f.write(json.dumps({"version": Cassette.VERSION}) + "\n")
+        for method, params, duration in calls:
+            key = Cassette.key("upstream", method, params)
+            f.write(json.dumps({"i": "upstream", "m": method, "k": key, "t": 0, "d": duration, "r": method}) + "\n")
+
+
+@pytest.mark.parametrize("speed, delays", [(1, [0.4, 0.5]), (4, [0.1, 0.125]), (0, [])])
+def test_replay_speed_scales_the_recorded_latency(cassette, path, monkeypatch, speed, delays):
+    write_cassette(path, [("hello", [], 0.4), ("getTaskInfo", [1], 0.2), ("getTaskInfo", [2], 0.5)])
+    slept = list()
+    monkeypatch.setattr(cassette_module.time, "sleep", slept.append)
+    cassette.open(path, "replay", speed=speed)
+
+    assert cassette.replay("upstream", "hello", (), {}) == "hello"
+    # A multicall waits for its slowest call
+    calls = [{"methodName": "getTaskInfo", "params": [n]} for n in (1, 2)]
+    assert cassette.replay("upstream", "multiCall", (calls,), {}) == [["getTaskInfo"]] * 2
+
+    assert slept == pytest.approx(delays)
@@ -0,0 +1,90 @@
+import asyncio
+
+from koji_rebuild.concurrency import ConcurrencyController
+
+
+def controller(initial=10, **kwargs) -> ConcurrencyController:
+    # update() works on samples only, the session is used by the sampling loop
+    return ConcurrencyController(None, initial, **kwargs)  # type: ignore
+
+
+def test_initial_window_is_clamped():
+    assert controller(0, minimum=2).window == 2
+    assert controller(100, maximum=64).window == 64
+
+
+def test_idle_builders_grow_the_window_additively():
+    c = controller(10, increase=2)
+    c.update(total=8, ready=4, queued=0)
+    assert c.window == 12
+    c.update(total=8, ready=4, queued=1)
+    assert c.window == 14
+
+
+def test_growth_stops_at_maximum():
+    c = controller(62, maximum=64, increase=4)
+    c.update(total=8, ready=8, queued=0)
+    assert c.window == 64
+    c.update(total=8, ready=8, queued=0)
+    assert c.window == 64
+
+
+def test_growing_queue_cuts_the_window_multiplicatively():
+    c = controller(20, decrease=0.5)
+    c.update(total=4, ready=0, queued=10)
+    assert c.window == 10
+    c.update(total=4, ready=0, queued=12)
+    assert c.window == 5
+
+
+def test_queue_that_is_not_growing_holds_the_window():
+    c = controller(20)
+    c.update(total=4, ready=0, queued=10)
+    assert c.window == 10
+    # Still backed up, but draining: the last cut is given time to work
+    c.update(total=4, ready=0, queued=8)
+    assert c.window == 10
+
+
+def test_cut_stops_at_minimum():
+    c = controller(3, minimum=2, decrease=0.5)
+    c.update(total=1, ready=0, queued=5)
+    assert c.window == 2
+    c.update(total=1, ready=0, queued=6)
+    assert c.window == 2
+
+
+def test_busy_builders_with_a_short_queue_hold_the_window():
+    c = controller(10)
+    c.update(total=8, ready=0, queued=2)
+    assert c.window == 10
+    c.update(total=8, ready=2, queued=2)
+    assert c.window == 10
+
+
+def test_resize_wakes_waiters():
+    async def wait():
+        c = controller(10)
+        waiter = asyncio.create_task(c.wait_changed(c.generation))
+        await asyncio.sleep(0)
+        c.update(total=8, ready=0, queued=2)
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        c.update(total=8, ready=4, queued=0)
+        return await asyncio.wait_for(waiter, timeout=5)
+
+    assert asyncio.run(wait()) == 1
+
+
+def test_resize_before_waiting_is_not_missed():
+    async def wait():
+        c = controller(10)
+        seen = c.generation
+        # Resized before the waiter gets to run
+        c.update(total=8, ready=4, queued=0)
+        first = await asyncio.wait_for(c.wait_changed(seen), timeout=5)
+        c.update(total=8, ready=4, queued=0)
+        second = await asyncio.wait_for(c.wait_changed(first), timeout=5)
+        return first, second
+
+    assert asyncio.run(wait()) == (1, 2)
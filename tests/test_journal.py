@@ -0,0 +1,96 @@
+import json
+
+from koji_rebuild.journal import RunJournal
+
+HEADER = {"upstream": "f40", "downstream": "f40-rebuild"}
+
+
+def journal(tmp_path, header=HEADER) -> RunJournal:
+    return RunJournal(str(tmp_path / "journal"), header)
+
+
+def test_missing_journal_loads_empty(tmp_path):
+    assert journal(tmp_path).load() == {}
+
+
+def test_last_record_of_a_package_wins(tmp_path):
+    j = journal(tmp_path)
+    j.open(resume=False)
+    j.record("foo", RunJournal.SUBMITTED, 11)
+    j.record("bar", RunJournal.SUBMITTED, 12)
+    j.record("foo", RunJournal.COMPLETE, 11)
+    j.close()
+
+    assert journal(tmp_path).load() == {
+        "foo": (RunJournal.COMPLETE, 11),
+        "bar": (RunJournal.SUBMITTED, 12),
+    }
+
+
+def test_torn_line_is_skipped(tmp_path):
+    j = journal(tmp_path)
+    j.open(resume=False)
+    j.record("foo", RunJournal.COMPLETE, 11)
+    j.close()
+    with open(j.path, "a") as f:
+        f.write('{"ts": 1, "pkg": "bar", "sta')
+
+    assert journal(tmp_path).load() == {"foo": (RunJournal.COMPLETE, 11)}
+
+
+def test_records_after_a_torn_line_are_kept(tmp_path):
+    j = journal(tmp_path)
+    j.open(resume=False)
+    j.close()
+    with open(j.path, "a") as f:
+        f.write('{"ts": 1, "pkg": "foo"\n')
+
+    j.open()
+    j.record("bar", RunJournal.FAILED)
+    j.close()
+
+    assert journal(tmp_path).load() == {"bar": (RunJournal.FAILED, -1)}
+
+
+def test_journal_of_another_run_is_not_resumed(tmp_path):
+    j = journal(tmp_path, {"upstream": "f39", "downstream": "f39-rebuild"})
+    j.open(resume=False)
+    j.record("foo", RunJournal.COMPLETE, 11)
+    j.close()
+
+    assert journal(tmp_path).load() == {}
+
+
+def test_header_of_another_run_later_in_the_file_stops_the_replay(tmp_path):
+    j = journal(tmp_path)
+    j.open(resume=False)
+    j.record("foo", RunJournal.COMPLETE, 11)
+    j.close()
+    with open(j.path, "a") as f:
+        f.write(json.dumps({"run": {"upstream": "f39", "downstream": "f39"}}) + "\n")
+        f.write(json.dumps({"ts": 2, "pkg": "bar", "state": "complete"}) + "\n")
+
+    assert journal(tmp_path).load() == {}
+
+
+def test_finished_run_is_not_resumed(tmp_path):
+    j = journal(tmp_path)
+    j.open(resume=False)
+    j.record("foo", RunJournal.COMPLETE, 11)
+    j.finish()
+
+    assert j.fd is None
+    assert journal(tmp_path).load() == {}
+
+
+def test_fresh_open_starts_a_new_journal(tmp_path):
+    j = journal(tmp_path)
+    j.open(resume=False)
+    j.record("foo", RunJournal.COMPLETE, 11)
+    j.finish()
+
+    j.open(resume=False)
+    j.record("bar", RunJournal.SUBMITTED, 12)
+    j.close()
+
+    assert journal(tmp_path).load() == {"bar": (RunJournal.SUBMITTED, 12)}
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import logging
+import threading
+import subprocess
+
+import pytest
+
+from koji_rebuild.logwriter import LogWriter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def writer():
+    root = logging.getLogger()
+    level = root.level
+    writer = LogWriter()
+    yield writer
+    writer.close()
+    root.setLevel(level)
+
+
+def test_records_of_each_thread_keep_their_order(writer, tmp_path):
+    log, events = tmp_path / "app.log", tmp_path / "events.jsonl"
+    writer.start(str(log), events=str(events), fmt="%(threadName)s %(message)s")
+    logger = logging.getLogger("test_logwriter")
+    start = threading.Barrier(8)
+
+    def emit():
+        start.wait()
+        worker = threading.current_thread().name
+        for n in range(500):
+            logger.info("%d", n, extra={"worker": worker, "seq": n})
+
+    threads = [threading.Thread(target=emit, name=f"t{i}") for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert writer.flush(timeout=10)
+
+    lines = dict()
+    for line in log.read_text().splitlines():
+        name, n = line.split()
+        lines.setdefault(name, []).append(int(n))
+    assert lines == {f"t{i}": list(range(500)) for i in range(8)}
+
+    seqs = dict()
+    for line in events.read_text().splitlines():
+        event = json.loads(line)
+        assert event["logger"] == "test_logwriter" and event["level"] == "INFO"
+        seqs.setdefault(event["worker"], []).append(event["seq"])
+    assert seqs == lines
+
+
+def test_result_file_is_flushed_before_it_is_closed(writer, tmp_path):
+    path = tmp_path / "completed.txt"
+    results = writer.open(str(path))
+
+    for pkg in ["foo", "bar", "baz"]:
+        results.write(pkg + "\n")
+    assert writer.flush(timeout=10)
+    assert path.read_text() == "foo\nbar\nbaz\n"
+
+    results.write("qux\n")
+    results.close()
+    assert path.read_text() == "foo\nbar\nbaz\nqux\n"
+    assert results.fd.closed
+
+
+def test_queued_records_are_written_at_exit(tmp_path):
+    log, results = tmp_path / "app.log", tmp_path / "failed.txt"
+    # Exits without flushing or closing, leaving the rest to atexit
+    script = f"""
+import logging
+from koji_rebuild.logwriter import LogWriter
+LogWriter().start({str(log)!r}, fmt="%(message)s")
+failed = LogWriter().open({str(results)!r})
+for n in range(5000):
+    logging.getLogger("exit").info("record %d", n)
+    failed.write("pkg%d\\n" % n)
+"""
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, timeout=60)
+
+    assert log.read_text().splitlines() == [f"record {n}" for n in range(5000)]
+    assert results.read_text().splitlines() == [f"pkg{n}" for n in range(5000)]
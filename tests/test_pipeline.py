@@ -0,0 +1,219 @@
+import os
+import asyncio
+import contextlib
+
+import koji
+import pytest
+
+from koji_rebuild.configuration import Configuration
+from koji_rebuild.package import PackageHelper
+from koji_rebuild.pipeline import ImportPipeline
+
+TOPURL = "https://upstream/packages"
+
+
+def rpm(build_id: int, name: str, arch: str) -> dict:
+    return {
+        "id": hash((name, arch)) & 0xFFFF,
+        "build_id": build_id,
+        "name": name,
+        "version": "1.0",
+        "release": "1",
+        "arch": arch,
+        "size": 4,
+        "payloadhash": f"{name}.{arch}",
+    }
+
+
+# foo is built from one source, foo-doc was imported earlier as a build of its own
+RPMS = [rpm(10, "foo", "src"), rpm(10, "foo", "x86_64"), rpm(11, "foo-doc", "noarch")]
+BUILDS = {f"{r['name']}-1.0-1.{r['arch']}.rpm": r["build_id"] for r in RPMS}
+
+
+class Call:
+    def __init__(self, result) -> None:
+        self._result = result
+
+    @property
+    def result(self):
+        if isinstance(self._result, Exception):
+            raise self._result
+        return self._result
+
+
+class Hub:
+    """Upstream and downstream hub calls the pipeline makes"""
+
+    def __init__(self) -> None:
+        self.logged_in = True
+        self.uploads: list = list()
+        self.imports: list = list()
+        self.tagged: list = list()
+        self.multicalls = 0
+        self.fail_upload: set = set()
+        self.fail_import: set = set()
+        self.fail_tag: set = set()
+
+    def getLatestRPMS(self, tag, package):
+        return [RPMS, [{"id": 10, "nvr": "foo-1.0-1", "package_name": "foo"}]]
+
+    def uploadWrapper(self, localfile, path, blocksize):
+        name = os.path.basename(localfile)
+        if name in self.fail_upload:
+            raise OSError("connection reset")
+        self.uploads.append((path, name))
+
+    def importRPM(self, path, basename):
+        if basename in self.fail_import:
+            raise koji.GenericError(f"Error importing {basename}")
+        self.imports.append(basename)
+        return {"build_id": BUILDS[basename]}
+
+    def tagBuildBypass(self, tag, build):
+        if build in self.fail_tag:
+            return Call(koji.GenericError(f"build {build} is locked"))
+        self.tagged.append((tag, build))
+        return Call(None)
+
+    @contextlib.contextmanager
+    def multicall(self, strict=False):
+        self.multicalls += 1
+        yield self
+
+
+class AsyncHub:
+    """Stands in for AsyncKojiSession, runs calls inline"""
+
+    def __init__(self, hub: Hub) -> None:
+        self.session = hub
+
+    async def run(self, func, *args):
+        return func(*args)
+
+    async def uploadWrapper(self, **kwargs):
+        return self.session.uploadWrapper(**kwargs)
+
+    async def importRPM(self, **kwargs):
+        return self.session.importRPM(**kwargs)
+
+
+class Downloader:
+    def __init__(self) -> None:
+        self.fail: set = set()
+        self.urls: list = list()
+
+    async def fetch(self, url, filepath, size=None):
+        self.urls.append(url)
+        if os.path.basename(filepath) in self.fail:
+            return False
+        with open(filepath, "wb") as f:
+            f.write(b"\0" * size)
+        return True
+
+
+@pytest.fixture
+def download_dir(tmp_path, monkeypatch):
+    settings = {"package_builds": {"download_dir": str(tmp_path), "topurl": TOPURL}}
+    monkeypatch.setattr(Configuration(), "_settings", settings, raising=False)
+    return tmp_path
+
+
+@pytest.fixture
+def hub():
+    return Hub()
+
+
+@pytest.fixture
+def downloader():
+    return Downloader()
+
+
+def run(hub: Hub, downloader: Downloader) -> int:
+    pipeline = ImportPipeline(PackageHelper(downloader=downloader), AsyncHub(hub))  # type: ignore
+    return asyncio.run(pipeline.run(AsyncHub(Hub()), "f40", "foo", "f40-rebuild"))  # type: ignore
+
+
+def test_package_is_uploaded_imported_and_tagged(download_dir, hub, downloader):
+    assert run(hub, downloader) == 0
+
+    # Under the package the RPMs were listed for, whichever build they came from
+    assert sorted(downloader.urls) == [
+        f"{TOPURL}/foo/1.0/1/noarch/foo-doc-1.0-1.noarch.rpm",
+        f"{TOPURL}/foo/1.0/1/src/foo-1.0-1.src.rpm",
+        f"{TOPURL}/foo/1.0/1/x86_64/foo-1.0-1.x86_64.rpm",
+    ]
+    # Every RPM in a directory of its own, imported from there
+    assert len({path for path, _ in hub.uploads}) == 3
+    assert sorted(hub.imports) == sorted(name for _, name in hub.uploads)
+    # Both builds tagged in one multicall
+    assert hub.multicalls == 1
+    assert sorted(hub.tagged) == [("f40-rebuild", 10), ("f40-rebuild", 11)]
+    assert not os.path.exists(download_dir / "foo")
+
+
+def test_nothing_is_imported_if_a_download_failed(download_dir, hub, downloader):
+    downloader.fail.add("foo-1.0-1.x86_64.rpm")
+
+    assert run(hub, downloader) == 1
+
+    assert hub.imports == [] and hub.tagged == []
+    # The other RPMs are kept for a retry
+    assert sorted(os.listdir(download_dir / "foo")) == [
+        "foo-1.0-1.src.rpm",
+        "foo-doc-1.0-1.noarch.rpm",
+    ]
+
+
+def test_nothing_is_imported_if_an_upload_failed(download_dir, hub, downloader):
+    hub.fail_upload.add("foo-doc-1.0-1.noarch.rpm")
+
+    assert run(hub, downloader) == 1
+
+    assert len(hub.uploads) == 2
+    assert hub.imports == [] and hub.tagged == []
+    assert not os.path.exists(download_dir / "foo")
+
+
+def test_failed_import_is_not_tagged(download_dir, hub, downloader):
+    hub.fail_import.add("foo-1.0-1.src.rpm")
+
+    assert run(hub, downloader) == 1
+
+    assert "foo-1.0-1.src.rpm" not in hub.imports
+    assert hub.tagged == []
+
+
+def test_failed_tagging_fails_the_package(download_dir, hub, downloader):
+    hub.fail_tag.add(11)
+
+    assert run(hub, downloader) == 1
+
+    assert hub.tagged == [("f40-rebuild", 10)]
+
+
+def test_import_needs_a_login(download_dir, hub, downloader):
+    hub.logged_in = False
+    hub.auth_login = lambda: False
+
+    assert run(hub, downloader) == 1
+
+    assert downloader.urls == [] and hub.uploads == []
+
+
+def test_tag_imported_tags_each_build_once(hub):
+    helper = PackageHelper(downloader=Downloader())  # type: ignore
+
+    assert helper.tag_imported(hub, "f40-rebuild", [10, 11, 10, 11])  # type: ignore
+
+    assert hub.multicalls == 1
+    assert sorted(hub.tagged) == [("f40-rebuild", 10), ("f40-rebuild", 11)]
+
+
+def test_tag_imported_reports_a_failed_build(hub):
+    helper = PackageHelper(downloader=Downloader())  # type: ignore
+    hub.fail_tag.add(10)
+
+    assert not helper.tag_imported(hub, "f40-rebuild", [10, 11, 12])  # type: ignore
+
+    # The other builds are tagged all the same
+    assert sorted(hub.tagged) == [("f40-rebuild", 11), ("f40-rebuild", 12)]
@@ -0,0 +1,78 @@
+import pytest
+
+from koji_rebuild.plan import BuildPlan
+from koji_rebuild.configuration import Configuration
+
+HEADER = {"upstream": "f40", "downstream": "f40-rebuild"}
+
+
+@pytest.fixture
+def priority(monkeypatch):
+    """Set the configured priority order, buildlist unless changed"""
+    settings = {"package_builds": {"priority": "buildlist"}}
+    monkeypatch.setattr(Configuration(), "_settings", settings, raising=False)
+
+    def set_priority(order: str):
+        settings["package_builds"]["priority"] = order
+
+    return set_priority
+
+
+def build(name: str, duration: float | None, requires: list | None = None) -> dict:
+    return {"name": name, "action": BuildPlan.BUILD, "duration": duration, "requires": requires or []}
+
+
+def plan(entries: list, hosts: int | None = 10, window: int = 10) -> BuildPlan:
+    return BuildPlan(HEADER, entries, hosts, window)
+
+
+def test_independent_builds_run_side_by_side(priority):
+    p = plan([build("a", 100), build("b", 300), build("c", 200)])
+    assert p.estimate() == 300
+
+
+def test_slots_are_limited_by_window_and_hosts(priority):
+    entries = [build("a", 100), build("b", 100), build("c", 100), build("d", 100)]
+    assert plan(entries, hosts=2, window=10).estimate() == 200
+    assert plan(entries, hosts=10, window=1).estimate() == 400
+
+
+def test_dependencies_are_built_in_turn(priority):
+    p = plan([build("a", 100), build("b", 50, ["a"]), build("c", 10, ["b"]), build("d", 30)])
+    assert p.estimate() == 160
+
+
+def test_duration_priority_starts_longest_first(priority):
+    entries = [build("a", 10), build("b", 10), build("c", 100)]
+    # In buildlist order c waits for a slot behind a
+    assert plan(entries, hosts=2).estimate() == 110
+    priority("duration")
+    assert plan(entries, hosts=2).estimate() == 100
+
+
+def test_builds_without_history_count_as_average(priority):
+    p = plan([build("a", 100), build("b", 300), build("c", None, ["b"])])
+    assert p.estimate() == 500
+
+
+def test_imports_and_skips_take_no_builder_time(priority):
+    p = plan(
+        [
+            build("a", 100),
+            {"name": "b", "action": BuildPlan.IMPORT, "requires": ["a"]},
+            {"name": "c", "action": BuildPlan.SKIP},
+            build("d", 50, ["b"]),
+        ]
+    )
+    assert p.estimate() == 150
+
+
+def test_nothing_to_build_takes_no_time(priority):
+    p = plan([{"name": "a", "action": BuildPlan.SKIP}, {"name": "b", "action": BuildPlan.UNAVAILABLE}])
+    assert p.estimate() == 0
+
+
+def test_unknown_without_build_history_or_hosts(priority):
+    assert plan([build("a", None)]).estimate() is None
+    assert plan([build("a", 100)], hosts=None).estimate() is None
+    assert plan([build("a", 100)], hosts=0).estimate() is None
@@ -0,0 +1,93 @@
+import os
+
+from koji_rebuild.rpmcache import RPMStore
+
+
+def rpm(tmp_path, name: str, size: int) -> str:
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_get_places_stored_file(tmp_path):
+    store = RPMStore(str(tmp_path / "store"), budget=100)
+    store.put("aa11", rpm(tmp_path, "a.rpm", 10), 10)
+
+    dest = str(tmp_path / "out.rpm")
+    assert store.get("aa11", dest)
+    assert os.path.getsize(dest) == 10
+    assert not store.get("bb22", dest)
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    store = RPMStore(str(tmp_path / "store"), budget=30)
+    for key in ("aa11", "bb22", "cc33"):
+        store.put(key, rpm(tmp_path, key + ".rpm", 10), 10)
+
+    # Reading aa11 makes bb22 the least recently used
+    assert store.get("aa11", str(tmp_path / "out.rpm"))
+    store.put("dd44", rpm(tmp_path, "dd44.rpm", 10), 10)
+
+    assert "bb22" not in store
+    assert list(store.entries) == ["cc33", "aa11", "dd44"]
+    assert store.size == 30
+    assert not os.path.exists(store._file("bb22"))
+
+
+def test_large_file_evicts_several(tmp_path):
+    store = RPMStore(str(tmp_path / "store"), budget=30)
+    for key in ("aa11", "bb22", "cc33"):
+        store.put(key, rpm(tmp_path, key + ".rpm", 10), 10)
+
+    store.put("dd44", rpm(tmp_path, "dd44.rpm", 25), 25)
+
+    assert list(store.entries) == ["dd44"]
+    assert store.size == 25
+
+
+def test_file_over_budget_is_not_stored(tmp_path):
+    store = RPMStore(str(tmp_path / "store"), budget=30)
+    store.put("aa11", rpm(tmp_path, "a.rpm", 10), 10)
+    store.put("bb22", rpm(tmp_path, "b.rpm", 31), 31)
+
+    assert "bb22" not in store
+    assert "aa11" in store
+
+
+def test_file_of_unexpected_size_is_not_stored(tmp_path):
+    store = RPMStore(str(tmp_path / "store"), budget=100)
+    store.put("aa11", rpm(tmp_path, "a.rpm", 6), 10)
+
+    assert "aa11" not in store
+    assert store.size == 0
+
+
+def test_zero_budget_stores_nothing(tmp_path):
+    store = RPMStore(str(tmp_path / "store"), budget=0)
+    store.put("aa11", rpm(tmp_path, "a.rpm", 10), 10)
+
+    assert "aa11" not in store
+
+
+def test_reopened_store_keeps_recency(tmp_path):
+    path = str(tmp_path / "store")
+    store = RPMStore(path, budget=100)
+    for n, key in enumerate(("aa11", "bb22", "cc33")):
+        store.put(key, rpm(tmp_path, key + ".rpm", 10), 10)
+        os.utime(store._file(key), (1000 + n, 1000 + n))
+    os.utime(store._file("aa11"), (2000, 2000))
+
+    store = RPMStore(path, budget=100)
+
+    assert list(store.entries) == ["bb22", "cc33", "aa11"]
+    assert store.size == 30
+
+
+def test_file_removed_behind_the_store_is_a_miss(tmp_path):
+    store = RPMStore(str(tmp_path / "store"), budget=100)
+    store.put("aa11", rpm(tmp_path, "a.rpm", 10), 10)
+    os.remove(store._file("aa11"))
+
+    assert not store.get("aa11", str(tmp_path / "out.rpm"))
+    assert "aa11" not in store
+    assert store.size == 0
@@ -0,0 +1,69 @@
+import sys
+
+from koji_rebuild.scheduler import DependencyGraph
+
+
+def graph(requires: dict) -> DependencyGraph:
+    g = DependencyGraph(list(requires))
+    for pkg, deps in requires.items():
+        g.requires[pkg] = set(deps)
+    return g
+
+
+def acyclic(g: DependencyGraph) -> bool:
+    return len(set(g._components().values())) == len(g.packages)
+
+
+def test_acyclic_graph_is_left_alone():
+    g = graph({"a": [], "b": ["a"], "c": ["a", "b"]})
+    assert g.break_cycles() == []
+    assert g.requires == {"a": set(), "b": {"a"}, "c": {"a", "b"}}
+
+
+def test_dependency_leading_out_of_a_cycle_is_kept():
+    # a, b and c need each other, a also needs x which needs nothing in the cycle
+    g = graph({"a": ["b", "x"], "b": ["c"], "c": ["a"], "x": []})
+    assert g.break_cycles() == [("a", ["b"])]
+    assert g.requires["a"] == {"x"}
+    assert g.layers() == [["x"], ["a"], ["c"], ["b"]]
+
+
+def test_cycle_waiting_on_another_cycle_is_broken_after_it():
+    # x and y form a cycle of their own that a, b and c wait on
+    g = graph({"a": ["b", "x"], "b": ["c"], "c": ["a"], "x": ["y"], "y": ["x"]})
+    assert g.break_cycles() == [("x", ["y"]), ("a", ["b"])]
+    assert g.requires["a"] == {"x"}
+    assert acyclic(g)
+
+
+def test_package_with_fewest_dependencies_in_the_cycle_is_picked():
+    g = graph({"a": ["b", "c"], "b": ["a", "c"], "c": ["a"]})
+    # Once c is built first, a and b still need each other
+    assert g.break_cycles() == [("c", ["a"]), ("a", ["b"])]
+    assert acyclic(g)
+
+
+def test_buildlist_order_breaks_ties():
+    g = graph({"b": ["a"], "a": ["b"]})
+    assert g.break_cycles() == [("b", ["a"])]
+
+
+def test_only_dependencies_within_the_component_are_dropped():
+    requires = {f"p{i}": [f"p{(i * 7 + k) % 40}" for k in (1, 3)] for i in range(40)}
+    requires.update({f"q{i}": [f"q{i + 1}", f"p{i}"] for i in range(9)}, q9=["q0"])
+    g = graph(requires)
+    comp = g._components()
+
+    broken = g.break_cycles()
+
+    assert broken
+    for pkg, dropped in broken:
+        assert all(comp[dep] == comp[pkg] for dep in dropped)
+    assert acyclic(g)
+
+
+def test_long_cycle_does_not_recurse():
+    n = sys.getrecursionlimit() * 2
+    g = graph({f"p{i}": [f"p{(i + 1) % n}"] for i in range(n)})
+    assert g.break_cycles() == [("p0", ["p1"])]
+    assert len(g.layers()) == n
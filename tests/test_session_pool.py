@@ -0,0 +1,202 @@
+import asyncio
+import threading
+
+import koji
+import pytest
+
+from koji_rebuild.session import SessionPool, AsyncKojiSession
+
+
+class FakeSession:
+    """Stands in for a koji.ClientSession, hands out subsessions like a hub"""
+
+    subsessions = 0
+    logged_out: list = list()
+
+    def __init__(self, baseurl, opts=None) -> None:
+        self.baseurl = baseurl
+        self.opts = opts or {}
+        self.logged_in = False
+        self.sinfo = None
+        self.authtype = None
+        self.threads = set()
+
+    def setSession(self, sinfo):
+        self.sinfo = sinfo
+        self.logged_in = sinfo is not None
+
+    def login(self):
+        self.setSession({"session-id": 1, "session-key": "primary"})
+        self.authtype = koji.AUTHTYPES["SSL"]
+
+    def callMethod(self, name, *args):
+        assert name == "subsession" and self.logged_in
+        FakeSession.subsessions += 1
+        return {"session-id": 100 + FakeSession.subsessions, "session-key": "sub"}
+
+    def logoutChild(self, session_id):
+        FakeSession.logged_out.append(session_id)
+
+    def hello(self, who):
+        self.threads.add(threading.current_thread().name)
+        return (self, who)
+
+
+@pytest.fixture(autouse=True)
+def hub():
+    FakeSession.subsessions = 0
+    FakeSession.logged_out = list()
+
+
+def test_anonymous_pool_sessions_copy_the_primary():
+    primary = FakeSession("http://hub/kojihub", {"timeout": 5})
+    pool = SessionPool(primary, size=2)  # type: ignore
+
+    session = pool.acquire()
+
+    assert session is not primary
+    assert type(session) is FakeSession
+    assert (session.baseurl, session.opts) == (primary.baseurl, primary.opts)
+    assert not session.logged_in
+    assert pool.name == "http://hub/kojihub"
+
+
+def test_logged_in_primary_shares_its_login_through_subsessions():
+    primary = FakeSession("http://hub/kojihub")
+    primary.login()
+    pool = SessionPool(primary, size=2)  # type: ignore
+
+    a, b = pool.acquire(), pool.acquire()
+
+    assert a.sinfo["session-id"] != b.sinfo["session-id"]
+    assert a.authtype == primary.authtype
+    assert FakeSession.subsessions == 2
+
+
+def test_released_sessions_are_reused():
+    pool = SessionPool(FakeSession("http://hub/kojihub"), size=4)  # type: ignore
+
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        pass
+
+    assert first is second
+    assert pool.count == 1
+
+
+def test_pool_waits_for_a_session_once_full():
+    pool = SessionPool(FakeSession("http://hub/kojihub"), size=1)  # type: ignore
+    held = pool.acquire()
+    got = list()
+
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+
+    pool.release(held)
+    waiter.join(5)
+    assert got == [held]
+    assert pool.count == 1
+
+
+def test_anonymous_sessions_are_dropped_once_the_primary_logs_in():
+    primary = FakeSession("http://hub/kojihub")
+    pool = SessionPool(primary, size=2)  # type: ignore
+    with pool.session() as anonymous:
+        pass
+
+    primary.login()
+    session = pool.acquire()
+
+    assert session is not anonymous
+    assert session.logged_in
+    assert pool.count == 1
+
+
+def test_failed_session_frees_its_slot():
+    primary = FakeSession("http://hub/kojihub")
+    primary.login()
+    pool = SessionPool(primary, size=1)  # type: ignore
+
+    def refuse(name, *args):
+        raise koji.GenericError("hub down")
+
+    primary.callMethod = refuse
+    with pytest.raises(koji.GenericError):
+        pool.acquire()
+    assert pool.count == 0
+
+    del primary.callMethod
+    assert pool.acquire().logged_in
+
+
+def test_close_expires_subsessions():
+    primary = FakeSession("http://hub/kojihub")
+    primary.login()
+    pool = SessionPool(primary, size=2)  # type: ignore
+    a, b = pool.acquire(), pool.acquire()
+    ids = sorted([a.sinfo["session-id"], b.sinfo["session-id"]])
+    pool.release(a)
+    pool.release(b)
+
+    pool.close()
+
+    assert sorted(FakeSession.logged_out) == ids
+    assert not a.logged_in and not b.logged_in
+    assert pool.count == 0 and pool.idle == []
+
+
+def test_run_swaps_the_primary_for_a_pool_session():
+    primary = FakeSession("http://hub/kojihub")
+    asession = AsyncKojiSession(primary, workers=2)  # type: ignore
+
+    session, who = asyncio.run(asession.run(FakeSession.hello, primary, "me"))
+
+    assert session is not primary
+    assert who == "me"
+    assert session in asession.pool.idle
+    asession.shutdown()
+
+
+def test_method_calls_run_on_pool_sessions_in_parallel():
+    primary = FakeSession("http://hub/kojihub")
+    asession = AsyncKojiSession(primary, workers=4)  # type: ignore
+    barrier = threading.Barrier(4, timeout=5)
+
+    def hello(self, who):
+        # Returns only once four calls are in flight together
+        barrier.wait()
+        return FakeSession.hello(self, who)
+
+    FakeSession.slow_hello = hello
+
+    async def calls():
+        return await asyncio.gather(*(asession.slow_hello(n) for n in range(4)))
+
+    try:
+        results = asyncio.run(calls())
+    finally:
+        del FakeSession.slow_hello
+        asession.shutdown()
+
+    assert sorted(who for _, who in results) == [0, 1, 2, 3]
+    assert len({id(session) for session, _ in results}) == 4
+    assert primary not in [session for session, _ in results]
+
+
+def test_calls_using_the_primary_otherwise_are_serialized():
+    primary = FakeSession("http://hub/kojihub")
+    asession = AsyncKojiSession(primary, workers=2)  # type: ignore
+
+    def uses_primary():
+        # Called without the session as an argument, so it holds the pool lock
+        assert asession.pool.lock.locked()
+        return primary.hello("closure")
+
+    session, _ = asyncio.run(asession.run(uses_primary))
+
+    assert session is primary
+    assert asession.pool.count == 0
+    asession.shutdown()
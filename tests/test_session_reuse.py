@@ -0,0 +1,197 @@
+import gc
+import json
+import tempfile
+
+import koji
+import keyring
+import keyring.backend
+import keyring.errors
+import pytest
+
+from koji_rebuild.configuration import Configuration
+from koji_rebuild.session import KojiSession
+
+SERVER = "https://hub.example.com/kojihub"
+
+
+class MemoryKeyring(keyring.backend.KeyringBackend):
+    priority = 1  # type: ignore
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.passwords: dict = dict()
+        self.error: Exception | None = None
+
+    def get_password(self, service, username):
+        if self.error is not None:
+            raise self.error
+        return self.passwords.get((service, username))
+
+    def set_password(self, service, username, password):
+        if self.error is not None:
+            raise self.error
+        self.passwords[(service, username)] = password
+
+    def delete_password(self, service, username):
+        self.passwords.pop((service, username), None)
+
+
+class Hub:
+    """Hub sessions with their last call number, as the hub checks them"""
+
+    def __init__(self) -> None:
+        self.sessions: dict = dict()
+        self.logins = 0
+
+    def login(self, session, cert=None, serverca=None, **kwargs):
+        self.logins += 1
+        self.sessions[self.logins] = -1
+        session.setSession({"session-id": self.logins, "session-key": f"key{self.logins}", "header-auth": True})
+        session.authtype = koji.AUTHTYPES["SSL"]
+        return True
+
+    def call(self, session, name, args, kwargs=None, retry=True):
+        sid = None
+        if session.sinfo is not None:
+            sid, callnum = session.sinfo["session-id"], session.callnum
+            session.callnum += 1
+            if sid not in self.sessions:
+                raise koji.AuthExpired(f"session {sid} expired")
+            if callnum <= self.sessions[sid]:
+                raise koji.SequenceError(f"callnum {callnum} <= {self.sessions[sid]}")
+            self.sessions[sid] = callnum
+        if name == "getLoggedInUser":
+            return {"id": 1, "name": "builder"} if sid else None
+        return "Hello"
+
+    def logout(self, session, session_id=None):
+        if session.logged_in:
+            self.sessions.pop(session.sinfo["session-id"], None)
+            session.setSession(None)
+
+
+@pytest.fixture
+def hub(tmp_path, monkeypatch):
+    conf = tmp_path / "koji.conf"
+    conf.write_text(f"[hub]\nserver = {SERVER}\nauthtype = ssl\ncert = client.pem\nserverca = ca.pem\n")
+    settings = {
+        "instance": {"downstream": {"kojiconf": str(conf)}},
+        "package_builds": {"reuse_sessions": True},
+    }
+    monkeypatch.setattr(Configuration(), "_settings", settings, raising=False)
+    # Locks on saved logins are taken in the temporary directory
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+    hub = Hub()
+    monkeypatch.setattr(koji.ClientSession, "ssl_login", lambda session, **kw: hub.login(session, **kw))
+    monkeypatch.setattr(koji.ClientSession, "_callMethod", lambda session, *a, **kw: hub.call(session, *a, **kw))
+    monkeypatch.setattr(koji.ClientSession, "logout", lambda session, *a: hub.logout(session, *a))
+    yield hub
+    # Sessions still around log out while the hub is in place
+    gc.collect()
+
+
+@pytest.fixture
+def backend():
+    previous = keyring.get_keyring()
+    backend = MemoryKeyring()
+    keyring.set_keyring(backend)
+    yield backend
+    keyring.set_keyring(previous)
+
+
+def end_run(session: KojiSession):
+    """What the end of a run does to its session: save the login and exit"""
+    session.save_session()
+    if session._saved_lock is not None:
+        session._saved_lock.close()
+
+
+def test_login_is_saved_and_reused(hub, backend):
+    first = KojiSession("downstream")
+    assert first.auth_login()
+    for _ in range(3):
+        first.hello()
+    end_run(first)
+    assert hub.logins == 1
+    assert len(backend.passwords) == 1
+
+    second = KojiSession("downstream")
+    assert second.auth_login()
+    # The hub accepts the calls of the reused login, numbered on from the last run
+    assert second.hello() == "Hello"
+    assert hub.logins == 1
+    assert second.user == {"id": 1, "name": "builder"}
+    assert second.authtype == koji.AUTHTYPES["SSL"]
+
+
+def test_saved_login_the_hub_dropped_is_replaced(hub, backend):
+    first = KojiSession("downstream")
+    first.auth_login()
+    end_run(first)
+    hub.sessions.clear()
+
+    second = KojiSession("downstream")
+    assert second.auth_login()
+
+    assert hub.logins == 2
+    assert second.sinfo["session-id"] == 2
+    # Saved in place of the expired one
+    end_run(second)
+    assert json.loads(next(iter(backend.passwords.values())))["session-id"] == 2
+
+
+def test_malformed_saved_login_is_ignored(hub, backend):
+    session = KojiSession("downstream")
+    session._setup_auth()
+    backend.passwords[("kojibuild", session._keyring_user())] = json.dumps({"session-id": 5})
+    del session
+
+    session = KojiSession("downstream")
+    assert session.auth_login()
+    assert hub.logins == 1
+    assert session.hello() == "Hello"
+
+
+def test_saved_login_in_use_by_another_run_is_left_alone(hub, backend):
+    first = KojiSession("downstream")
+    first.auth_login()
+    first.save_session()
+    saved = dict(backend.passwords)
+
+    # The first run still holds the lock on its login
+    second = KojiSession("downstream")
+    assert second.auth_login()
+
+    assert hub.logins == 2
+    assert not second.reuse
+    # Both runs go on without upsetting each other's call numbers
+    assert first.hello() == second.hello() == "Hello"
+    end_run(second)
+    assert backend.passwords == saved
+
+
+def test_login_is_free_again_once_its_run_ended(hub, backend):
+    first = KojiSession("downstream")
+    first.auth_login()
+    end_run(first)
+    second = KojiSession("downstream")
+    second.auth_login()
+    end_run(second)
+
+    third = KojiSession("downstream")
+    assert third.auth_login()
+    assert hub.logins == 1
+
+
+def test_unavailable_keyring_falls_back_to_a_login(hub, backend):
+    backend.error = keyring.errors.KeyringLocked("locked")
+
+    session = KojiSession("downstream")
+    assert session.auth_login()
+
+    assert hub.logins == 1
+    assert not session.reuse
+    # Nothing is saved, the login ends with the run
+    session.save_session()
+    assert not session.keep
@@ -0,0 +1,79 @@
+from koji_rebuild.tagdiff import TagDiff
+
+
+class Hub:
+    """Stands in for a KojiSession answering getLatestBuilds of one tag"""
+
+    def __init__(self, tag: str, nvrs: dict) -> None:
+        self.instance = {"tag": tag}
+        self.nvrs = nvrs
+        self.calls = 0
+
+    def getLatestBuilds(self, tag):
+        assert tag == self.instance["tag"]
+        self.calls += 1
+        return [{"package_name": pkg, "nvr": nvr} for pkg, nvr in self.nvrs.items()]
+
+
+def diff(up: dict, down: dict) -> TagDiff:
+    d = TagDiff(Hub("f40", up), Hub("f40-rebuild", down))  # type: ignore
+    d.load()
+    return d
+
+
+def test_missing_and_changed_packages_are_outdated():
+    d = diff(
+        {"foo": "foo-1-1", "bar": "bar-2-1", "baz": "baz-3-1"},
+        {"foo": "foo-1-1", "bar": "bar-1-1"},
+    )
+
+    assert d.outdated() == ["bar", "baz"]
+    assert d.missing == ["baz"]
+    assert d.changed == ["bar"]
+    assert d.current == ["foo"]
+
+
+def test_each_tag_is_fetched_once():
+    d = diff({"foo": "foo-1-1"}, {})
+    assert d.upstream.calls == 1
+    assert d.downstream.calls == 1
+
+
+def test_ignored_packages_are_left_out():
+    d = diff({"foo": "foo-2-1", "bar": "bar-1-1"}, {"foo": "foo-1-1"})
+
+    assert d.outdated(ignore=["foo"]) == ["bar"]
+    assert d.ignored == ["foo"]
+
+
+def test_packages_only_downstream_are_not_outdated():
+    d = diff({"foo": "foo-1-1"}, {"foo": "foo-1-1", "local": "local-1-1"})
+
+    assert d.outdated() == []
+    assert d.current == ["foo"]
+
+
+def test_newer_downstream_build_counts_as_changed():
+    # Only equality is checked, downstream is expected to match upstream
+    d = diff({"foo": "foo-1-1"}, {"foo": "foo-1-2"})
+
+    assert d.outdated() == ["foo"]
+
+
+def test_outdated_resets_previous_results():
+    d = diff({"foo": "foo-2-1", "bar": "bar-1-1"}, {"foo": "foo-1-1"})
+    d.outdated()
+
+    assert d.outdated(ignore=["foo", "bar"]) == []
+    assert d.missing == []
+    assert d.changed == []
+    assert d.ignored == ["bar", "foo"]
+
+
+def test_summary_lists_changed_nvrs():
+    d = diff({"foo": "foo-2-1", "bar": "bar-1-1"}, {"foo": "foo-1-1"})
+    d.outdated()
+
+    summary = d.summary()
+    assert "f40 -> f40-rebuild" in summary
+    assert "foo: foo-1-1 -> foo-2-1" in summary
@@ -0,0 +1,188 @@
+import asyncio
+import contextlib
+
+import koji
+import pytest
+
+from koji_rebuild.tasks import TaskPoller, TaskState, _PolledTask
+
+
+class Call:
+    def __init__(self, result) -> None:
+        self._result = result
+
+    @property
+    def result(self):
+        if isinstance(self._result, Exception):
+            raise self._result
+        return self._result
+
+
+class Multicall:
+    def __init__(self, hub) -> None:
+        self.hub = hub
+        self.ids: list = list()
+
+    def getTaskInfo(self, task_id):
+        self.ids.append(task_id)
+        state = self.hub.states[task_id]
+        if isinstance(state, list):
+            # Successive polls of the task
+            state = state.pop(0) if len(state) > 1 else state[0]
+        if isinstance(state, Exception):
+            return Call(state)
+        return Call({"id": task_id, "state": int(state), "method": "build"})
+
+
+class Hub:
+    """Answers getTaskInfo multicalls, recording the task ids of each"""
+
+    def __init__(self, states: dict) -> None:
+        self.states = states
+        self.batches: list = list()
+
+    @contextlib.contextmanager
+    def multicall(self, strict=False):
+        m = Multicall(self)
+        yield m
+        self.batches.append(sorted(m.ids))
+
+
+class AsyncHub:
+    """Stands in for AsyncKojiSession, runs calls inline"""
+
+    def __init__(self, hub: Hub) -> None:
+        self.session = hub
+        self.error: Exception | None = None
+
+    async def run(self, func, *args):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return func(*args)
+
+
+def poller(states: dict, **kwargs):
+    hub = Hub(states)
+    ahub = AsyncHub(hub)
+    kwargs = dict({"min_interval": 0.01, "max_interval": 0.02}, **kwargs)
+    return TaskPoller(ahub, **kwargs), hub, ahub  # type: ignore
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+def test_tasks_are_polled_in_one_multicall():
+    p, hub, _ = poller({1: TaskState.CLOSED, 2: TaskState.FAILED, 3: TaskState.CANCELLED})
+
+    async def watch():
+        return await asyncio.gather(p.watch(1), p.watch(2), p.watch(3))
+
+    assert run(watch()) == [TaskState.CLOSED, TaskState.FAILED, TaskState.CANCELLED]
+    assert hub.batches == [[1, 2, 3]]
+    assert p.tasks == {}
+
+
+def test_running_task_is_polled_until_it_finishes():
+    p, hub, _ = poller({1: [TaskState.FREE, TaskState.OPEN, TaskState.OPEN, TaskState.CLOSED]})
+
+    async def watch():
+        return await p.watch(1)
+
+    assert run(watch()) == TaskState.CLOSED
+    assert hub.batches == [[1]] * 4
+
+
+def test_watching_a_task_twice_shares_the_future():
+    p, hub, _ = poller({1: [TaskState.OPEN, TaskState.CLOSED]})
+
+    async def watch():
+        first, second = p.watch(1), p.watch(1)
+        assert first is second
+        return await first
+
+    assert run(watch()) == TaskState.CLOSED
+
+
+def test_failed_lookup_of_one_task_keeps_it_watched():
+    p, hub, _ = poller(
+        {1: [koji.GenericError("no such task"), TaskState.CLOSED], 2: TaskState.CLOSED}
+    )
+
+    async def watch():
+        return await asyncio.gather(p.watch(1), p.watch(2))
+
+    assert run(watch()) == [TaskState.CLOSED, TaskState.CLOSED]
+    assert hub.batches == [[1, 2], [1]]
+
+
+def test_failed_multicall_is_retried():
+    p, hub, ahub = poller({1: TaskState.CLOSED})
+    ahub.error = koji.GenericError("hub unavailable")
+
+    async def watch():
+        return await p.watch(1)
+
+    assert run(watch()) == TaskState.CLOSED
+    assert hub.batches == [[1]]
+
+
+def test_unexpected_error_fails_the_watchers():
+    p, hub, ahub = poller({1: TaskState.OPEN, 2: TaskState.OPEN})
+    ahub.error = ValueError("malformed response")
+
+    async def watch():
+        return await asyncio.gather(p.watch(1), p.watch(2), return_exceptions=True)
+
+    results = run(watch())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert p.tasks == {}
+
+
+def test_poller_restarts_after_an_error():
+    p, hub, ahub = poller({1: TaskState.OPEN, 2: TaskState.CLOSED})
+    ahub.error = ValueError("malformed response")
+
+    async def watch():
+        with pytest.raises(ValueError):
+            await p.watch(1)
+        return await p.watch(2)
+
+    assert run(watch()) == TaskState.CLOSED
+
+
+def test_abandoned_watch_is_forgotten():
+    p, hub, _ = poller({1: TaskState.OPEN, 2: [TaskState.OPEN, TaskState.OPEN, TaskState.CLOSED]})
+
+    async def watch():
+        p.watch(1).cancel()
+        return await p.watch(2)
+
+    assert run(watch()) == TaskState.CLOSED
+    assert all(batch == [2] for batch in hub.batches[1:])
+
+
+@pytest.mark.parametrize(
+    "expected, elapsed, interval",
+    [
+        # Far from the expected finish, half the remaining time
+        (1000, 0, 500),
+        (1000, 800, 100),
+        # Close to it, no faster than the minimum
+        (1000, 990, 10),
+        # Overdue, backing off by a quarter of the overrun
+        (1000, 1200, 50),
+        (1000, 2000, 250),
+        # Capped at the maximum
+        (10000, 0, 600),
+        # Without an expected duration, a tenth of the time it has run
+        (None, 0, 10),
+        (None, 3000, 300),
+    ],
+)
+def test_interval_adapts_to_the_expected_finish(expected, elapsed, interval):
+    p, _, _ = poller({}, min_interval=10, max_interval=600)
+    task = _PolledTask(1, None, expected)  # type: ignore
+
+    assert p._interval(task, task.start + elapsed) == pytest.approx(interval)